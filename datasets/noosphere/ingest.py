@@ -23,6 +23,13 @@ try:
 except Exception:
     HAS_JSONSCHEMA = False
 
+# Preferred: schemas compiled once per process (needs the repo root on sys.path)
+try:
+    from services.validation import ValidationError, validator_for_file
+    HAS_VALIDATION = True
+except Exception:
+    HAS_VALIDATION = False
+
 
 # ---------- Helpers
 def sha256_file(fp: Path, bufsize: int = 1024 * 1024) -> str:
@@ -231,7 +238,16 @@ def load_and_hash_normalization(rules_path: Optional[Path]) -> Dict[str, Any]:
 
 # ---------- Manifest writer
 def write_manifest(manifest: Dict[str, Any], out_fp: Path, schema_fp: Optional[Path] = None) -> None:
-    if schema_fp and HAS_JSONSCHEMA and schema_fp.exists():
+    if schema_fp and HAS_VALIDATION and schema_fp.exists():
+        try:
+            validator_for_file(schema_fp.resolve())(manifest)
+        except ValidationError as e:
+            if not HAS_JSONSCHEMA:
+                raise
+            # Callers catch jsonschema's error, as they did before validation was compiled
+            from jsonschema import ValidationError as SchemaValidationError
+            raise SchemaValidationError(e.message, path=list(e.path)) from e
+    elif schema_fp and HAS_JSONSCHEMA and schema_fp.exists():
         from jsonschema import validate
         schema = json.loads(schema_fp.read_text())
         validate(manifest, schema)  # raise on error
@@ -0,0 +1,30 @@
+-- Persistent Merkle tree behind incremental anchoring (services/audit/anchor_write.py)
+
+-- Leaf count and the snapshot time the tree reflects, per tree version
+CREATE TABLE audit_merkle_state (
+    tree_version TEXT PRIMARY KEY,
+    leaf_count BIGINT NOT NULL,
+    synced_at TIMESTAMPTZ NOT NULL
+);
+
+-- Node hashes by level and position; level 0 = sha256(canonical row)
+CREATE TABLE audit_merkle_nodes (
+    tree_version TEXT NOT NULL,
+    level SMALLINT NOT NULL,
+    pos BIGINT NOT NULL,
+    hash BYTEA NOT NULL, -- 32B SHA-256
+    PRIMARY KEY (tree_version, level, pos)
+);
+
+-- Leaf position of each leaderboard row (rows are ordered by tenant_id, player_id)
+CREATE TABLE audit_merkle_leaves (
+    tree_version TEXT NOT NULL,
+    tenant_id TEXT NOT NULL,
+    player_id TEXT NOT NULL,
+    pos BIGINT NOT NULL,
+    PRIMARY KEY (tree_version, tenant_id, player_id)
+);
+CREATE INDEX ON audit_merkle_leaves (tree_version, pos);
+
+-- Changed-row scans ("updated_at > last sync") need this on the source table
+CREATE INDEX IF NOT EXISTS leaderboard_entries_updated_at ON leaderboard_entries (updated_at);
@@ -0,0 +1,21 @@
+-- UCAPI model routes, hot-reloaded by every gateway pod (services/ucapi/registry.py)
+CREATE TABLE IF NOT EXISTS ucapi_model_registry (
+    alias STRING PRIMARY KEY, -- client-facing model alias, e.g. 'sonnet-latest'
+    adapter STRING NOT NULL, -- key into services.ucapi.router.ADAPTERS
+    provider_model STRING NOT NULL,
+    context_window INT8, -- prompt+completion tokens; NULL disables trimming
+    fallback STRING, -- alias to downgrade to when this route cannot meet a deadline; NULL sheds instead
+    enabled BOOL NOT NULL DEFAULT true, -- soft delete so removals bump the revision
+    revision INT8 NOT NULL DEFAULT unique_rowid(), -- set to unique_rowid() on every change
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Tables created before fallback routing
+ALTER TABLE ucapi_model_registry ADD COLUMN IF NOT EXISTS fallback STRING;
+
+-- Pollers only read max(revision) until something changes
+CREATE INDEX IF NOT EXISTS ucapi_model_registry_revision_idx ON ucapi_model_registry (revision DESC);
+
+-- Example route change:
+-- UPSERT INTO ucapi_model_registry (alias, adapter, provider_model, context_window, fallback, revision, updated_at)
+-- VALUES ('sonnet-latest', 'anthropic', 'claude-3-5-sonnet-20240620', 200000, 'gpt-4o-mini', unique_rowid(), now());
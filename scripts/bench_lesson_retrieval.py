@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Indexing throughput and query latency of the lesson BM25 passage index.
+
+Usage: PYTHONPATH=. python scripts/bench_lesson_retrieval.py --docs 2000 --lines 200 --queries 500
+"""
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from services.lesson.retrieval import PassageIndex
+
+
+def run(n_docs: int, n_lines: int, n_queries: int) -> dict:
+    rng = random.Random(7)
+    vocab = [f"w{i}" for i in range(20000)]
+    docs = {f"doc{d}": "\n".join(" ".join(rng.choices(vocab, k=12)) for _ in range(n_lines)) for d in range(n_docs)}
+    queries = [" ".join(rng.choices(vocab, k=4)) for _ in range(n_queries)]
+
+    with tempfile.TemporaryDirectory() as root:
+        index = PassageIndex(Path(root))
+        start = time.perf_counter()
+        for name, text in docs.items():
+            index.add(name, text)
+        index.commit()
+        indexed = time.perf_counter() - start
+        index.close()
+
+        start = time.perf_counter()
+        index = PassageIndex(Path(root))
+        opened = time.perf_counter() - start
+        latencies = []
+        for q in queries:
+            t = time.perf_counter()
+            index.search(q, k=5)
+            latencies.append(1000 * (time.perf_counter() - t))
+        stats = index.snapshot()
+        index.close()
+
+    latencies.sort()
+    return {
+        "passages": stats["passages"],
+        "segments": stats["segments"],
+        "index_passages_per_s": stats["passages"] / indexed,
+        "open_ms": 1000 * opened,
+        "query_p50_ms": statistics.median(latencies),
+        "query_p99_ms": latencies[int(0.99 * (len(latencies) - 1))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(run(args.docs, args.lines, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
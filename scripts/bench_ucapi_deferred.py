@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Throughput of UCAPI's offline batch path against the local stand-in batch server.
+
+Usage: PYTHONPATH=. python scripts/bench_ucapi_deferred.py --requests 20000 --batch-size 5000 --latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from services.ucapi.offline import DeferredQueue, LocalBatchServer
+
+
+async def run(n_requests: int, batch_size: int, latency: float) -> dict:
+    server = LocalBatchServer(latency=latency)
+    queue = DeferredQueue(backend_for=lambda name: server, max_requests=batch_size, flush_seconds=0.05, poll_seconds=0.05)
+    start = time.perf_counter()
+    for i in range(n_requests):
+        queue.enqueue("openai", "spiffe://bench", "bench", "gpt-4o-mini", {
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": f"label item {i}: " + "lorem ipsum " * 20}],
+            "max_tokens": 16,
+        })
+    enqueued = time.perf_counter() - start
+    await queue.drain()
+    elapsed = time.perf_counter() - start
+    stats = queue.snapshot()
+    return {
+        "requests": n_requests,
+        "batches": stats["batches"],
+        "avg_batch_size": stats["avg_batch_size"],
+        "mb_uploaded": server.stats["bytes"] / 2**20,
+        "enqueue_us_per_request": 1e6 * enqueued / n_requests,
+        "requests_per_second": n_requests / elapsed,
+        "avg_turnaround_s": stats["avg_turnaround_s"],
+        "failed": stats["failed"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds the stand-in server takes per batch")
+    args = parser.parse_args()
+
+    r = asyncio.run(run(args.requests, args.batch_size, args.latency))
+    print(f"{r['requests']} requests in {r['batches']} batches: {r['requests_per_second']:.0f} req/s, "
+          f"enqueue {r['enqueue_us_per_request']:.1f} us/request, turnaround {r['avg_turnaround_s']:.2f} s")
+    print(json.dumps(r))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Allocation profile of UCAPI request handling: repeated model_dump vs. one NormalizedRequest.
+
+Usage: PYTHONPATH=. python scripts/bench_ucapi_request.py --messages 200 --tools 20 --rounds 50
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from services.ucapi.schemas import ChatRequest
+from services.ucapi.normalized import normalize
+
+
+def build_request(n_messages: int, n_tools: int) -> ChatRequest:
+    messages = [{"role": "system", "content": "You are a careful assistant."}]
+    for i in range(n_messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"turn {i}: " + "lorem ipsum dolor sit amet " * 20})
+    tools = [
+        {
+            "type": "function",
+            "name": f"tool_{i}",
+            "description": "Looks something up. " * 10,
+            "parameters": {
+                "type": "object",
+                "properties": {f"field_{j}": {"type": "string", "description": "x" * 40} for j in range(30)},
+                "required": [f"field_{j}" for j in range(5)],
+            },
+        }
+        for i in range(n_tools)
+    ]
+    return ChatRequest(model="gpt-4o-mini", messages=messages, tools=tools, max_tokens=500)
+
+
+def legacy_path(body: ChatRequest) -> None:
+    """What gateway.chat did before: dump for budget, again for adapter, build audit dict."""
+    budget_params = body.model_dump()
+    messages = [msg.model_dump() for msg in body.messages]
+    tools = [tool.model_dump() for tool in body.tools] if body.tools else None
+    json.dumps({"model": body.model, "messages": messages, "tools": tools})  # adapter payload
+    json.dumps({"job_id": "bench", "model": body.model, "request": budget_params})  # audit
+
+
+def normalized_path(body: ChatRequest) -> None:
+    nreq = normalize(body)
+    _ = nreq.budget_params
+    json.dumps({"model": nreq.model, "messages": nreq.messages, "tools": nreq.tools})  # adapter payload
+    json.dumps({"job_id": nreq.job_id, "model": nreq.model, "request_hash": nreq.content_hash})  # audit
+
+
+def profile(fn, body: ChatRequest, rounds: int) -> dict:
+    fn(body)  # warm caches (token counts, imports)
+    peaks = []
+    tracemalloc.start()
+    for _ in range(rounds):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn(body)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(body)
+    elapsed = time.perf_counter() - start
+    return {"ms_per_request": 1000 * elapsed / rounds, "peak_kib_per_request": sum(peaks) / len(peaks) / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--tools", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    body = build_request(args.messages, args.tools)
+    results = {
+        "legacy": profile(legacy_path, body, args.rounds),
+        "normalized": profile(normalized_path, body, args.rounds),
+    }
+    for name, r in results.items():
+        print(f"{name:>10}: {r['ms_per_request']:.2f} ms/request, peak {r['peak_kib_per_request']:.0f} KiB/request")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 import os, json, psycopg, base64, datetime as dt
 from jwcrypto import jwk, jws
 from services.audit.merkle import merkle_root
+from services.audit.merkle_tree import IncrementalMerkleTree
 from services.audit.canonical import canonical_row
 
 DB_URL = os.getenv("DB_URL") # read-only or anchoring DB
 JWK_ED25519 = os.getenv("ANCHOR_JWK_ED25519_JSON") # {"kty":"OKP","crv":"Ed25519","d":"...","x":"..."}
 TREE_VERSION = os.getenv("TREE_VERSION", "v1")
+ANCHOR_MODE = os.getenv("ANCHOR_MODE", "incremental") # "full" rehashes every row, as before
+# Re-read rows updated this long before the last sync, in case their transactions committed late
+OVERLAP = dt.timedelta(seconds=int(os.getenv("ANCHOR_OVERLAP_SECONDS", "300")))
+ROW_COLUMNS = "tenant_id, player_id, elo_rating, rank, match_count, updated_at"
 
 def sign_jws(payload: dict, jwk_json: str) -> str:
     key = jwk.JWK.from_json(jwk_json)
@@ -23,6 +28,96 @@ def compute_root(conn) -> tuple[bytes, int]:
     leaves = [canonical_row(dict(r)) for r in rows]
     return merkle_root(leaves), len(leaves)
 
+class PgNodeStore:
+    """ Node hashes in audit_merkle_nodes, keyed by (tree_version, level, pos); see db/ddl_merkle_incremental.sql """
+    def __init__(self, cur, tree_version: str):
+        self.cur, self.tv = cur, tree_version
+
+    def get_nodes(self, keys) -> dict:
+        keys = list(keys)
+        if not keys:
+            return {}
+        rows = self.cur.execute("""
+            SELECT level, pos, hash FROM audit_merkle_nodes
+            WHERE tree_version=%s AND (level, pos) IN (SELECT * FROM unnest(%s::smallint[], %s::bigint[]))
+        """, (self.tv, [k[0] for k in keys], [k[1] for k in keys]))
+        return {(r["level"], r["pos"]): bytes(r["hash"]) for r in rows}
+
+    def put_nodes(self, items: dict) -> None:
+        self.cur.executemany("""
+            INSERT INTO audit_merkle_nodes (tree_version, level, pos, hash) VALUES (%s, %s, %s, %s)
+            ON CONFLICT (tree_version, level, pos) DO UPDATE SET hash = EXCLUDED.hash
+        """, [(self.tv, level, pos, psycopg.Binary(h)) for (level, pos), h in items.items()])
+
+    def clear(self) -> None:
+        self.cur.execute("DELETE FROM audit_merkle_nodes WHERE tree_version=%s", (self.tv,))
+
+def _key(r) -> tuple[str, str]:
+    return str(r["tenant_id"]), str(r["player_id"])
+
+def _index_leaves(cur, rows, start: int) -> None:
+    """ Rewrites the (tenant, player) -> leaf position index from position `start` on. """
+    cur.execute("DELETE FROM audit_merkle_leaves WHERE tree_version=%s AND pos >= %s", (TREE_VERSION, start))
+    cur.executemany(
+        "INSERT INTO audit_merkle_leaves (tree_version, tenant_id, player_id, pos) VALUES (%s, %s, %s, %s)",
+        [(TREE_VERSION, *_key(r), start + i) for i, r in enumerate(rows)],
+    )
+
+def _rebuild(cur, tree: IncrementalMerkleTree) -> bytes:
+    rows = cur.execute(f"SELECT {ROW_COLUMNS} FROM leaderboard_entries ORDER BY tenant_id, player_id").fetchall()
+    _index_leaves(cur, rows, 0)
+    return tree.build([canonical_row(dict(r)) for r in rows])
+
+def compute_root_incremental(conn) -> tuple[bytes, int]:
+    """ Same root as compute_root, rehashing only rows whose updated_at moved since the last sync.
+    Updates rehash one leaf-to-root path each. Inserts shift every later leaf, so the rows from
+    the first new key onwards are rewritten. Deletions (caught by a row-count mismatch) and a
+    missing or fresh tree fall back to a full rebuild.
+    """
+    conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    synced_now = conn.execute("SELECT now() AS now").fetchone()["now"]
+    state = conn.execute(
+        "SELECT leaf_count, synced_at FROM audit_merkle_state WHERE tree_version=%s FOR UPDATE", (TREE_VERSION,)
+    ).fetchone()
+    tree = IncrementalMerkleTree(PgNodeStore(conn, TREE_VERSION), state["leaf_count"] if state else 0)
+    total = conn.execute("SELECT count(*) AS n FROM leaderboard_entries").fetchone()["n"]
+
+    if state is None:
+        root = _rebuild(conn, tree)
+    else:
+        changed = conn.execute(f"""
+            SELECT {ROW_COLUMNS} FROM leaderboard_entries WHERE updated_at > %s ORDER BY tenant_id, player_id
+        """, (state["synced_at"] - OVERLAP,)).fetchall()
+        positions = {}
+        if changed:
+            rows = conn.execute("""
+                SELECT tenant_id, player_id, pos FROM audit_merkle_leaves
+                WHERE tree_version=%s AND (tenant_id, player_id) IN (SELECT * FROM unnest(%s::text[], %s::text[]))
+            """, (TREE_VERSION, [_key(r)[0] for r in changed], [_key(r)[1] for r in changed]))
+            positions = {(r["tenant_id"], r["player_id"]): r["pos"] for r in rows}
+        inserted = [r for r in changed if _key(r) not in positions]
+        if total != tree.size + len(inserted):
+            root = _rebuild(conn, tree) # rows were deleted
+        else:
+            changes = {positions[_key(r)]: canonical_row(dict(r)) for r in changed if _key(r) in positions}
+            if inserted:
+                # `changed` is in leaf order, so inserted[0] is the lowest new key
+                suffix = conn.execute(f"""
+                    SELECT {ROW_COLUMNS} FROM leaderboard_entries
+                    WHERE (tenant_id, player_id) >= (%s, %s) ORDER BY tenant_id, player_id
+                """, (inserted[0]["tenant_id"], inserted[0]["player_id"])).fetchall()
+                start = total - len(suffix)
+                _index_leaves(conn, suffix, start)
+                changes = {pos: leaf for pos, leaf in changes.items() if pos < start}
+                changes.update({start + i: canonical_row(dict(r)) for i, r in enumerate(suffix)})
+            root = tree.apply(changes, total)
+
+    conn.execute("""
+        INSERT INTO audit_merkle_state (tree_version, leaf_count, synced_at) VALUES (%s, %s, %s)
+        ON CONFLICT (tree_version) DO UPDATE SET leaf_count = EXCLUDED.leaf_count, synced_at = EXCLUDED.synced_at
+    """, (TREE_VERSION, tree.size, synced_now))
+    return root, tree.size
+
 def get_prev_root(conn) -> bytes | None:
     row = conn.execute("SELECT merkle_root FROM audit_anchor WHERE tree_version=%s ORDER BY seq DESC LIMIT 1", (TREE_VERSION,)).fetchone()
     return None if not row else bytes(row[0])
@@ -31,7 +126,7 @@ def main():
     now = dt.datetime.now(dt.timezone.utc)
     with psycopg.connect(DB_URL, autocommit=False) as conn:
         with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            root, count = compute_root(cur)
+            root, count = compute_root(cur) if ANCHOR_MODE == "full" else compute_root_incremental(cur)
             prev = get_prev_root(cur)
             payload = {
                 "tv": TREE_VERSION,
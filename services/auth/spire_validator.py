@@ -1,38 +1,119 @@
-import time, requests, jwt
+import asyncio, os, time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import httpx, jwt
 from jwt.algorithms import RSAAlgorithm
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer
 
 security = HTTPBearer()
 
+BUNDLE_URL = os.getenv("SPIRE_BUNDLE_URL", "http://spire-server:8081/bundle")
+AUDIENCE = os.getenv("SPIRE_AUDIENCE", "dreamaware-video-gen")
+
 class SPIREValidator:
-    def __init__(self, bundle_url="http://spire-server:8081/bundle", aud="dreamaware-video-gen"):
+    """Verifies JWT-SVIDs against the SPIRE trust bundle.
+
+    The bundle is parsed once per refresh into a kid -> public key index and
+    verified tokens are remembered until their ``exp``, so the hot path for a
+    repeat caller is a dict lookup. Stale bundles keep serving while a
+    background task refreshes them.
+    """
+
+    def __init__(self, bundle_url=BUNDLE_URL, aud=AUDIENCE, refresh_interval=300.0,
+                 token_cache_size=4096, unknown_kid_cooldown=10.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
         self.bundle_url = bundle_url
         self.aud = aud
-        self._jwks = None
-        self._ts = 0
+        self.refresh_interval = refresh_interval
+        self.token_cache_size = token_cache_size
+        self.unknown_kid_cooldown = unknown_kid_cooldown
+        self._transport = transport # lets tests mount tests/mock_jwks_server.py
+        self._keys: dict[str, tuple[Any, str]] = {} # kid -> (parsed public key, alg)
+        self._ts = 0.0
+        self._tokens: "OrderedDict[str, tuple[dict, float, str]]" = OrderedDict() # token -> (payload, exp, kid)
+        self._inflight: Optional[asyncio.Future] = None
+        self.stats = {"token_hits": 0, "token_misses": 0, "refreshes": 0, "refresh_errors": 0}
 
-    def _jwks(self):
-        if not self._jwks or time.time() - self._ts > 300:
-            r = requests.get(self.bundle_url, timeout=3)
+    async def refresh(self) -> None:
+        """Fetches the bundle and swaps in a freshly parsed key index."""
+        async with httpx.AsyncClient(timeout=3, transport=self._transport) as client:
+            r = await client.get(self.bundle_url)
             r.raise_for_status() # SPIRE serves JWKS as {"keys": [...]}
-            self._jwks = r.json()["keys"]
-            self._ts = time.time()
-        return self._jwks
+            keys = {}
+            for k in r.json()["keys"]:
+                if k.get("kid"):
+                    keys[k["kid"]] = (RSAAlgorithm.from_jwk(k), k.get("alg", "RS256"))
+        retired = self._keys.keys() - keys.keys()
+        self._keys = keys
+        self._ts = time.time()
+        self.stats["refreshes"] += 1
+        if retired: # tokens signed by rotated-out keys must be re-verified
+            for tok in [t for t, (_, _, kid) in self._tokens.items() if kid in retired]:
+                del self._tokens[tok]
+
+    def _schedule_refresh(self) -> asyncio.Future:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self.refresh())
+            self._inflight.add_done_callback(self._refresh_done)
+        return self._inflight
 
-    def verify_svid(self, token: str) -> dict:
+    def _refresh_done(self, fut: asyncio.Future) -> None:
+        if not fut.cancelled() and fut.exception() is not None:
+            self.stats["refresh_errors"] += 1
+
+    async def _ensure_keys(self) -> None:
+        if not self._keys:
+            await asyncio.shield(self._schedule_refresh())
+        elif time.time() - self._ts > self.refresh_interval:
+            self._schedule_refresh() # serve the stale bundle meanwhile
+
+    def _remember(self, token: str, payload: dict, kid: str) -> None:
+        exp = payload.get("exp")
+        if exp is None or self.token_cache_size <= 0:
+            return
+        self._tokens[token] = (dict(payload), float(exp), kid)
+        self._tokens.move_to_end(token)
+        while len(self._tokens) > self.token_cache_size:
+            self._tokens.popitem(last=False)
+
+    async def verify_svid(self, token: str) -> dict:
+        cached = self._tokens.get(token)
+        if cached is not None:
+            payload, exp, _ = cached
+            if time.time() < exp:
+                self._tokens.move_to_end(token)
+                self.stats["token_hits"] += 1
+                return dict(payload) # callers may mutate their claims; the cached entry stays intact
+            del self._tokens[token]
+        self.stats["token_misses"] += 1
         try:
-            headers = jwt.get_unverified_header(token)
-            kid = headers.get("kid")
-            key = next((k for k in self._jwks() if k.get("kid") == kid), None)
-            if not key:
+            await self._ensure_keys()
+            kid = jwt.get_unverified_header(token).get("kid")
+            entry = self._keys.get(kid)
+            if entry is None and time.time() - self._ts > self.unknown_kid_cooldown:
+                await asyncio.shield(self._schedule_refresh()) # key may have just rotated in
+                entry = self._keys.get(kid)
+            if entry is None:
                 raise HTTPException(status_code=401, detail="Unknown SVID key id")
-            pub = RSAAlgorithm.from_jwk(key)
-            payload = jwt.decode(token, pub, algorithms=[key.get("alg","RS256")], audience=self.aud)
-            return payload
+            pub, alg = entry
+            payload = jwt.decode(token, pub, algorithms=[alg], audience=self.aud)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=401, detail=f"Invalid SVID: {e}")
+        self._remember(token, payload, kid)
+        return payload
+
+_validator: Optional[SPIREValidator] = None
+
+def get_validator() -> SPIREValidator:
+    """Returns the process-wide validator so its caches survive across requests."""
+    global _validator
+    if _validator is None:
+        _validator = SPIREValidator()
+    return _validator
 
-def verify_spiffe_identity(credentials=Depends(security)):
-    v = SPIREValidator()
-    return v.verify_svid(credentials.credentials)
+async def verify_spiffe_identity(credentials=Depends(security)):
+    return await get_validator().verify_svid(credentials.credentials)
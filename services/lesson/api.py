@@ -1,17 +1,40 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
+import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from .cache import CACHE_MAX_AGE, LessonResponseCache, etag_matches
+from .generation import GENERATOR_VERSION, GenerationCache, source_key
+from .logwriter import GroupCommitLog
+from .retrieval import PassageIndex
+from .review import Review, scheduler_from_env
+from .stats import StatsIndex, read_answers
+from .storage import store_from_env
+
 # --- Configuration ---
 LESSONS_DIR = Path("lessons")
 LESSONS_DIR.mkdir(exist_ok=True)
+STORE = store_from_env(LESSONS_DIR)
+LESSON_CACHE = LessonResponseCache()
+LOG = GroupCommitLog()
+GENERATION_CACHE = GenerationCache(LESSONS_DIR / "generation_cache")
+SOURCE_INDEX = PassageIndex(LESSONS_DIR / "source_index")
+REVIEWS = scheduler_from_env(LESSONS_DIR)
+STATS = StatsIndex()
+BULK_MAX = 1000
+
+logger = logging.getLogger(__name__)
 
 # --- Pydantic Models ---
 
@@ -38,6 +61,7 @@ class AnswerSubmission(BaseModel):
     user_choice: int
     free_text: str | None = None
     metrics: Dict[str, Any] | None = None
+    learner_id: str | None = None  # set to schedule the step for spaced review
 
 class GradedResult(BaseModel):
     ok: bool
@@ -46,6 +70,23 @@ class GradedResult(BaseModel):
     explain: str
     safety: Dict[str, Any]
 
+class BulkLessons(BaseModel):
+    sources: List[LessonSource] = Field(min_length=1, max_length=BULK_MAX)
+
+class BatchAnswer(AnswerSubmission):
+    lesson_id: str
+
+class AnswerBatch(BaseModel):
+    answers: List[BatchAnswer] = Field(min_length=1, max_length=BULK_MAX)
+
+class BatchItemError(BaseModel):
+    status: int
+    detail: str
+
+class BatchAnswerResult(BaseModel):
+    result: GradedResult | None = None
+    error: BatchItemError | None = None
+
 class Feedback(BaseModel):
     step_id: str
     label: str
@@ -53,26 +94,125 @@ class Feedback(BaseModel):
 
 
 # --- FastAPI App ---
-app = FastAPI(title="Lesson API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Commits pending index passages once they are due, and on shutdown drains
+    queued answer/feedback records and commits whatever passages remain.
+    """
+    committer = asyncio.create_task(commit_index_periodically())
+    try:
+        yield
+    finally:
+        committer.cancel()
+        await asyncio.to_thread(LOG.flush)
+        await asyncio.to_thread(SOURCE_INDEX.commit)
+
+async def commit_index_periodically() -> None:
+    while True:
+        await asyncio.sleep(SOURCE_INDEX.commit_seconds)
+        try:
+            await asyncio.to_thread(SOURCE_INDEX.commit_if_due)
+        except Exception:
+            logger.exception("Source index commit failed")
+
+
+app = FastAPI(title="Lesson API", lifespan=lifespan)
 
 
 # --- Helper Functions ---
-def save_lesson(lesson: Lesson):
-    lesson_dir = LESSONS_DIR / lesson.id
-    lesson_dir.mkdir(exist_ok=True)
-    (lesson_dir / "lesson.json").write_text(lesson.model_dump_json(indent=2))
-
-def save_step(step: Step):
-    lesson_dir = LESSONS_DIR / step.lesson_id
-    steps_dir = lesson_dir / "steps"
-    steps_dir.mkdir(exist_ok=True)
-    (steps_dir / f"{step.id}.json").write_text(step.model_dump_json(indent=2))
-
-def get_lesson_dir(lesson_id: str) -> Path:
-    lesson_dir = LESSONS_DIR / lesson_id
-    if not lesson_dir.exists():
+async def require_lesson(lesson_id: str) -> Dict[str, Any]:
+    lesson = await STORE.lesson(lesson_id)
+    if lesson is None:
         raise HTTPException(status_code=404, detail="Lesson not found")
-    return lesson_dir
+    return lesson
+
+def answers_log(lesson_id: str) -> Path:
+    return LESSONS_DIR / lesson_id / "answers.log.jsonl"
+
+def feedback_log(lesson_id: str) -> Path:
+    # Sharded per lesson; moderators read moderation_queue/*.log*.jsonl
+    return LESSONS_DIR / "moderation_queue" / f"{lesson_id}.log.jsonl"
+
+async def load_stats(lesson_id: str) -> None:
+    """Replays a lesson's answer log into ``STATS`` the first time it is touched."""
+    if lesson_id in STATS:
+        return
+    def replay():
+        LOG.flush()  # everything queued for this lesson must be on disk before the replay
+        return read_answers(answers_log(lesson_id))
+    await asyncio.to_thread(STATS.ensure, lesson_id, replay)
+
+def grade(step_data: Dict[str, Any], submission: AnswerSubmission) -> GradedResult:
+    # Mock grading logic
+    correct_answer = step_data.get("payload", {}).get("answer")
+    is_correct = submission.user_choice == correct_answer
+
+    return GradedResult(
+        ok=is_correct,
+        correct_choice=correct_answer,
+        score=1.0 if is_correct else 0.0,
+        explain=f"The correct answer was option {correct_answer}.",
+        safety={"opa_deny": 0}
+    )
+
+def record_answer(lesson_id: str, submission: Dict[str, Any], result: GradedResult) -> Review | None:
+    """
+    Appends a graded answer to the lesson's log and its stats; call ``load_stats`` first.
+
+    Returns the review to schedule when the answer names a learner.
+    """
+    log_entry = {
+        "submission": submission,
+        "result": result.model_dump()
+    }
+    LOG.append(answers_log(lesson_id), log_entry)
+    STATS.record(lesson_id, log_entry["submission"], log_entry["result"])
+    if not submission.get("learner_id"):
+        return None
+    confidence = (submission.get("metrics") or {}).get("confidence")
+    return Review(submission["learner_id"], lesson_id, submission["step_id"], result.ok,
+                  confidence if isinstance(confidence, (int, float)) else None)
+
+async def index_source(type: str, value: str, key: str) -> None:
+    """
+    Indexes inline text under its source key unless the index already holds it.
+
+    Checked on every create rather than only when generation runs, since cached
+    content outlives passages that were pending when the process stopped.
+    """
+    if type == "text":
+        # add() is a no-op for known keys; membership reads segments under the index lock, so off the loop
+        await asyncio.to_thread(SOURCE_INDEX.add, key, value)
+
+async def generate_content(source: LessonSource, key: str) -> Dict[str, Any]:
+    """Decodes a source into a title and step kinds/payloads; ids are assigned per lesson."""
+    # This is a mock implementation. A real implementation would use RAG/LLMs.
+    return {
+        "title": "Decoded lesson",
+        "steps": [
+            {"kind": "check", "payload": {
+                "question": "Which of these is a fruit?",
+                "choices": ["Carrot", "Apple", "Broccoli"],
+                "answer": 1,
+                "context": "An apple is a sweet, edible fruit produced by an apple tree.",
+                "sources": ["source.txt#L1-L2"]
+            }},
+            {"kind": "explain", "payload": {
+                "prompt": "Explain why an apple is a fruit."
+            }},
+        ],
+    }
+
+async def generate_lesson(source: LessonSource) -> tuple[Lesson, List[Step]]:
+    """A new lesson for ``source``, reusing cached content when the same source was decoded before."""
+    key = source_key(source.type, source.value, GENERATOR_VERSION)
+    await index_source(source.type, source.value, key)  # before generating, so it can retrieve
+    content = await GENERATION_CACHE.get_or_generate(key, lambda: generate_content(source, key))
+    lesson = Lesson(source=source, title=content["title"])
+    steps = [Step(lesson_id=lesson.id, kind=s["kind"], payload=s["payload"]) for s in content["steps"]]
+    lesson.steps = [step.id for step in steps]
+    return lesson, steps
 
 # --- API Endpoints ---
 
@@ -81,94 +221,181 @@ async def create_lesson(source: LessonSource):
     """
     Creates a new lesson from a source, generates initial steps, and returns the lesson object.
     """
-    # This is a mock implementation. A real implementation would use RAG/LLMs.
-    lesson = Lesson(source=source)
-
-    # Generate some mock steps
-    step1 = Step(lesson_id=lesson.id, kind="check", payload={
-        "question": "Which of these is a fruit?",
-        "choices": ["Carrot", "Apple", "Broccoli"],
-        "answer": 1,
-        "context": "An apple is a sweet, edible fruit produced by an apple tree.",
-        "sources": ["source.txt#L1-L2"]
-    })
-    step2 = Step(lesson_id=lesson.id, kind="explain", payload={
-        "prompt": "Explain why an apple is a fruit."
-    })
-
-    lesson.steps = [step1.id, step2.id]
-
-    save_lesson(lesson)
-    save_step(step1)
-    save_step(step2)
+    lesson, steps = await generate_lesson(source)
+    await STORE.save(lesson.model_dump(), [s.model_dump() for s in steps])
+    LESSON_CACHE.invalidate(lesson.id)
 
     return lesson
 
+@app.post("/api/lessons/bulk", response_model=List[Lesson])
+async def create_lessons(bulk: BulkLessons):
+    """
+    Creates one lesson per source, written in a single storage transaction.
+    """
+    generated = await asyncio.gather(*(generate_lesson(source) for source in bulk.sources))
+    await STORE.save_many([(lesson.model_dump(), [s.model_dump() for s in steps]) for lesson, steps in generated])
+    for lesson, _ in generated:
+        LESSON_CACHE.invalidate(lesson.id)
+    return [lesson for lesson, _ in generated]
+
+@app.get("/api/lessons/export")
+async def export_lessons():
+    """
+    Streams every lesson as NDJSON, one ``{"lesson", "steps"}`` object per line.
+    """
+    async def lines():
+        async for lesson, steps in STORE.export():
+            yield json.dumps({"lesson": lesson, "steps": steps}) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.get("/api/lesson/{lesson_id}", response_model=Dict)
-async def get_lesson(lesson_id: str):
+async def get_lesson(lesson_id: str, if_none_match: str | None = Header(default=None)):
     """
     Retrieves a lesson and its resolved steps.
+
+    Served from a read-through cache of serialized responses; a matching
+    ``If-None-Match`` gets a bodiless 304.
+    """
+    entry = LESSON_CACHE.get(lesson_id)
+    if entry is None:
+        generation = LESSON_CACHE.generation()
+        found = await STORE.lesson_with_steps(lesson_id)
+        if found is None:
+            raise HTTPException(status_code=404, detail="Lesson not found")
+        lesson_data, steps_data = found
+        entry = LESSON_CACHE.put(lesson_id, {"lesson": lesson_data, "steps": steps_data}, generation)
+
+    headers = {"ETag": entry.etag, "Cache-Control": f"public, max-age={CACHE_MAX_AGE}, must-revalidate"}
+    not_modified = etag_matches(if_none_match, entry.etag)
+    LESSON_CACHE.record(entry, not_modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+@app.get("/api/lesson/{lesson_id}/stats")
+async def lesson_stats(lesson_id: str):
+    """
+    Per-step attempts, correct rate, choice histogram, confidence and slop.
+
+    Aggregates are updated as answers are graded, so this never rescans the logs.
+    """
+    if lesson_id not in STATS:
+        await require_lesson(lesson_id)
+        await load_stats(lesson_id)
+    return {"lesson_id": lesson_id, **STATS.get(lesson_id)}
+
+@app.get("/api/lesson/{lesson_id}/context")
+async def lesson_context(lesson_id: str, q: str, k: int = Query(default=5, ge=1, le=50)):
+    """
+    Top-k BM25 passages from the lesson's own source, anchored as ``source.txt#Lx-Ly``.
+    """
+    lesson = await require_lesson(lesson_id)
+    source = lesson["source"]
+    key = source_key(source["type"], source["value"], GENERATOR_VERSION)
+    await index_source(source["type"], source["value"], key)
+    return {"results": await asyncio.to_thread(SOURCE_INDEX.search, q, k, key)}
+
+@app.get("/api/sources/search")
+async def search_sources(q: str, k: int = Query(default=5, ge=1, le=50)):
+    """
+    Top-k BM25 passages across every indexed lesson source.
+    """
+    return {"results": await asyncio.to_thread(SOURCE_INDEX.search, q, k), "index": SOURCE_INDEX.snapshot()}
+
+@app.get("/api/learner/{learner_id}/due")
+async def due_reviews(learner_id: str, limit: int = Query(default=10, ge=1, le=500),
+                      within: float = Query(default=0.0, ge=0.0)):
+    """
+    The learner's next steps to review, most overdue first (SM-2 schedule).
+
+    ``within`` (seconds) also includes steps that fall due soon, for clients prefetching a session.
     """
-    lesson_dir = get_lesson_dir(lesson_id)
-    lesson_path = lesson_dir / "lesson.json"
-    lesson_data = json.loads(lesson_path.read_text())
+    due = await REVIEWS.next_due(learner_id, limit, time.time() + within)
+    return {"learner_id": learner_id, "due": due}
 
-    steps_data = []
-    steps_dir = lesson_dir / "steps"
-    if steps_dir.exists():
-        for step_file in steps_dir.glob("*.json"):
-            steps_data.append(json.loads(step_file.read_text()))
+@app.get("/api/logs")
+async def log_stats():
+    """Reports answer/feedback log group-commit sizes, fsyncs and rotations."""
+    return LOG.snapshot()
 
-    return {"lesson": lesson_data, "steps": steps_data}
+@app.get("/api/generation-cache")
+async def generation_cache_stats():
+    """Reports generation cache hits (memory and disk), misses and coalesced requests."""
+    return GENERATION_CACHE.snapshot()
+
+@app.post("/api/generation-cache/invalidate")
+async def invalidate_generation(source: LessonSource | None = None):
+    """
+    Forgets the cached content for one source, or for every source when no body is sent.
+    """
+    key = source_key(source.type, source.value, GENERATOR_VERSION) if source is not None else None
+    return {"invalidated": await GENERATION_CACHE.invalidate(key)}
+
+@app.get("/api/cache")
+async def cache_stats():
+    """Reports lesson response cache hit rate, 304s and bytes saved."""
+    return LESSON_CACHE.snapshot()
 
 @app.post("/api/lesson/{lesson_id}/answer", response_model=GradedResult)
 async def submit_answer(lesson_id: str, submission: AnswerSubmission):
     """
     Accepts an answer, grades it, and returns the result.
     """
-    lesson_dir = get_lesson_dir(lesson_id)
-    step_path = lesson_dir / "steps" / f"{submission.step_id}.json"
-    if not step_path.exists():
+    step_data = await STORE.step(lesson_id, submission.step_id)
+    if step_data is None:
+        await require_lesson(lesson_id)
         raise HTTPException(status_code=404, detail="Step not found")
 
-    step_data = json.loads(step_path.read_text())
+    result = grade(step_data, submission)
+    await load_stats(lesson_id)
+    review = record_answer(lesson_id, submission.model_dump(), result)
+    if review is not None:
+        await REVIEWS.record([review])
 
-    # Mock grading logic
-    correct_answer = step_data.get("payload", {}).get("answer")
-    is_correct = submission.user_choice == correct_answer
-
-    result = GradedResult(
-        ok=is_correct,
-        correct_choice=correct_answer,
-        score=1.0 if is_correct else 0.0,
-        explain=f"The correct answer was option {correct_answer}.",
-        safety={"opa_deny": 0}
-    )
+    return result
 
-    # Append answer to log
-    answers_log = lesson_dir / "answers.log.jsonl"
-    with answers_log.open("a") as f:
-        log_entry = {
-            "submission": submission.model_dump(),
-            "result": result.model_dump()
-        }
-        f.write(json.dumps(log_entry) + "\n")
+@app.post("/api/answers/batch", response_model=Dict[str, List[BatchAnswerResult]])
+async def submit_answers(batch: AnswerBatch):
+    """
+    Grades many answers, across lessons and steps, in one call.
 
-    return result
+    Each distinct step is loaded once. Results come back in submission order;
+    an item whose lesson or step is unknown gets an ``error`` instead.
+    """
+    steps = await STORE.steps_by_id([(a.lesson_id, a.step_id) for a in batch.answers])
+    missing_lessons = {lesson_id for (lesson_id, _), step in steps.items() if step is None}
+    known = await asyncio.gather(*(STORE.lesson(lesson_id) for lesson_id in missing_lessons))
+    missing_lessons = {lesson_id for lesson_id, found in zip(missing_lessons, known) if found is None}
+    for lesson_id in {a.lesson_id for a in batch.answers} - missing_lessons:
+        await load_stats(lesson_id)
+
+    results = []
+    reviews = []
+    for answer in batch.answers:
+        step_data = steps[(answer.lesson_id, answer.step_id)]
+        if step_data is None:
+            detail = "Lesson not found" if answer.lesson_id in missing_lessons else "Step not found"
+            results.append(BatchAnswerResult(error=BatchItemError(status=404, detail=detail)))
+            continue
+        result = grade(step_data, answer)
+        review = record_answer(answer.lesson_id, answer.model_dump(exclude={"lesson_id"}), result)
+        if review is not None:
+            reviews.append(review)
+        results.append(BatchAnswerResult(result=result))
+    await REVIEWS.record(reviews)
+    return {"results": results}
 
 @app.post("/api/lesson/{lesson_id}/feedback")
 async def submit_feedback(lesson_id: str, feedback: Feedback):
     """
     Receives feedback for a step and appends it to a moderation queue.
     """
-    get_lesson_dir(lesson_id) # just to validate lesson exists
+    await require_lesson(lesson_id) # just to validate lesson exists
 
-    feedback_log = LESSONS_DIR / "moderation_queue.log.jsonl"
-    with feedback_log.open("a") as f:
-        log_entry = {
-            "lesson_id": lesson_id,
-            "feedback": feedback.model_dump()
-        }
-        f.write(json.dumps(log_entry) + "\n")
+    log_entry = {
+        "lesson_id": lesson_id,
+        "feedback": feedback.model_dump()
+    }
+    LOG.append(feedback_log(lesson_id), log_entry)
 
     return {"queued": True}
\ No newline at end of file
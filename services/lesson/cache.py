@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+CACHE_MAX_ENTRIES = int(os.getenv("LESSON_CACHE_MAX_ENTRIES", "4096"))
+CACHE_MAX_BYTES = int(os.getenv("LESSON_CACHE_MAX_BYTES", str(64 * 2**20)))
+# How long clients and shared caches may reuse a lesson before revalidating
+CACHE_MAX_AGE = int(os.getenv("LESSON_CACHE_MAX_AGE", "60"))
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so ``W/"x"`` matches ``"x"``."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class LessonResponseCache:
+    """
+    LRU of serialized ``GET /api/lesson/{id}`` bodies with strong ETags.
+
+    Bounded by entry count and total bytes. Writers call ``invalidate``; a fill
+    that raced with an invalidation is dropped rather than caching stale data.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._bytes = 0
+        self._invalidations = 0
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "bytes_served": 0, "bytes_saved": 0, "evictions": 0}
+
+    def get(self, lesson_id: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(lesson_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(lesson_id)
+        self.stats["hits"] += 1
+        return entry
+
+    def generation(self) -> int:
+        """Take before reading the store; pass to ``put`` so racing invalidations win."""
+        return self._invalidations
+
+    def put(self, lesson_id: str, data: Dict[str, Any], generation: int) -> CachedResponse:
+        entry = CachedResponse(json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+        if generation != self._invalidations or len(entry.body) > self.max_bytes:
+            return entry
+        self._drop(lesson_id)
+        self._entries[lesson_id] = entry
+        self._bytes += len(entry.body)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= len(old.body)
+            self.stats["evictions"] += 1
+        return entry
+
+    def invalidate(self, lesson_id: str) -> None:
+        self._invalidations += 1
+        self._drop(lesson_id)
+
+    def _drop(self, lesson_id: str) -> None:
+        old = self._entries.pop(lesson_id, None)
+        if old is not None:
+            self._bytes -= len(old.body)
+
+    def record(self, entry: CachedResponse, not_modified: bool) -> None:
+        if not_modified:
+            self.stats["not_modified"] += 1
+            self.stats["bytes_saved"] += len(entry.body)
+        else:
+            self.stats["bytes_served"] += len(entry.body)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
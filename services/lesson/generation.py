@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# Bump whenever generation output changes; old entries then simply stop matching
+GENERATOR_VERSION = os.getenv("LESSON_GENERATOR_VERSION", "mock-1")
+GENERATION_CACHE_ENTRIES = int(os.getenv("LESSON_GENERATION_CACHE_ENTRIES", "1024"))
+
+
+def normalize_source(type: str, value: str) -> tuple[str, str]:
+    """Collapses trivially different spellings of the same source."""
+    type = type.strip().lower()
+    value = value.replace("\r\n", "\n").strip()
+    if type == "url":
+        parts = urlsplit(value)
+        value = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/", parts.query, ""))
+    return type, value
+
+
+def source_key(type: str, value: str, version: str = GENERATOR_VERSION) -> str:
+    """Content address of a source: sha256 over the normalized source and the generator version."""
+    type, value = normalize_source(type, value)
+    body = json.dumps([version, type, value], separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class _LeaderCancelled(Exception):
+    """Set on a shared generation's future when its leader is cancelled, so a waiter takes over."""
+
+
+class GenerationCache:
+    """
+    Generated lesson content (title and step kinds/payloads), keyed by ``source_key``.
+
+    An in-memory LRU in front of one JSON file per key under ``root``, so
+    entries survive restarts. Entries hold no ids: callers mint fresh
+    lesson/step ids around a copy of the content. Concurrent misses for the
+    same key share a single generation; if its leader is cancelled, one of
+    the waiters generates instead. The in-memory LRU is only touched from the
+    event loop.
+    """
+
+    def __init__(self, root: Optional[Path] = None, max_entries: int = GENERATION_CACHE_ENTRIES):
+        self.root = Path(root) if root is not None else None
+        if self.root is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0}
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def _remember(self, key: str, body: str) -> None:
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if self.root is None:
+            return None
+        try:
+            return self._path(key).read_text()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, body: str) -> None:
+        if self.root is None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(key).with_suffix(".tmp")
+        tmp.write_text(body)
+        tmp.replace(self._path(key))
+
+    async def get_or_generate(self, key: str, generate: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """A fresh copy of the content for ``key``, generating it at most once."""
+        while True:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return json.loads(body)
+            fut = self._inflight.get(key)
+            if fut is None:
+                break
+            try:
+                body = await asyncio.shield(fut)
+            except _LeaderCancelled:
+                continue  # the first waiter back here generates itself
+            self.stats["coalesced"] += 1
+            return json.loads(body)
+
+        fut = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            body = await asyncio.to_thread(self._read_disk, key)
+            if body is not None:
+                self.stats["disk_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                body = json.dumps(await generate(), separators=(",", ":"), ensure_ascii=False)
+                await asyncio.to_thread(self._write_disk, key, body)
+            self._remember(key, body)
+        except BaseException as e:
+            # Only the leader was cancelled; its waiters must not see a CancelledError
+            fut.set_exception(_LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e)
+            fut.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            fut.set_result(body)
+            return json.loads(body)
+        finally:
+            del self._inflight[key]
+
+    def _unlink(self, keys: Optional[List[str]]) -> set:
+        """Deletes the files for ``keys`` (every file when None); returns the keys that had one."""
+        if self.root is None:
+            return set()
+        paths = [self._path(k) for k in keys] if keys is not None else list(self.root.glob("*.json"))
+        removed = set()
+        for path in paths:
+            try:
+                path.unlink()
+                removed.add(path.stem)
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def invalidate(self, key: Optional[str] = None) -> int:
+        """
+        Drops one key, or every entry when ``key`` is None; returns how many were dropped.
+
+        Memory is evicted on the event loop, alongside ``get_or_generate``;
+        only the file deletes run in a worker thread.
+        """
+        if key is not None:
+            in_memory = {key} if self._entries.pop(key, None) is not None else set()
+        else:
+            in_memory = set(self._entries)
+            self._entries.clear()
+        on_disk = await asyncio.to_thread(self._unlink, [key] if key is not None else None)
+        dropped = len(in_memory | on_disk)
+        self.stats["invalidations"] += dropped
+        return dropped
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "hit_rate": (lookups - self.stats["misses"]) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "generator": GENERATOR_VERSION,
+        }
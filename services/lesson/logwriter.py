@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# "none": leave flushing to the OS; "group": fsync once per commit group;
+# "interval": fsync at most every LESSON_LOG_FSYNC_SECONDS
+DURABILITY = os.getenv("LESSON_LOG_DURABILITY", "group")
+FSYNC_SECONDS = float(os.getenv("LESSON_LOG_FSYNC_SECONDS", "1.0"))
+ROTATE_BYTES = int(os.getenv("LESSON_LOG_ROTATE_BYTES", str(64 * 2**20)))
+MAX_BATCH = int(os.getenv("LESSON_LOG_MAX_BATCH", "4096"))
+MAX_OPEN_FILES = 256
+
+DURABILITY_POLICIES = {"none", "group", "interval"}
+
+logger = logging.getLogger(__name__)
+
+
+class LogCommitError(RuntimeError):
+    """A group commit failed; its records were not written."""
+
+
+def rotated_name(path: Path, seq: int) -> Path:
+    """``answers.log.jsonl`` -> ``answers.log.<seq>.jsonl``; sorts in write order."""
+    stem = path.name.removesuffix(".jsonl")
+    return path.with_name(f"{stem}.{seq:010d}.jsonl")
+
+
+def next_segment_seq(path: Path) -> int:
+    """One past the highest rotated segment already on disk, so restarts never reuse a name."""
+    stem = path.name.removesuffix(".jsonl")
+    seqs = [p.name[len(stem) + 1:-len(".jsonl")] for p in path.parent.glob(f"{stem}.*.jsonl")]
+    return max((int(s) for s in seqs if s.isdigit()), default=0) + 1
+
+
+def log_segments(path: Path) -> List[Path]:
+    """Every segment of a rotated log, oldest first, ending with the live file."""
+    stem = path.name.removesuffix(".jsonl")
+    rotated = sorted(p for p in path.parent.glob(f"{stem}.*.jsonl") if p != path)
+    return rotated + ([path] if path.exists() else [])
+
+
+class _Flush:
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitLog:
+    """
+    Append-only JSONL writer shared by all requests.
+
+    ``append`` only enqueues. A single writer thread drains whatever has
+    accumulated, serializes it, and issues one write per file per group,
+    followed by at most one fsync per file under the ``group`` policy. Files
+    rotate once they pass ``rotate_bytes``. A failed commit is logged and
+    raised from the next ``flush``.
+    """
+
+    def __init__(
+        self,
+        durability: str = DURABILITY,
+        fsync_seconds: float = FSYNC_SECONDS,
+        rotate_bytes: int = ROTATE_BYTES,
+        max_batch: int = MAX_BATCH,
+    ):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"Unknown durability policy '{durability}'; expected one of {sorted(DURABILITY_POLICIES)}.")
+        self.durability = durability
+        self.fsync_seconds = fsync_seconds
+        self.rotate_bytes = rotate_bytes
+        self.max_batch = max_batch
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._files: "OrderedDict[Path, Any]" = OrderedDict()
+        self._dirty: set[Path] = set()
+        self._last_fsync = time.monotonic()
+        self._error: Optional[BaseException] = None  # last failed commit, not yet reported to a flush
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.stats = {"appends": 0, "groups": 0, "writes": 0, "fsyncs": 0, "rotations": 0, "errors": 0}
+
+    def append(self, path: Path, entry: Dict[str, Any]) -> None:
+        """Queues one record; never blocks on I/O."""
+        self._ensure_started()
+        self.stats["appends"] += 1
+        self._queue.put((Path(path), entry))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until everything appended so far is written (and synced, per policy).
+
+        Raises ``LogCommitError`` when a commit since the previous flush failed.
+        """
+        if self._thread is None:
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        if not marker.done.wait(timeout):
+            return False
+        if marker.error is not None:
+            raise LogCommitError(f"Lesson log group commit failed: {marker.error}") from marker.error
+        return True
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="lesson-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.exception("Lesson log group commit failed (%d records)", len(batch))
+                self._error = e
+            markers = [item for item in batch if isinstance(item, _Flush)]
+            if markers:
+                error, self._error = self._error, None
+                for marker in markers:
+                    marker.error = error
+                    marker.done.set()
+
+    def _commit(self, batch: list) -> None:
+        groups: Dict[Path, List[str]] = {}
+        force_sync = False
+        for item in batch:
+            if isinstance(item, _Flush):
+                force_sync = True
+                continue
+            path, entry = item
+            groups.setdefault(path, []).append(json.dumps(entry) + "\n")
+        if groups:
+            self.stats["groups"] += 1
+        for path, lines in groups.items():
+            data = "".join(lines).encode("utf-8")
+            f = self._open(path)
+            if f.tell() and f.tell() + len(data) > self.rotate_bytes:
+                f = self._rotate(path)
+            f.write(data)
+            f.flush()
+            self.stats["writes"] += 1
+            self._dirty.add(path)
+
+        now = time.monotonic()
+        if self.durability == "group" or (self.durability == "interval" and now - self._last_fsync >= self.fsync_seconds) \
+                or (force_sync and self.durability != "none"):
+            for path in self._dirty:
+                f = self._files.get(path)
+                if f is not None:
+                    os.fsync(f.fileno())
+                    self.stats["fsyncs"] += 1
+            self._dirty.clear()
+            self._last_fsync = now
+
+    def _open(self, path: Path):
+        f = self._files.get(path)
+        if f is not None:
+            self._files.move_to_end(path)
+            return f
+        path.parent.mkdir(parents=True, exist_ok=True)
+        f = self._files[path] = open(path, "ab")
+        while len(self._files) > MAX_OPEN_FILES:
+            old_path, old = self._files.popitem(last=False)
+            if old_path in self._dirty and self.durability != "none":
+                os.fsync(old.fileno())
+                self._dirty.discard(old_path)
+            old.close()
+        return f
+
+    def _rotate(self, path: Path):
+        old = self._files.pop(path)
+        if self.durability != "none":
+            os.fsync(old.fileno())
+        old.close()
+        self._dirty.discard(path)
+        seq = next_segment_seq(path)
+        while True:
+            # Claim the name first: a plain rename would silently replace an existing segment
+            target = rotated_name(path, seq)
+            try:
+                os.close(os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+            except FileExistsError:
+                seq += 1
+                continue
+            os.replace(path, target)
+            break
+        self.stats["rotations"] += 1
+        return self._open(path)
+
+    def snapshot(self) -> Dict[str, Any]:
+        groups = self.stats["groups"]
+        return {
+            **self.stats,
+            "durability": self.durability,
+            "records_per_group": self.stats["appends"] / groups if groups else 0.0,
+        }
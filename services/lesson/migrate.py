@@ -0,0 +1,76 @@
+"""Copies lessons between storage backends.
+
+Usage: python -m services.lesson.migrate --source fs:lessons --dest sqlite:lessons/lessons.db [--verify] [--validate]
+
+Re-running is safe: rows are upserted by id. Answer and feedback logs are not
+touched; they stay under the lessons directory.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+from services.validation import ValidationError, validate_records, validator
+
+from .storage import LessonStore, open_store
+
+
+def invalid_records(lesson: dict, steps: list) -> list[str]:
+    """Schema violations in a lesson and its steps, against schemas/lesson and schemas/step."""
+    problems = []
+    try:
+        validator("lesson")(lesson)
+    except ValidationError as e:
+        problems.append(f"lesson: {e}")
+    problems.extend(f"step {steps[i].get('id')}: {e}" for i, e in validate_records("step", steps))
+    return problems
+
+
+def migrate(source: LessonStore, dest: LessonStore, verify: bool = False, validate: bool = False) -> dict:
+    stats = {"lessons": 0, "steps": 0, "mismatched": 0, "invalid": 0}
+    for lesson_id in list(source.lesson_ids()):
+        lesson = source.read_lesson(lesson_id)
+        if lesson is None:
+            continue
+        steps = source.read_steps(lesson_id)
+        if validate:
+            problems = invalid_records(lesson, steps)
+            if problems:
+                stats["invalid"] += 1
+                print(f"Skipping {lesson_id}: " + "; ".join(problems), file=sys.stderr)
+                continue
+        dest.write_lesson_with_steps(lesson, steps)
+        stats["lessons"] += 1
+        stats["steps"] += len(steps)
+        if verify:
+            copied = dest.read_steps(lesson_id)
+            key = lambda s: s["id"]
+            if dest.read_lesson(lesson_id) != lesson or sorted(copied, key=key) != sorted(steps, key=key):
+                stats["mismatched"] += 1
+                print(f"Mismatch after copying {lesson_id}", file=sys.stderr)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="fs:lessons", help="fs[:dir] or sqlite[:path]")
+    parser.add_argument("--dest", default="sqlite:lessons/lessons.db", help="fs[:dir] or sqlite[:path]")
+    parser.add_argument("--verify", action="store_true", help="read every lesson back and compare")
+    parser.add_argument("--validate", action="store_true", help="skip lessons that fail the JSON schemas")
+    args = parser.parse_args(argv)
+
+    source = open_store(args.source, Path("lessons"))
+    dest = open_store(args.dest, Path("lessons"))
+    try:
+        stats = migrate(source, dest, verify=args.verify, validate=args.validate)
+    finally:
+        source.close()
+        dest.close()
+    print(f"Migrated {stats['lessons']} lessons, {stats['steps']} steps "
+          f"({stats['mismatched']} mismatched, {stats['invalid']} invalid)")
+    return 1 if stats["mismatched"] or stats["invalid"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
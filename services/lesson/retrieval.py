@@ -0,0 +1,419 @@
+"""
+Embedded BM25 passage index over lesson source documents.
+
+Documents are chunked into overlapping line windows whose anchors follow the
+``source.txt#L1-L8`` convention used in step ``sources``. New passages go to
+an in-memory segment; ``commit`` freezes it into an immutable on-disk segment
+that is memory-mapped for queries, so reopening an index costs no parsing.
+
+Segment layout (little-endian)::
+
+    header    magic "BM25SEG2", n_terms u32, n_passages u32, n_docs u32, total_len u64,
+              term_table, postings, passage_table, doc_table, blob offsets (u64 each)
+    terms     n_terms x (term_off u32, term_len u32, post_start u32, df u32), sorted by term bytes
+    postings  (passage u32, tf u32) pairs, grouped by term
+    passages  n_passages x (length u32, doc_off, doc_len, anchor_off, anchor_len, text_off, text_len u32)
+    docs      n_docs x (doc_off u32, doc_len u32, first_pid u32, end_pid u32), sorted by doc bytes
+    blob      UTF-8 strings referenced above
+"""
+from __future__ import annotations
+
+import bisect
+import heapq
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+CHUNK_LINES = int(os.getenv("LESSON_INDEX_CHUNK_LINES", "8"))
+CHUNK_OVERLAP = int(os.getenv("LESSON_INDEX_CHUNK_OVERLAP", "2"))
+# Freeze the in-memory segment to disk once it holds this many passages,
+# or once its oldest passage has been pending this many seconds
+COMMIT_PASSAGES = int(os.getenv("LESSON_INDEX_COMMIT_PASSAGES", "20000"))
+COMMIT_SECONDS = float(os.getenv("LESSON_INDEX_COMMIT_SECONDS", "5"))
+# Merge every segment into one once a commit leaves more than this many
+MAX_SEGMENTS = int(os.getenv("LESSON_INDEX_MAX_SEGMENTS", "16"))
+K1 = 1.2
+B = 0.75
+
+MAGIC = b"BM25SEG2"
+HEADER = struct.Struct("<8sIIIQQQQQQ")
+TERM = struct.Struct("<IIII")
+PASSAGE = struct.Struct("<IIIIIII")
+DOC = struct.Struct("<IIII")
+POSTING_SIZE = 8
+# Postings are cast in place as native u32s when the byte order allows
+NATIVE_LE = sys.byteorder == "little" and struct.calcsize("I") == 4
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def chunk_lines(text: str, lines: int = CHUNK_LINES, overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[int, int, str]]:
+    """Yields ``(first_line, last_line, text)`` windows, 1-based and inclusive; blank windows are skipped."""
+    all_lines = text.splitlines()
+    step = max(1, lines - overlap)
+    for start in range(0, len(all_lines), step):
+        window = all_lines[start:start + lines]
+        if any(line.strip() for line in window):
+            yield start + 1, start + len(window), "\n".join(window)
+        if start + lines >= len(all_lines):
+            break
+
+
+class _MemorySegment:
+    """The mutable tail of the index; everything added since the last commit."""
+
+    def __init__(self):
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.passages: List[Tuple[int, str, str, str]] = []  # (length, doc, anchor, text)
+        self.ranges: Dict[str, Tuple[int, int]] = {}  # doc -> [first pid, last pid + 1)
+        self.total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def add(self, doc: str, anchor: str, text: str) -> None:
+        pid = len(self.passages)
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        for term, tf in terms.items():
+            self.postings.setdefault(term, []).append((pid, tf))
+        self.passages.append((length, doc, anchor, text))
+        self.ranges[doc] = (self.ranges.get(doc, (pid, pid))[0], pid + 1)
+        self.total_len += length
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.ranges)
+
+    def doc_range(self, doc: str) -> Optional[Tuple[int, int]]:
+        return self.ranges.get(doc)
+
+    def df(self, term: str) -> int:
+        return len(self.postings.get(term, ()))
+
+    def term_postings(self, term: str, lo: int = 0, hi: Optional[int] = None) -> Iterable[Tuple[int, int]]:
+        """``(pid, tf)`` pairs for ``term``, limited to pids in ``[lo, hi)``; postings are in pid order."""
+        plist = self.postings.get(term, ())
+        if lo == 0 and hi is None:
+            return plist
+        start = bisect.bisect_left(plist, (lo,))
+        end = len(plist) if hi is None else bisect.bisect_left(plist, (hi,), start)
+        return plist[start:end]
+
+    def length(self, pid: int) -> int:
+        return self.passages[pid][0]
+
+    def passage(self, pid: int) -> Tuple[str, str, str]:
+        return self.passages[pid][1:]
+
+    def write(self, path: Path) -> None:
+        blob = bytearray()
+        strings: Dict[str, Tuple[int, int]] = {}
+
+        def intern(s: str) -> Tuple[int, int]:
+            ref = strings.get(s)
+            if ref is None:
+                data = s.encode("utf-8")
+                ref = strings[s] = (len(blob), len(data))
+                blob.extend(data)
+            return ref
+
+        terms = sorted(self.postings, key=lambda t: t.encode("utf-8"))
+        term_table = bytearray()
+        postings = bytearray()
+        start = 0
+        for term in terms:
+            plist = self.postings[term]
+            off, n = intern(term)
+            term_table += TERM.pack(off, n, start, len(plist))
+            for pid, tf in plist:
+                postings += struct.pack("<II", pid, tf)
+            start += len(plist)
+        passage_table = bytearray()
+        for length, doc, anchor, text in self.passages:
+            passage_table += PASSAGE.pack(length, *intern(doc), *intern(anchor), *intern(text))
+        doc_table = bytearray()
+        for doc in sorted(self.ranges, key=lambda d: d.encode("utf-8")):
+            doc_table += DOC.pack(*intern(doc), *self.ranges[doc])
+
+        term_off = HEADER.size
+        post_off = term_off + len(term_table)
+        pass_off = post_off + len(postings)
+        doc_off = pass_off + len(passage_table)
+        blob_off = doc_off + len(doc_table)
+        header = HEADER.pack(MAGIC, len(terms), len(self.passages), len(self.ranges), self.total_len,
+                             term_off, post_off, pass_off, doc_off, blob_off)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(header + term_table + postings + passage_table + doc_table + blob)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(path)
+
+
+class _DiskSegment:
+    """A committed segment, read in place through mmap; opening it reads only the header."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, self.n_terms, self.n_passages, self.n_docs, self.total_len,
+             self._terms, self._post, self._pass, self._docs, self._blob) = HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            self.close_file()
+            raise ValueError(f"{path} is not a BM25 segment.")
+        self._view = memoryview(self._mm)
+
+    def __len__(self) -> int:
+        return self.n_passages
+
+    def close(self) -> None:
+        self._view.release()
+        self.close_file()
+
+    def close_file(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def _string(self, off: int, n: int) -> str:
+        start = self._blob + off
+        return self._mm[start:start + n].decode("utf-8")
+
+    def _lookup(self, table: int, row: struct.Struct, count: int, key: str) -> Optional[Tuple[int, int]]:
+        """Binary search of a table sorted by its leading string; returns the row's two trailing u32s."""
+        key = key.encode("utf-8")
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off, n, a, b = row.unpack_from(self._mm, table + mid * row.size)
+            probe = self._mm[self._blob + off:self._blob + off + n]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return a, b
+        return None
+
+    def _find(self, term: str) -> Optional[Tuple[int, int]]:
+        """``(post_start, df)`` for ``term``."""
+        return self._lookup(self._terms, TERM, self.n_terms, term)
+
+    def doc_range(self, doc: str) -> Optional[Tuple[int, int]]:
+        """``[first pid, end pid)`` of ``doc``; add() writes a whole document at once, so it is contiguous."""
+        return self._lookup(self._docs, DOC, self.n_docs, doc)
+
+    def df(self, term: str) -> int:
+        found = self._find(term)
+        return 0 if found is None else found[1]
+
+    def term_postings(self, term: str, lo: int = 0, hi: Optional[int] = None) -> Iterable[Tuple[int, int]]:
+        """``(pid, tf)`` pairs for ``term``, limited to pids in ``[lo, hi)``; postings are in pid order."""
+        found = self._find(term)
+        if found is None:
+            return ()
+        start, df = found
+        begin = self._post + start * POSTING_SIZE
+        raw = self._view[begin:begin + df * POSTING_SIZE]
+        if not NATIVE_LE:
+            return ((pid, tf) for pid, tf in struct.iter_unpack("<II", raw) if pid >= lo and (hi is None or pid < hi))
+        flat = raw.cast("I")
+        pids, tfs = flat[0::2], flat[1::2]
+        if lo or hi is not None:
+            first = bisect.bisect_left(pids, lo)
+            last = len(pids) if hi is None else bisect.bisect_left(pids, hi, first)
+            pids, tfs = pids[first:last], tfs[first:last]
+        return zip(pids, tfs)
+
+    def length(self, pid: int) -> int:
+        return struct.unpack_from("<I", self._mm, self._pass + pid * PASSAGE.size)[0]
+
+    def passage(self, pid: int) -> Tuple[str, str, str]:
+        _, doc_off, doc_n, anc_off, anc_n, text_off, text_n = PASSAGE.unpack_from(self._mm, self._pass + pid * PASSAGE.size)
+        return self._string(doc_off, doc_n), self._string(anc_off, anc_n), self._string(text_off, text_n)
+
+
+def _segment_paths(root: Path) -> List[Path]:
+    """Committed segments in commit order; files not named by the index are ignored."""
+    return sorted(p for p in root.glob("*.seg") if p.stem.isdigit())
+
+
+class PassageIndex:
+    """
+    BM25 top-k search over line-anchored passages.
+
+    With a ``root`` directory, committed segments persist as ``*.seg`` files
+    and are reopened on startup; without one the index lives in memory only.
+    Pending passages are committed once there are ``commit_passages`` of them
+    or the oldest has waited ``commit_seconds`` (checked on ``add`` and by
+    ``commit_if_due``), and segments are merged once there are more than
+    ``max_segments``. Thread-safe; all methods are blocking and CPU-bound.
+    """
+
+    def __init__(self, root: Optional[Path] = None, commit_passages: int = COMMIT_PASSAGES,
+                 commit_seconds: float = COMMIT_SECONDS, max_segments: int = MAX_SEGMENTS):
+        self.root = Path(root) if root is not None else None
+        self.commit_passages = commit_passages
+        self.commit_seconds = commit_seconds
+        self.max_segments = max_segments
+        self._segments: List[Any] = []
+        self._memory = _MemorySegment()
+        self._pending_since: Optional[float] = None
+        self._empty_docs: set[str] = set()  # indexed documents that produced no passages
+        self._lock = threading.Lock()
+        if self.root is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            for path in _segment_paths(self.root):
+                try:
+                    self._segments.append(_DiskSegment(path))
+                except ValueError as e:
+                    # e.g. an older format; its documents are simply re-indexed when next seen
+                    logger.warning("Skipping segment: %s", e)
+
+    def __contains__(self, doc: str) -> bool:
+        with self._lock:
+            return self._has(doc)
+
+    def _has(self, doc: str) -> bool:
+        return doc in self._empty_docs or any(s.doc_range(doc) is not None for s in self._segments + [self._memory])
+
+    def add(self, doc: str, text: str, name: str = "source.txt") -> int:
+        """Indexes a document once under ``doc``; returns the number of passages added."""
+        with self._lock:
+            if self._has(doc):
+                return 0
+            added = 0
+            for first, last, chunk in chunk_lines(text):
+                self._memory.add(doc, f"{name}#L{first}-L{last}", chunk)
+                added += 1
+            if not added:
+                self._empty_docs.add(doc)
+            if added and self._pending_since is None:
+                self._pending_since = time.monotonic()
+            if self._due():
+                self._commit()
+            return added
+
+    def _due(self) -> bool:
+        if self.root is None or not len(self._memory):
+            return False
+        return (len(self._memory) >= self.commit_passages
+                or time.monotonic() - self._pending_since >= self.commit_seconds)
+
+    def commit(self) -> None:
+        """Freezes the in-memory segment to disk (no-op without a root or with nothing pending)."""
+        with self._lock:
+            self._commit()
+
+    def commit_if_due(self) -> bool:
+        """Commits when the size or age trigger has fired; returns whether it did."""
+        with self._lock:
+            if not self._due():
+                return False
+            self._commit()
+            return True
+
+    def _commit(self) -> None:
+        if self.root is None or not len(self._memory):
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Numbers only grow, so a compaction's output never collides with its inputs
+        last = max((int(p.stem) for p in _segment_paths(self.root)), default=-1)
+        path = self.root / f"{last + 1:06d}.seg"
+        self._memory.write(path)
+        self._segments.append(_DiskSegment(path))
+        self._memory = _MemorySegment()
+        self._pending_since = None
+        if len(self._segments) > self.max_segments:
+            self._compact()
+
+    def compact(self) -> None:
+        """Rewrites every segment into one, so queries touch a single term table."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        if self.root is None or len(self._segments) + bool(len(self._memory)) <= 1:
+            return
+        merged = _MemorySegment()
+        for segment in self._segments + [self._memory]:
+            for pid in range(len(segment)):
+                merged.add(*segment.passage(pid))
+        old = self._segments
+        self._memory = merged
+        self._segments = []
+        self._commit()  # the merged segment is durable before any input is removed
+        for segment in old:
+            segment.close()
+            segment.path.unlink()
+
+    def search(self, query: str, k: int = 5, doc: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top-``k`` passages by BM25, optionally restricted to one document."""
+        terms = set(tokenize(query))
+        with self._lock:
+            segments = self._segments + [self._memory]
+            n = sum(len(s) for s in segments)
+            if not terms or not n:
+                return []
+            avgdl = sum(s.total_len for s in segments) / n
+            # Statistics stay corpus-wide; a doc filter only narrows which postings are scored
+            if doc is None:
+                scoped = [(si, 0, None) for si in range(len(segments))]
+            else:
+                scoped = [(si, *r) for si, r in enumerate(s.doc_range(doc) for s in segments) if r is not None]
+            scores: Dict[Tuple[int, int], float] = {}
+            for term in terms:
+                df = sum(s.df(term) for s in segments)
+                if not df:
+                    continue
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for si, lo, hi in scoped:
+                    segment = segments[si]
+                    for pid, tf in segment.term_postings(term, lo, hi):
+                        norm = K1 * (1 - B + B * segment.length(pid) / avgdl)
+                        scores[(si, pid)] = scores.get((si, pid), 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+            top = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+            results = []
+            for (si, pid), score in top:
+                doc_id, anchor, text = segments[si].passage(pid)
+                results.append({"doc": doc_id, "anchor": anchor, "score": score, "text": text})
+            return results
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": sum(s.n_docs for s in self._segments) + self._memory.n_docs + len(self._empty_docs),
+                "passages": sum(len(s) for s in self._segments) + len(self._memory),
+                "segments": len(self._segments),
+                "pending": len(self._memory),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._commit()
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
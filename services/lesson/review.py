@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+REVIEW_DB_ENV = "LESSON_REVIEW_DB"
+DAY = 86400.0
+MIN_EASE = 1.3
+
+
+@dataclass
+class ReviewState:
+    ease: float = 2.5
+    interval: float = 0.0  # days
+    reps: int = 0
+    lapses: int = 0
+    due: float = 0.0  # unix seconds
+
+
+@dataclass
+class Review:
+    learner_id: str
+    lesson_id: str
+    step_id: str
+    ok: bool
+    confidence: Optional[float] = None
+    at: Optional[float] = None
+
+
+def quality(ok: bool, confidence: Optional[float] = None) -> int:
+    """Maps a graded answer to an SM-2 recall grade (0-5); confidence refines it when reported."""
+    if not ok:
+        return 0 if confidence is not None and confidence >= 0.8 else 1
+    if confidence is None:
+        return 4
+    if confidence >= 0.8:
+        return 5
+    return 4 if confidence >= 0.5 else 3
+
+
+def sm2(state: ReviewState, grade: int, now: float) -> ReviewState:
+    """One SM-2 step: failed recalls restart at one day, passes grow the interval by the ease factor."""
+    if grade < 3:
+        reps, interval, lapses = 0, 1.0, state.lapses + 1
+    else:
+        reps, lapses = state.reps + 1, state.lapses
+        interval = 1.0 if reps == 1 else 6.0 if reps == 2 else round(state.interval * state.ease, 2)
+    ease = max(MIN_EASE, state.ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    return ReviewState(ease=ease, interval=interval, reps=reps, lapses=lapses, due=now + interval * DAY)
+
+
+class ReviewScheduler:
+    """
+    Per-learner, per-step SM-2 state in SQLite (WAL).
+
+    Rows are keyed by (learner, lesson, step) and indexed by (learner, due),
+    so "next N due" is an index range scan rather than a log replay. Each
+    worker thread gets its own connection, as in ``SQLiteLessonStore``.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS reviews (
+            learner_id TEXT NOT NULL,
+            lesson_id  TEXT NOT NULL,
+            step_id    TEXT NOT NULL,
+            ease       REAL NOT NULL,
+            interval   REAL NOT NULL,
+            reps       INTEGER NOT NULL,
+            lapses     INTEGER NOT NULL,
+            due        REAL NOT NULL,
+            PRIMARY KEY (learner_id, lesson_id, step_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS reviews_due ON reviews (learner_id, due);
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        self.stats = {"reviews": 0, "lapses": 0, "due_queries": 0}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _state(self, conn: sqlite3.Connection, review: Review) -> ReviewState:
+        row = conn.execute(
+            "SELECT ease, interval, reps, lapses, due FROM reviews WHERE learner_id = ? AND lesson_id = ? AND step_id = ?",
+            (review.learner_id, review.lesson_id, review.step_id),
+        ).fetchone()
+        return ReviewState() if row is None else ReviewState(*row)
+
+    def record_many(self, reviews: List[Review]) -> None:
+        """Applies graded answers in order, in one transaction."""
+        if not reviews:
+            return
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for review in reviews:
+                    now = review.at if review.at is not None else time.time()
+                    state = sm2(self._state(conn, review), quality(review.ok, review.confidence), now)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (review.learner_id, review.lesson_id, review.step_id,
+                         state.ease, state.interval, state.reps, state.lapses, state.due),
+                    )
+                    self.stats["reviews"] += 1
+                    self.stats["lapses"] += not review.ok
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def due(self, learner_id: str, limit: int = 10, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """The learner's steps due by ``now``, most overdue first."""
+        now = time.time() if now is None else now
+        self.stats["due_queries"] += 1
+        rows = self._conn().execute(
+            "SELECT lesson_id, step_id, ease, interval, reps, lapses, due FROM reviews"
+            " WHERE learner_id = ? AND due <= ? ORDER BY due LIMIT ?",
+            (learner_id, now, limit),
+        )
+        return [
+            {"lesson_id": lesson_id, "step_id": step_id, "ease": ease, "interval_days": interval,
+             "reps": reps, "lapses": lapses, "due": due}
+            for lesson_id, step_id, ease, interval, reps, lapses, due in rows
+        ]
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- Async API for handlers ---
+    async def record(self, reviews: List[Review]) -> None:
+        await asyncio.to_thread(self.record_many, reviews)
+
+    async def next_due(self, learner_id: str, limit: int = 10, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.due, learner_id, limit, now)
+
+
+def scheduler_from_env(lessons_dir: Path) -> ReviewScheduler:
+    return ReviewScheduler(Path(os.getenv(REVIEW_DB_ENV) or lessons_dir / "reviews.db"))
@@ -0,0 +1,181 @@
+"""Per-lesson, per-step answer statistics, maintained incrementally as answers are graded.
+
+Rebuild from the answer logs: python -m services.lesson.stats [--lessons-dir lessons] [LESSON_ID ...]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from .logwriter import log_segments
+
+SLOP_KINDS = ("emoji", "emdash", "endash", "nbsp")
+# Answers at or above this confidence that were wrong count as overconfident
+OVERCONFIDENT = 0.8
+
+
+class StepStats:
+    __slots__ = ("attempts", "correct", "choices", "confidence_sum", "confidence_n", "overconfident", "slop", "sloppy")
+
+    def __init__(self):
+        self.attempts = 0
+        self.correct = 0
+        self.choices: Dict[int, int] = {}
+        self.confidence_sum = 0.0
+        self.confidence_n = 0
+        self.overconfident = 0
+        self.slop = dict.fromkeys(SLOP_KINDS, 0)
+        self.sloppy = 0  # answers with any slop at all
+
+    def add(self, submission: Dict[str, Any], result: Dict[str, Any]) -> None:
+        ok = bool(result.get("ok"))
+        self.attempts += 1
+        self.correct += ok
+        choice = submission.get("user_choice")
+        self.choices[choice] = self.choices.get(choice, 0) + 1
+
+        metrics = submission.get("metrics") or {}
+        confidence = metrics.get("confidence")
+        if isinstance(confidence, (int, float)):
+            self.confidence_sum += confidence
+            self.confidence_n += 1
+            if confidence >= OVERCONFIDENT and not ok:
+                self.overconfident += 1
+        slop = metrics.get("slop") or {}
+        any_slop = False
+        for kind in SLOP_KINDS:
+            n = slop.get(kind)
+            if isinstance(n, int) and n > 0:
+                self.slop[kind] += n
+                any_slop = True
+        self.sloppy += any_slop
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "correct": self.correct,
+            "correct_rate": self.correct / self.attempts if self.attempts else 0.0,
+            "choices": {str(k): v for k, v in sorted(self.choices.items(), key=lambda kv: str(kv[0]))},
+            "mean_confidence": self.confidence_sum / self.confidence_n if self.confidence_n else None,
+            "overconfident": self.overconfident,
+            "slop": dict(self.slop),
+            "slop_rate": self.sloppy / self.attempts if self.attempts else 0.0,
+        }
+
+
+class LessonStats:
+    __slots__ = ("attempts", "correct", "steps")
+
+    def __init__(self):
+        self.attempts = 0
+        self.correct = 0
+        self.steps: Dict[str, StepStats] = {}
+
+    def add(self, submission: Dict[str, Any], result: Dict[str, Any]) -> None:
+        step_id = submission.get("step_id")
+        step = self.steps.get(step_id)
+        if step is None:
+            step = self.steps[step_id] = StepStats()
+        step.add(submission, result)
+        self.attempts += 1
+        self.correct += bool(result.get("ok"))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "correct": self.correct,
+            "correct_rate": self.correct / self.attempts if self.attempts else 0.0,
+            "steps": {step_id: s.as_dict() for step_id, s in self.steps.items()},
+        }
+
+
+def read_answers(path: Path) -> Iterator[Dict[str, Any]]:
+    """Replays an answer log, rotated segments included, skipping torn lines."""
+    for segment in log_segments(path):
+        with segment.open() as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def replay(entries: Iterable[Dict[str, Any]]) -> LessonStats:
+    stats = LessonStats()
+    for entry in entries:
+        stats.add(entry.get("submission") or {}, entry.get("result") or {})
+    return stats
+
+
+class StatsIndex:
+    """
+    In-memory aggregates for every lesson answered since startup.
+
+    A lesson is loaded by replaying its log once, the first time it is
+    touched; after that every graded answer updates the counters in place,
+    so reads never rescan the logs. Callers must ``ensure`` a lesson before
+    appending its answers to the log, so the replay and the live updates
+    never overlap. ``ensure`` blocks (the replay reads files); call it via a
+    thread. Replays serialize per lesson and run outside the shared lock,
+    which is only held for dict updates, so ``record`` and ``get`` never
+    wait on another lesson's I/O.
+    """
+
+    def __init__(self):
+        self._lessons: Dict[str, LessonStats] = {}
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, lesson_id: str) -> bool:
+        return lesson_id in self._lessons
+
+    def ensure(self, lesson_id: str, loader: Callable[[], Iterable[Dict[str, Any]]]) -> None:
+        if lesson_id in self._lessons:
+            return
+        with self._lock:
+            loading = self._loading.setdefault(lesson_id, threading.Lock())
+        with loading:
+            if lesson_id in self._lessons:
+                return
+            stats = replay(loader())
+            with self._lock:
+                self._lessons.setdefault(lesson_id, stats)
+                self._loading.pop(lesson_id, None)
+
+    def record(self, lesson_id: str, submission: Dict[str, Any], result: Dict[str, Any]) -> None:
+        with self._lock:
+            stats = self._lessons.get(lesson_id)
+            if stats is None:
+                stats = self._lessons[lesson_id] = LessonStats()
+            stats.add(submission, result)
+
+    def get(self, lesson_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stats = self._lessons.get(lesson_id)
+            return None if stats is None else stats.as_dict()
+
+    def forget(self, lesson_id: str) -> None:
+        with self._lock:
+            self._lessons.pop(lesson_id, None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("lesson_ids", nargs="*", help="lessons to rebuild (default: every lesson with an answer log)")
+    parser.add_argument("--lessons-dir", type=Path, default=Path("lessons"))
+    args = parser.parse_args(argv)
+
+    lesson_ids = args.lesson_ids or sorted(
+        {p.parent.name for p in args.lessons_dir.glob("*/answers.log*.jsonl")}
+    )
+    out = {lid: replay(read_answers(args.lessons_dir / lid / "answers.log.jsonl")).as_dict() for lid in lesson_ids}
+    json.dump(out, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+# Backend selection: "fs" (default, one JSON file per lesson/step) or "sqlite"
+STORE_ENV = "LESSON_STORE"
+DB_ENV = "LESSON_DB"
+# Lessons read per worker-thread hop when exporting
+EXPORT_PAGE = 200
+
+Bundle = tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+
+def ordered_steps(lesson: Dict[str, Any], steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Steps in the order the lesson lists them; unlisted ones last, by id."""
+    order = {step_id: i for i, step_id in enumerate(lesson.get("steps", []))}
+    return sorted(steps, key=lambda s: (order.get(s["id"], len(order)), s["id"]))
+
+
+class LessonStore:
+    """
+    Base class for lesson/step storage backends.
+
+    Backends implement the blocking ``read_*``/``write_*`` primitives; the
+    async methods used by request handlers run them in a worker thread so
+    disk I/O never blocks the event loop.
+    """
+    name: str = "base"
+
+    # --- Blocking primitives ---
+    def write_lesson(self, lesson: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def write_step(self, step: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def read_lesson(self, lesson_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def read_step(self, lesson_id: str, step_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def read_steps(self, lesson_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def read_steps_by_id(self, keys: List[tuple[str, str]]) -> Dict[tuple[str, str], Optional[Dict[str, Any]]]:
+        return {key: self.read_step(*key) for key in keys}
+
+    def lesson_ids(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def write_lesson_with_steps(self, lesson: Dict[str, Any], steps: List[Dict[str, Any]]) -> None:
+        for step in steps:
+            self.write_step(step)
+        self.write_lesson(lesson)
+
+    def write_many(self, bundles: List[Bundle]) -> None:
+        for lesson, steps in bundles:
+            self.write_lesson_with_steps(lesson, steps)
+
+    def export_pages(self, page_size: int = EXPORT_PAGE) -> Iterator[List[Bundle]]:
+        """Every lesson with its ordered steps, ``page_size`` lessons at a time."""
+        page: List[Bundle] = []
+        for lesson_id in self.lesson_ids():
+            lesson = self.read_lesson(lesson_id)
+            if lesson is None:
+                continue
+            page.append((lesson, ordered_steps(lesson, self.read_steps(lesson_id))))
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    # --- Async API for handlers ---
+    async def save(self, lesson: Dict[str, Any], steps: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self.write_lesson_with_steps, lesson, steps)
+
+    async def save_many(self, bundles: List[Bundle]) -> None:
+        await asyncio.to_thread(self.write_many, bundles)
+
+    async def export(self, page_size: int = EXPORT_PAGE) -> AsyncIterator[Bundle]:
+        """Streams every lesson; only one page is held in memory at a time."""
+        pages = self.export_pages(page_size)
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                return
+            for bundle in page:
+                yield bundle
+
+    async def lesson(self, lesson_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.read_lesson, lesson_id)
+
+    async def step(self, lesson_id: str, step_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.read_step, lesson_id, step_id)
+
+    async def steps_by_id(self, keys: List[tuple[str, str]]) -> Dict[tuple[str, str], Optional[Dict[str, Any]]]:
+        """Loads each distinct ``(lesson_id, step_id)`` once, in a single worker-thread hop."""
+        return await asyncio.to_thread(self.read_steps_by_id, list(dict.fromkeys(keys)))
+
+    async def lesson_with_steps(self, lesson_id: str) -> Optional[tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """The lesson and its steps, in the order the lesson lists them."""
+        def read():
+            lesson = self.read_lesson(lesson_id)
+            if lesson is None:
+                return None
+            return lesson, ordered_steps(lesson, self.read_steps(lesson_id))
+        return await asyncio.to_thread(read)
+
+
+class FilesystemLessonStore(LessonStore):
+    """The original layout: ``<root>/<lesson_id>/lesson.json`` and ``steps/<step_id>.json``."""
+    name = "fs"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def write_lesson(self, lesson: Dict[str, Any]) -> None:
+        lesson_dir = self.root / lesson["id"]
+        lesson_dir.mkdir(exist_ok=True)
+        (lesson_dir / "lesson.json").write_text(json.dumps(lesson, indent=2))
+
+    def write_step(self, step: Dict[str, Any]) -> None:
+        steps_dir = self.root / step["lesson_id"] / "steps"
+        steps_dir.mkdir(parents=True, exist_ok=True)
+        (steps_dir / f"{step['id']}.json").write_text(json.dumps(step, indent=2))
+
+    def read_lesson(self, lesson_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads((self.root / lesson_id / "lesson.json").read_text())
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def read_step(self, lesson_id: str, step_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads((self.root / lesson_id / "steps" / f"{step_id}.json").read_text())
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def read_steps(self, lesson_id: str) -> List[Dict[str, Any]]:
+        steps_dir = self.root / lesson_id / "steps"
+        if not steps_dir.exists():
+            return []
+        return [json.loads(p.read_text()) for p in sorted(steps_dir.glob("*.json"))]
+
+    def lesson_ids(self) -> Iterator[str]:
+        for lesson_file in self.root.glob("*/lesson.json"):
+            yield lesson_file.parent.name
+
+    def write_many(self, bundles: List[Bundle]) -> None:
+        # Steps first, then lessons: a lesson is only visible once all its steps are
+        for _, steps in bundles:
+            for step in steps:
+                self.write_step(step)
+        for lesson, _ in bundles:
+            self.write_lesson(lesson)
+
+
+class SQLiteLessonStore(LessonStore):
+    """
+    Embedded SQLite in WAL mode: lessons and steps are rows indexed by id.
+
+    Each worker thread gets its own connection, so reads proceed concurrently
+    with the single writer.
+    """
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS lessons (
+            id   TEXT PRIMARY KEY,
+            body TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS steps (
+            id        TEXT PRIMARY KEY,
+            lesson_id TEXT NOT NULL,
+            body      TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS steps_by_lesson ON steps (lesson_id);
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")  # durable across app crashes; WAL fsyncs on checkpoint
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, statements: List[tuple[str, tuple]]) -> None:
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, args in statements:
+                    conn.execute(sql, args)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _lesson_row(lesson: Dict[str, Any]) -> tuple[str, tuple]:
+        return "INSERT OR REPLACE INTO lessons (id, body) VALUES (?, ?)", (lesson["id"], json.dumps(lesson))
+
+    @staticmethod
+    def _step_row(step: Dict[str, Any]) -> tuple[str, tuple]:
+        return (
+            "INSERT OR REPLACE INTO steps (id, lesson_id, body) VALUES (?, ?, ?)",
+            (step["id"], step["lesson_id"], json.dumps(step)),
+        )
+
+    def write_lesson(self, lesson: Dict[str, Any]) -> None:
+        self._write([self._lesson_row(lesson)])
+
+    def write_step(self, step: Dict[str, Any]) -> None:
+        self._write([self._step_row(step)])
+
+    def write_lesson_with_steps(self, lesson: Dict[str, Any], steps: List[Dict[str, Any]]) -> None:
+        # One transaction, so readers never see a lesson without its steps
+        self._write([self._step_row(s) for s in steps] + [self._lesson_row(lesson)])
+
+    def write_many(self, bundles: List[Bundle]) -> None:
+        # The whole batch is one transaction: one WAL commit instead of one per lesson
+        self._write([self._step_row(s) for _, steps in bundles for s in steps]
+                    + [self._lesson_row(lesson) for lesson, _ in bundles])
+
+    def export_pages(self, page_size: int = EXPORT_PAGE) -> Iterator[List[Bundle]]:
+        # Keyset pagination: each page is two indexed queries, with no cursor held open between pages
+        after = ""
+        while True:
+            conn = self._conn()
+            rows = conn.execute(
+                "SELECT id, body FROM lessons WHERE id > ? ORDER BY id LIMIT ?", (after, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            ids = [lesson_id for lesson_id, _ in rows]
+            steps: Dict[str, List[Dict[str, Any]]] = {lesson_id: [] for lesson_id in ids}
+            marks = ",".join("?" * len(ids))
+            for lesson_id, body in conn.execute(f"SELECT lesson_id, body FROM steps WHERE lesson_id IN ({marks})", ids):
+                steps[lesson_id].append(json.loads(body))
+            page = []
+            for lesson_id, body in rows:
+                lesson = json.loads(body)
+                page.append((lesson, ordered_steps(lesson, steps[lesson_id])))
+            yield page
+            after = ids[-1]
+
+    def read_lesson(self, lesson_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT body FROM lessons WHERE id = ?", (lesson_id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def read_step(self, lesson_id: str, step_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT body FROM steps WHERE id = ? AND lesson_id = ?", (step_id, lesson_id)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def read_steps_by_id(self, keys: List[tuple[str, str]]) -> Dict[tuple[str, str], Optional[Dict[str, Any]]]:
+        found: Dict[tuple[str, str], Optional[Dict[str, Any]]] = dict.fromkeys(keys)
+        step_ids = list({step_id for _, step_id in keys})
+        for i in range(0, len(step_ids), 500):  # stay under SQLite's bound-parameter limit
+            chunk = step_ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for step_id, lesson_id, body in self._conn().execute(
+                f"SELECT id, lesson_id, body FROM steps WHERE id IN ({marks})", chunk
+            ):
+                if (lesson_id, step_id) in found:
+                    found[(lesson_id, step_id)] = json.loads(body)
+        return found
+
+    def read_steps(self, lesson_id: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT body FROM steps WHERE lesson_id = ? ORDER BY id", (lesson_id,))
+        return [json.loads(body) for (body,) in rows]
+
+    def lesson_ids(self) -> Iterator[str]:
+        for (lesson_id,) in self._conn().execute("SELECT id FROM lessons ORDER BY id"):
+            yield lesson_id
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def open_store(spec: str, lessons_dir: Path) -> LessonStore:
+    """Opens ``fs``, ``fs:<dir>``, ``sqlite`` or ``sqlite:<path>``; bare names default under ``lessons_dir``."""
+    kind, _, location = spec.partition(":")
+    if kind == "fs":
+        return FilesystemLessonStore(Path(location) if location else lessons_dir)
+    if kind == "sqlite":
+        return SQLiteLessonStore(Path(location) if location else lessons_dir / "lessons.db")
+    raise ValueError(f"Unknown lesson store '{spec}'; expected fs[:dir] or sqlite[:path].")
+
+
+def store_from_env(lessons_dir: Path) -> LessonStore:
+    spec = os.getenv(STORE_ENV, "fs")
+    if spec == "sqlite" and os.getenv(DB_ENV):
+        spec = f"sqlite:{os.getenv(DB_ENV)}"
+    return open_store(spec, lessons_dir)
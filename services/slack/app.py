@@ -1,9 +1,11 @@
 import os
-import httpx
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
 
+from services.ucapi.client import UCAPIError, close_client, get_client
+
 # Environment variables
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
@@ -19,27 +21,26 @@ if not all([SLACK_BOT_TOKEN, SLACK_SIGNING_SECRET, UCAPI_URL, UCAPI_SERVICE_KEY]
 bolt_app = AsyncApp(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
 app_handler = AsyncSlackRequestHandler(bolt_app)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Closes the shared UCAPI connection pool on shutdown."""
+    yield
+    await close_client()
+
+
 # Initialize FastAPI App
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 async def ask_ucapi(prompt: str) -> str:
     """Sends a prompt to the UCAPI service and returns the assistant's response."""
-    headers = {"Authorization": f"Bearer {UCAPI_SERVICE_KEY}"}
-    payload = {
-        "model": DEFAULT_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-    }
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(f"{UCAPI_URL}/v1/chat/completions", json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            # Assuming the response has a structure similar to OpenAI's
-            return data["choices"][0]["message"]["content"]
-        except httpx.HTTPStatusError as e:
-            return f"Error communicating with UCAPI: HTTP {e.response.status_code} - {e}"
-        except (KeyError, IndexError) as e:
-            return f"Error communicating with UCAPI: Invalid response format - {e}"
+    messages = [{"role": "user", "content": prompt}]
+    try:
+        # Slack redelivers events it thinks timed out; coalescing makes the retry share the first call
+        return await get_client(UCAPI_URL, UCAPI_SERVICE_KEY).chat_text(DEFAULT_MODEL, messages)
+    except UCAPIError as e:
+        return f"Error communicating with UCAPI: HTTP {e.status} - {e}"
+    except (KeyError, IndexError) as e:
+        return f"Error communicating with UCAPI: Invalid response format - {e}"
 
 @bolt_app.event("app_mention")
 async def handle_app_mention(body, say):
@@ -28,4 +28,16 @@ class ChatAdapter:
         1. Non-streaming: Returns a single dictionary with the full response.
         2. Streaming: Returns an async iterator of response chunks.
         """
-        raise NotImplementedError("Subclasses must implement the 'chat' method.")
\ No newline at end of file
+        raise NotImplementedError("Subclasses must implement the 'chat' method.")
+
+    def payload(
+        self,
+        model: str,
+        messages: list[dict],
+        tools: list[dict] | None,
+        tool_choice: str | dict | None,
+        params: dict,
+        stream: bool = False,
+    ) -> Dict[str, Any]:
+        """Builds the provider request body; used to write offline batch files."""
+        raise NotImplementedError(f"The '{self.name}' adapter does not support offline batches.")
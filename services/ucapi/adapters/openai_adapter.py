@@ -4,6 +4,7 @@ import httpx
 from typing import Any, Dict, Optional, AsyncIterator, Callable
 
 from .base import ChatAdapter
+from ..tool_calls import ToolCallAssembler
 
 OPENAI_KEY_ENV = "OPENAI_API_KEY"
 
@@ -11,20 +12,16 @@ class OpenAIAdapter(ChatAdapter):
     name = "openai"
     base_url = "https://api.openai.com/v1/chat/completions"
 
-    async def chat(
+    def payload(
         self,
         model: str,
         messages: list[dict],
         tools: list[dict] | None,
         tool_choice: str | dict | None,
         params: dict,
-        stream: bool,
-        stream_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
-    ) -> Dict[str, Any] | AsyncIterator[Dict[str, Any]]:
-        key = os.getenv(OPENAI_KEY_ENV)
-        if not key:
-            raise RuntimeError(f"{OPENAI_KEY_ENV} is not set.")
-
+        stream: bool = False,
+    ) -> Dict[str, Any]:
+        """The Chat Completions request body, shared by live calls and batch files."""
         payload = {
             "model": model,
             "messages": messages,
@@ -35,6 +32,23 @@ class OpenAIAdapter(ChatAdapter):
         if tools:
             payload["tools"] = tools
             payload["tool_choice"] = tool_choice or "auto"
+        return payload
+
+    async def chat(
+        self,
+        model: str,
+        messages: list[dict],
+        tools: list[dict] | None,
+        tool_choice: str | dict | None,
+        params: dict,
+        stream: bool,
+        stream_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any] | AsyncIterator[Dict[str, Any]]:
+        key = os.getenv(OPENAI_KEY_ENV)
+        if not key:
+            raise RuntimeError(f"{OPENAI_KEY_ENV} is not set.")
+
+        payload = self.payload(model, messages, tools, tool_choice, params, stream)
 
         headers = {
             "Authorization": f"Bearer {key}",
@@ -51,6 +65,7 @@ class OpenAIAdapter(ChatAdapter):
                     raise ValueError("stream_cb must be provided for streaming mode.")
 
                 async def event_stream():
+                    tool_calls = ToolCallAssembler()
                     async with client.stream("POST", self.base_url, headers=headers, json=payload) as resp:
                         resp.raise_for_status()
                         async for line in resp.aiter_lines():
@@ -58,6 +73,8 @@ class OpenAIAdapter(ChatAdapter):
                                 continue
                             chunk_str = line[6:]
                             if chunk_str == "[DONE]":
+                                for ready in tool_calls.finish():
+                                    stream_cb(ready)
                                 stream_cb({"event": "message.done"})
                                 break
 
@@ -70,6 +87,11 @@ class OpenAIAdapter(ChatAdapter):
                                         event = {"event": "tool_call.delta", "delta": delta["tool_calls"]}
                                     stream_cb(event)
                                     yield event # also yield the event for direct iteration if needed
+                                    if "tool_calls" in delta:
+                                        # Dispatchable as soon as a call's arguments are complete JSON
+                                        for ready in tool_calls.feed(delta["tool_calls"]):
+                                            stream_cb(ready)
+                                            yield ready
                             except json.JSONDecodeError:
                                 # Handle cases where a line might not be valid JSON
                                 continue
@@ -0,0 +1,86 @@
+import asyncio
+from typing import Any, Awaitable, Optional, TypeVar
+
+from .tokens import COUNTER
+
+T = TypeVar("T")
+
+# How often a waiting handler checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.25
+
+# Status logged for requests the client abandoned (nginx's "client closed request")
+CLIENT_CLOSED_STATUS = 499
+
+
+class ClientDisconnected(Exception):
+    """The caller went away before the upstream call finished; the call was cancelled."""
+
+
+class CancellationStats:
+    """Counts upstream calls cancelled because nobody was left to read the result."""
+
+    def __init__(self):
+        self.stats = {"chat": 0, "stream": 0, "before_upstream": 0, "tokens_saved": 0}
+
+    def record(self, endpoint: str, tokens_saved: int, started: bool) -> None:
+        """``tokens_saved`` is the unspent reservation, which is also what gets refunded."""
+        self.stats[endpoint] += 1
+        self.stats["tokens_saved"] += tokens_saved
+        if not started:
+            self.stats["before_upstream"] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        return dict(self.stats)
+
+
+CANCELLATIONS = CancellationStats()
+
+
+class CompletionMeter:
+    """Counts completion tokens as stream deltas go by, for refunds on cancellation."""
+
+    def __init__(self):
+        self.tokens = 0
+
+    def observe(self, event: dict) -> None:
+        delta = event.get("delta")
+        if isinstance(delta, str) and delta:
+            self.tokens += COUNTER.count_text(delta)
+
+
+def unused_reservation(prompt_tokens: int, max_tokens: Optional[int], started: bool, completion_tokens: int = 0) -> int:
+    """Tokens reserved for a request that it will now never spend.
+
+    A call cancelled before reaching the provider spends nothing; one cancelled
+    mid-generation has paid for its prompt and what it generated so far.
+    """
+    reserved = prompt_tokens + (max_tokens or 0)
+    if not started:
+        return reserved
+    return max((max_tokens or 0) - completion_tokens, 0)
+
+
+async def run_until_disconnect(request, aw: Awaitable[T], poll: float = DISCONNECT_POLL_SECONDS) -> T:
+    """
+    Awaits ``aw`` while watching the client connection.
+
+    If the client disconnects first, the task is cancelled (aborting the
+    in-flight httpx request and releasing its limiter slot) and
+    ClientDisconnected is raised. Without a request there is nothing to watch.
+    """
+    task = asyncio.ensure_future(aw)
+    if request is None:
+        return await task
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    raise ClientDisconnected()
@@ -0,0 +1,5 @@
+# UCAPI Client SDK Package
+from .core import StreamTruncated, UCAPIClient, UCAPIError, close_client, get_client
+from .sse import ServerSentEvent, iter_sse
+
+__all__ = ["UCAPIClient", "UCAPIError", "StreamTruncated", "ServerSentEvent", "close_client", "get_client", "iter_sse"]
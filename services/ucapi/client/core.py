@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+from typing import Any, AsyncIterator, Optional
+
+import httpx
+
+from ..concurrency import parse_retry_after
+from ..streams import STREAM_ID_HEADER
+from .sse import iter_sse
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Failures where the request provably never left this process; safe to resend anything
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Idempotent requests may also be resent after a broken exchange or a transient gateway error
+RETRY_ERRORS = UNSENT_ERRORS + (httpx.RemoteProtocolError,)
+RETRY_STATUSES = {429, 502, 503, 504}
+# A chat POST may already have been billed upstream, so it is only resent when the
+# gateway refused it outright and said when to come back (429/503 with Retry-After)
+REFUSED_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class UCAPIError(RuntimeError):
+    """A UCAPI error response, carrying its HTTP status and ``error.type``."""
+
+    def __init__(self, status: int, type: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.type = type
+
+    @classmethod
+    def from_response(cls, resp: httpx.Response) -> "UCAPIError":
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+        error = body.get("error") if isinstance(body, dict) else None
+        if isinstance(error, dict):
+            return cls(resp.status_code, error.get("type", "ERROR"), error.get("message", resp.text))
+        detail = body.get("detail") if isinstance(body, dict) else None
+        return cls(resp.status_code, "HTTP_ERROR", str(detail or resp.reason_phrase or resp.status_code))
+
+
+class StreamTruncated(UCAPIError):
+    """
+    A stream ended before ``message.done`` and could not be resumed in place.
+
+    Carries the stream id (None if the gateway never sent one) and the last
+    event id received, for ``UCAPIClient.resume``.
+    """
+
+    def __init__(self, stream_id: Optional[str], last_event_id: str):
+        super().__init__(200, "STREAM_TRUNCATED", f"Stream {stream_id or '(unknown)'} ended after event {last_event_id} without message.done.")
+        self.stream_id = stream_id
+        self.last_event_id = last_event_id
+
+
+class _LeaderCancelled(Exception):
+    """Set on a coalesced call's future when its leader is cancelled, so a follower takes over."""
+
+
+class UCAPIClient:
+    """
+    Long-lived, pooled async client for UCAPI.
+
+    One instance per process keeps connections warm (HTTP/2 when ``h2`` is
+    installed). Transient failures are retried with full-jitter exponential
+    backoff, honouring ``Retry-After``; non-idempotent POSTs are only resent
+    when they provably never reached the gateway or it refused them with a
+    ``Retry-After``. Identical concurrent ``chat`` calls are coalesced into
+    one request, and ``stream`` yields parsed events, resuming via
+    ``Last-Event-ID`` if the connection drops mid-stream.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        service_key: Optional[str] = None,
+        timeout: float = 30.0,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        retries: int = 3,
+        backoff_base: float = 0.25,
+        backoff_cap: float = 8.0,
+        http2: bool = True,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        base_url = base_url or os.getenv("UCAPI_URL")
+        service_key = service_key or os.getenv("UCAPI_SERVICE_KEY")
+        if not base_url:
+            raise RuntimeError("UCAPI_URL is not set.")
+        headers = {"Authorization": f"Bearer {service_key}"} if service_key else {}
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            http2=http2 and HTTP2_AVAILABLE,
+            transport=transport,
+        )
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.stats = {"requests": 0, "retries": 0, "coalesced": 0, "resumed": 0}
+
+    async def __aenter__(self) -> "UCAPIClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_cap)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def _request(self, method: str, path: str, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_errors = RETRY_ERRORS if idempotent else UNSENT_ERRORS
+        attempt = 0
+        while True:
+            self.stats["requests"] += 1
+            try:
+                resp = await self._client.request(method, path, **kwargs)
+            except retry_errors:
+                if attempt >= self.retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if resp.status_code < 400:
+                    return resp
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if idempotent:
+                    retryable = resp.status_code in RETRY_STATUSES
+                else:
+                    retryable = resp.status_code in REFUSED_STATUSES and retry_after is not None
+                if not retryable or attempt >= self.retries:
+                    raise UCAPIError.from_response(resp)
+                delay = self._backoff(attempt, retry_after)
+            attempt += 1
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _chat_payload(model: str, messages: list[dict], **options) -> dict:
+        payload = {"model": model, "messages": messages}
+        payload.update({k: v for k, v in options.items() if v is not None})
+        return payload
+
+    async def chat(
+        self,
+        model: str,
+        messages: list[dict],
+        *,
+        tools: Optional[list[dict]] = None,
+        tool_choice: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        metadata: Optional[dict] = None,
+        coalesce: bool = True,
+    ) -> dict[str, Any]:
+        """POST /v1/chat. With ``coalesce``, identical in-flight calls share one response; pass False for independent samples."""
+        payload = self._chat_payload(model, messages, tools=tools, tool_choice=tool_choice,
+                                     temperature=temperature, max_tokens=max_tokens, metadata=metadata)
+        if not coalesce:
+            return (await self._request("POST", "/v1/chat", json=payload)).json()
+
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+        while True:
+            fut = self._inflight.get(key)
+            if fut is None:
+                break
+            try:
+                result = await asyncio.shield(fut)
+            except _LeaderCancelled:
+                continue  # the first follower back here sends the request itself
+            self.stats["coalesced"] += 1
+            return result
+        fut = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = (await self._request("POST", "/v1/chat", json=payload)).json()
+        except asyncio.CancelledError:
+            # Only the leader was cancelled; its followers must not see a CancelledError
+            fut.set_exception(_LeaderCancelled())
+            fut.exception()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    async def chat_text(self, model: str, messages: list[dict], **kwargs) -> str:
+        """Convenience wrapper returning the first choice's message content."""
+        resp = await self.chat(model, messages, **kwargs)
+        return resp["choices"][0]["message"]["content"]
+
+    async def stream(
+        self,
+        model: str,
+        messages: list[dict],
+        *,
+        tools: Optional[list[dict]] = None,
+        tool_choice: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        metadata: Optional[dict] = None,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """
+        POST /v1/chat/stream, yielding each event dict until ``message.done``.
+
+        If the connection drops, or closes before ``message.done``, after the
+        stream id is known, the stream is resumed from the last event id seen,
+        so no event is lost or repeated. Raises StreamTruncated once resuming
+        is no longer possible.
+        """
+        payload = self._chat_payload(model, messages, tools=tools, tool_choice=tool_choice,
+                                     temperature=temperature, max_tokens=max_tokens, metadata=metadata)
+        async for event in self._follow(payload, None, "0"):
+            yield event
+
+    async def resume(self, stream_id: str, last_event_id: str = "0") -> AsyncIterator[dict[str, Any]]:
+        """GET /v1/chat/stream/{id}, yielding the events after ``last_event_id``; e.g. after StreamTruncated."""
+        async for event in self._follow(None, stream_id, last_event_id):
+            yield event
+
+    async def _follow(self, payload: Optional[dict], stream_id: Optional[str], last_id: str) -> AsyncIterator[dict[str, Any]]:
+        attempt = 0
+        while True:
+            if stream_id is None:
+                ctx = self._client.stream("POST", "/v1/chat/stream", json=payload)
+            else:
+                self.stats["resumed"] += 1
+                ctx = self._client.stream("GET", f"/v1/chat/stream/{stream_id}", headers={"Last-Event-ID": last_id})
+            try:
+                async with ctx as resp:
+                    if resp.status_code >= 400:
+                        await resp.aread()
+                        raise UCAPIError.from_response(resp)
+                    stream_id = resp.headers.get(STREAM_ID_HEADER, stream_id)
+                    async for sse in iter_sse(resp.aiter_lines()):
+                        if sse.id:
+                            last_id = sse.id
+                        data = sse.json()
+                        if sse.event == "error":
+                            detail = data if isinstance(data, dict) else {}
+                            raise UCAPIError(200, detail.get("type", "STREAM_ERROR"), detail.get("message", sse.data))
+                        event = data if isinstance(data, dict) else {"data": data}
+                        event.setdefault("event", sse.event)
+                        yield event
+                        if sse.event == "message.done":
+                            return
+                # A clean EOF before message.done is a truncated stream, not the end of one
+                if stream_id is None or attempt >= self.retries:
+                    raise StreamTruncated(stream_id, last_id)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if attempt >= self.retries:
+                    raise
+            except (httpx.ReadError, httpx.ReadTimeout, httpx.RemoteProtocolError):
+                # Mid-stream drops are only recoverable once the stream id is known
+                if stream_id is None or attempt >= self.retries:
+                    raise
+            attempt += 1
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt - 1))
+
+    async def models(self) -> list[dict]:
+        return (await self._request("GET", "/v1/models")).json()["data"]
+
+
+_client: Optional[UCAPIClient] = None
+
+
+def get_client(base_url: Optional[str] = None, service_key: Optional[str] = None) -> UCAPIClient:
+    """The process-wide client, created on first use."""
+    global _client
+    if _client is None:
+        _client = UCAPIClient(base_url, service_key)
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,41 @@
+import json
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional
+
+
+@dataclass
+class ServerSentEvent:
+    event: str = "message"
+    data: str = ""
+    id: Optional[str] = None
+    retry: Optional[int] = None
+
+    def json(self) -> Any:
+        return json.loads(self.data) if self.data else None
+
+
+async def iter_sse(lines: AsyncIterator[str]) -> AsyncIterator[ServerSentEvent]:
+    """Reassembles decoded SSE lines into events, per the WHATWG event-stream format."""
+    event, data, event_id, retry = None, [], None, None
+    async for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            if data or event is not None:
+                yield ServerSentEvent(event or "message", "\n".join(data), event_id, retry)
+            event, data, retry = None, [], None
+            continue
+        if line.startswith(":"):
+            continue  # comment / keep-alive
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+        elif field == "id" and "\0" not in value:
+            event_id = value
+        elif field == "retry" and value.isdigit():
+            retry = int(value)
+    if data:
+        yield ServerSentEvent(event or "message", "\n".join(data), event_id, retry)
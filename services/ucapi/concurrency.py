@@ -0,0 +1,365 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+
+import httpx
+
+# Priority classes read from ChatRequest.metadata["priority"]; lower runs first.
+PRIORITIES = {"interactive": 0, "high": 0, "normal": 1, "low": 2, "batch": 2}
+DEFAULT_PRIORITY = "normal"
+
+# Starting in-flight limits per adapter; the limiter adapts from here.
+INITIAL_LIMITS = {"openai": 16, "anthropic": 8}
+DEFAULT_INITIAL_LIMIT = 8
+
+OVERLOAD_STATUSES = {429, 503}
+
+# Client deadline, in milliseconds from receipt, via header or metadata["deadline_ms"].
+DEADLINE_HEADER = "X-UCAPI-Deadline-Ms"
+
+# Fair-share weights per SPIFFE identity, e.g. {"spiffe://dreamaware.ai/slack": 4}; default 1.
+TENANT_WEIGHTS: dict[str, float] = json.loads(os.getenv("UCAPI_TENANT_WEIGHTS", "{}"))
+DEFAULT_TENANT = "anonymous"
+
+
+class UpstreamSaturated(RuntimeError):
+    """Raised when a provider's wait queue is full and the request cannot be admitted."""
+
+
+class DeadlineUnmeetable(UpstreamSaturated):
+    """Raised when the estimated queue wait plus service time overruns the client's deadline."""
+
+
+def priority_of(metadata: Optional[dict], default: str = DEFAULT_PRIORITY) -> int:
+    name = str((metadata or {}).get("priority", default)).lower()
+    return PRIORITIES.get(name, PRIORITIES[DEFAULT_PRIORITY])
+
+
+def weight_of(tenant: str) -> float:
+    return max(float(TENANT_WEIGHTS.get(tenant, 1.0)), 1e-6)
+
+
+def deadline_from(headers: Optional[Any], metadata: Optional[dict]) -> Optional[float]:
+    """Returns the client's deadline as a ``time.monotonic()`` instant, if one was given."""
+    raw = headers.get(DEADLINE_HEADER) if headers is not None else None
+    if raw is None:
+        raw = (metadata or {}).get("deadline_ms")
+    try:
+        ms = float(raw)
+    except (TypeError, ValueError):
+        return None
+    return time.monotonic() + ms / 1000.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header given either as delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_failure(exc: BaseException) -> tuple[bool, Optional[float]]:
+    """Returns (overloaded, retry_after_seconds) for an upstream exception."""
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code in OVERLOAD_STATUSES:
+        return True, parse_retry_after(exc.response.headers.get("retry-after"))
+    if isinstance(exc, httpx.TimeoutException):
+        return True, None
+    return False, None
+
+
+class _Waiter:
+    __slots__ = ("fut", "enqueued", "deadline", "tenant")
+
+    def __init__(self, fut: asyncio.Future, deadline: Optional[float], tenant: str):
+        self.fut = fut
+        self.enqueued = time.monotonic()
+        self.deadline = deadline
+        self.tenant = tenant
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency controller for one upstream provider.
+
+    Every successful call made while the limit was (nearly) fully used grows
+    it by ``1/limit`` (about one slot per window of completions), so quiet
+    periods cannot inflate it; an overload signal (429/503 or timeout)
+    halves it, at most once per ``decrease_cooldown`` so a burst of throttled
+    responses counts as one congestion event. Requests beyond the limit wait in
+    a priority queue, and a ``Retry-After`` pauses dispatch for every request to
+    the provider rather than just the one that received it.
+
+    The queue is managed CoDel-style: once queueing delay has stayed above
+    ``codel_target`` for ``codel_interval``, waiters are shed at a rate that
+    grows with the square root of the drop count until delay recovers. Waiters
+    whose deadline can no longer be met are shed on dequeue, before they spend
+    provider budget.
+
+    Within a priority class, slots are shared across tenants (SPIFFE
+    identities) by start-time fair queuing: each request is tagged with its
+    tenant's virtual finish time, advanced by ``1/weight`` per request, so a
+    noisy identity only delays itself while idle capacity stays usable by all.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = DEFAULT_INITIAL_LIMIT,
+        min_limit: float = 1.0,
+        max_limit: float = 256.0,
+        backoff: float = 0.5,
+        decrease_cooldown: float = 1.0,
+        max_queue: int = 1000,
+        codel_target: float = 0.1,
+        codel_interval: float = 0.5,
+        service_alpha: float = 0.2,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.decrease_cooldown = decrease_cooldown
+        self.max_queue = max_queue
+        self.codel_target = codel_target
+        self.codel_interval = codel_interval
+        self.service_alpha = service_alpha
+        self.service_time: Optional[float] = None  # EWMA of slot hold time, seconds
+        self.in_flight = 0
+        self._waiters: list[tuple[int, float, int, _Waiter]] = []  # (priority, fair tag, seq, waiter)
+        self._vtime = 0.0
+        self._finish: dict[str, float] = {}  # tenant -> virtual finish tag of its last request
+        self.tenants: dict[str, dict[str, float]] = {}
+        self._first_above = 0.0
+        self._dropping = False
+        self._drop_count = 0
+        self._drop_next = 0.0
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._wake: Optional[asyncio.TimerHandle] = None
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "shed": 0, "succeeded": 0, "throttled": 0}
+
+    def _can_dispatch(self) -> bool:
+        return self.in_flight < max(1, int(self.limit)) and time.monotonic() >= self._paused_until
+
+    def estimate_wait(self, priority: int = PRIORITIES[DEFAULT_PRIORITY]) -> float:
+        """Seconds a new request of this priority would likely queue, from live service times."""
+        paused = max(0.0, self._paused_until - time.monotonic())
+        if self.service_time is None:
+            return paused
+        limit = max(1, int(self.limit))
+        ahead = sum(1 for p, _, _, w in self._waiters if p <= priority and not w.fut.done())
+        free = limit - self.in_flight
+        if ahead < free:
+            return paused
+        return paused + ((ahead - free) // limit + 1) * self.service_time
+
+    def can_meet(self, priority: int, deadline: Optional[float]) -> bool:
+        if deadline is None:
+            return True
+        return time.monotonic() + self.estimate_wait(priority) + (self.service_time or 0.0) <= deadline
+
+    def observe(self, seconds: float) -> None:
+        if self.service_time is None:
+            self.service_time = seconds
+        else:
+            self.service_time += self.service_alpha * (seconds - self.service_time)
+
+    def _fair_tag(self, tenant: str) -> float:
+        start = max(self._vtime, self._finish.get(tenant, 0.0))
+        self._finish[tenant] = start + 1.0 / weight_of(tenant)
+        return start
+
+    def _tenant(self, tenant: str) -> dict[str, float]:
+        t = self.tenants.get(tenant)
+        if t is None:
+            t = self.tenants[tenant] = {"admitted": 0, "queued": 0, "shed": 0, "wait_seconds": 0.0, "max_wait": 0.0}
+        return t
+
+    async def acquire(
+        self,
+        priority: int = PRIORITIES[DEFAULT_PRIORITY],
+        deadline: Optional[float] = None,
+        tenant: str = DEFAULT_TENANT,
+    ) -> None:
+        if not self._waiters and self._can_dispatch():
+            self._vtime = self._fair_tag(tenant)
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            self._tenant(tenant)["admitted"] += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise UpstreamSaturated(f"Upstream '{self.name}' queue is full ({self.max_queue} waiting).")
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), deadline, tenant)
+        heapq.heappush(self._waiters, (priority, self._fair_tag(tenant), next(self._seq), waiter))
+        self.stats["queued"] += 1
+        self._tenant(tenant)["queued"] += 1
+        self._schedule_wake()
+        try:
+            await waiter.fut
+        except asyncio.CancelledError:
+            if waiter.fut.done() and not waiter.fut.cancelled():
+                self._release_slot()  # granted just as the caller went away
+            raise
+        self.stats["admitted"] += 1
+
+    def release(self, overloaded: bool = False, retry_after: Optional[float] = None) -> None:
+        now = time.monotonic()
+        if overloaded:
+            self.stats["throttled"] += 1
+            if now - self._last_decrease >= self.decrease_cooldown:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+        else:
+            self.stats["succeeded"] += 1
+            # Only a success at (near) full utilisation shows the limit can go higher
+            if self.in_flight >= self.limit - 1:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._waiters and self._can_dispatch():
+            _, tag, _, waiter = heapq.heappop(self._waiters)
+            if waiter.fut.done():  # waiter was cancelled while queued
+                continue
+            now = time.monotonic()
+            sojourn = now - waiter.enqueued
+            tenant = self._tenant(waiter.tenant)
+            reason = self._shed_reason(now, sojourn, waiter.deadline)
+            if reason is not None:
+                self.stats["shed"] += 1
+                tenant["shed"] += 1
+                waiter.fut.set_exception(reason)
+                continue
+            self._vtime = max(self._vtime, tag)
+            tenant["admitted"] += 1
+            tenant["wait_seconds"] += sojourn
+            tenant["max_wait"] = max(tenant["max_wait"], sojourn)
+            self.in_flight += 1
+            waiter.fut.set_result(None)
+        if not self._waiters:
+            self._first_above = 0.0
+            self._dropping = False
+            # Idle tenants' tags are behind virtual time and no longer matter
+            self._finish = {t: f for t, f in self._finish.items() if f > self._vtime}
+        self._schedule_wake()
+
+    def _shed_reason(self, now: float, sojourn: float, deadline: Optional[float]) -> Optional[UpstreamSaturated]:
+        if deadline is not None and now + (self.service_time or 0.0) > deadline:
+            return DeadlineUnmeetable(f"Deadline cannot be met by upstream '{self.name}'.")
+        if sojourn < self.codel_target:
+            self._first_above = 0.0
+            self._dropping = False
+            return None
+        if not self._dropping:
+            if self._first_above == 0.0:
+                self._first_above = now + self.codel_interval
+                return None
+            if now < self._first_above:
+                return None
+            self._dropping = True
+            self._drop_count = 0
+        elif now < self._drop_next:
+            return None
+        self._drop_count += 1
+        self._drop_next = now + self.codel_interval / math.sqrt(self._drop_count)
+        return UpstreamSaturated(f"Upstream '{self.name}' queue delay {sojourn * 1000:.0f}ms is over target.")
+
+    def _schedule_wake(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if self._waiters and delay > 0:
+            if self._wake is not None:
+                self._wake.cancel()
+            self._wake = asyncio.get_running_loop().call_later(delay, self._on_wake)
+
+    def _on_wake(self) -> None:
+        self._wake = None
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: int = PRIORITIES[DEFAULT_PRIORITY],
+        deadline: Optional[float] = None,
+        tenant: str = DEFAULT_TENANT,
+    ):
+        """Holds one upstream slot for the duration of the block, feeding the outcome back."""
+        await self.acquire(priority, deadline, tenant)
+        start = time.monotonic()
+        try:
+            yield self
+        except asyncio.CancelledError:
+            self._release_slot()  # caller went away; says nothing about upstream capacity
+            raise
+        except BaseException as e:
+            overloaded, retry_after = classify_failure(e)
+            if overloaded:
+                self.release(True, retry_after)
+            else:
+                self._release_slot()  # e.g. a 400 or a bug: neither success nor congestion
+            raise
+        else:
+            self.observe(time.monotonic() - start)
+            self.release()
+
+    def tenant_snapshot(self) -> dict[str, dict[str, Any]]:
+        queued: dict[str, int] = {}
+        for _, _, _, w in self._waiters:
+            if not w.fut.done():
+                queued[w.tenant] = queued.get(w.tenant, 0) + 1
+        out = {}
+        for name, t in self.tenants.items():
+            waited = t["queued"] - t["shed"]
+            out[name] = {
+                "weight": weight_of(name),
+                "waiting": queued.get(name, 0),
+                "admitted": t["admitted"],
+                "shed": t["shed"],
+                "avg_wait_ms": round(1000 * t["wait_seconds"] / waited, 1) if waited else 0.0,
+                "max_wait_ms": round(1000 * t["max_wait"], 1),
+            }
+        return out
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": sum(1 for _, _, _, w in self._waiters if not w.fut.done()),
+            "service_ms": round(1000 * self.service_time, 1) if self.service_time is not None else None,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            **self.stats,
+            "tenants": self.tenant_snapshot(),
+        }
+
+
+LIMITERS: dict[str, AdaptiveLimiter] = {}
+
+
+def limiter_for(adapter_name: str) -> AdaptiveLimiter:
+    limiter = LIMITERS.get(adapter_name)
+    if limiter is None:
+        limiter = AdaptiveLimiter(adapter_name, INITIAL_LIMITS.get(adapter_name, DEFAULT_INITIAL_LIMIT))
+        LIMITERS[adapter_name] = limiter
+    return limiter
@@ -1,21 +1,152 @@
 import asyncio
 import json
+import os
 import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 
-from .router import resolve, REGISTRY
-from .schemas import ChatRequest, ErrorResponse, ErrorDetail
-from .security import check_egress, estimate_and_reserve_budget, audit_event
+from .router import resolve
+from .registry import REGISTRY_DSN_ENV, CockroachRegistrySource, current, poll_once, run_poller
+from .schemas import ChatRequest, BatchChatRequest, ErrorResponse, ErrorDetail
+from .security import check_egress, estimate_and_reserve_budget, refund_budget, audit_event
+from .cancellation import CANCELLATIONS, CLIENT_CLOSED_STATUS, ClientDisconnected, CompletionMeter, run_until_disconnect, unused_reservation
+from .normalized import normalize
+from .concurrency import LIMITERS, DeadlineUnmeetable, UpstreamSaturated, deadline_from, limiter_for, priority_of
+from .semantic_cache import SEMANTIC_CACHE, wants_semantic_cache
+from .offline import DEFERRED, CallbackRejected, DeferredResult, wants_deferred
+from .streams import STREAM_ID_HEADER, STREAMS, ReplayUnavailable, StreamBuffer, parse_last_event_id
 from services.auth.spire_validator import verify_spiffe_identity
 
 
-app = FastAPI(title="UCAPI")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Loads the DB-backed registry, when configured, and keeps it fresh in the background."""
+    dsn = os.getenv(REGISTRY_DSN_ENV)
+    if not dsn:
+        yield
+        return
+    source = CockroachRegistrySource(dsn)
+    try:
+        await poll_once(source)
+    except Exception as e:
+        print(f"Initial registry load failed, serving static routes: {e}")
+    poller = asyncio.create_task(run_poller(source))
+    try:
+        yield
+    finally:
+        poller.cancel()
+        await source.close()
+
+
+app = FastAPI(title="UCAPI", lifespan=lifespan)
+
+# Max in-flight upstream calls per provider within one batch.
+BATCH_CONCURRENCY = {"openai": 8, "anthropic": 4}
+DEFAULT_BATCH_CONCURRENCY = 4
+
+def admit(model_alias: str, priority: int, deadline: float | None):
+    """
+    Resolves an alias and checks it can finish before the client's deadline.
+
+    If the primary route's estimated queue wait plus service time overruns the
+    deadline, the registry's ``fallback`` alias is tried instead. Raises
+    DeadlineUnmeetable when neither fits, so the request fails fast before any
+    budget is reserved.
+    """
+    adapter, provider_model = resolve(model_alias)
+    if limiter_for(adapter.name).can_meet(priority, deadline):
+        return model_alias, adapter, provider_model
+    fallback = current().routes.get(model_alias, {}).get("fallback")
+    if fallback:
+        fb_adapter, fb_model = resolve(fallback)
+        if limiter_for(fb_adapter.name).can_meet(priority, deadline):
+            return fallback, fb_adapter, fb_model
+    limiter_for(adapter.name).stats["shed"] += 1
+    raise DeadlineUnmeetable(f"'{model_alias}' cannot complete within the requested deadline.")
+
+
+async def cancelled(endpoint: str, ident: dict, nreq, started: bool, completion_tokens: int = 0) -> None:
+    """Refunds and records an upstream call abandoned by its client."""
+    saved = unused_reservation(nreq.prompt_tokens, nreq.max_tokens, started, completion_tokens)
+    if saved:
+        await refund_budget(nreq.job_id, nreq.model, saved)
+    CANCELLATIONS.record(endpoint, saved, started)
+    await audit_event(f"ucapi_{endpoint}_cancelled", ident["sub"], {
+        "job_id": nreq.job_id,
+        "model": nreq.model,
+        "request_hash": nreq.content_hash,
+        "reached_upstream": started,
+        "completion_tokens": completion_tokens,
+        "tokens_saved": saved,
+    })
+
+
+async def vet_callback(ident: dict, url: str) -> None:
+    """Checks a deferred callback URL (public address, allowlisted host) and its egress; raises CallbackRejected."""
+    host = await asyncio.to_thread(DEFERRED.check_callback, url)
+    await check_egress(service_spiffe=ident["sub"], host=host)
+
+
+def enqueue_deferred(ident: dict, nreq, adapter, provider_model: str, callback_url: str | None = None) -> DeferredResult:
+    """
+    Hands a gated request to the offline batch queue instead of calling the provider now.
+
+    ``callback_url`` must already have passed ``vet_callback``. The full
+    reservation travels with the request so a failed batch can refund it.
+    """
+    body = adapter.payload(provider_model, nreq.messages, nreq.tools, nreq.tool_choice, nreq.params)
+    reserved = unused_reservation(nreq.prompt_tokens, nreq.max_tokens, started=False)
+    return DEFERRED.enqueue(adapter.name, ident["sub"], nreq.job_id, nreq.model, body, callback_url, reserved)
+
+
+def overload_error(e: UpstreamSaturated) -> ErrorResponse:
+    kind = "DEADLINE_UNMEETABLE" if isinstance(e, DeadlineUnmeetable) else "UPSTREAM_SATURATED"
+    return ErrorResponse(error=ErrorDetail(type=kind, message=str(e)))
+
+
+def overloaded_response(e: UpstreamSaturated) -> JSONResponse:
+    """503 for a request shed before it reached the provider; Retry-After tells clients it is safe to resend."""
+    return JSONResponse(status_code=503, content=overload_error(e).model_dump(), headers={"Retry-After": "1"})
+
 
 @app.get("/v1/models")
 async def models(_: dict = Depends(verify_spiffe_identity)):
     """Lists the available models in the registry."""
-    return {"data": [{"id": k, **v} for k, v in REGISTRY.items()]}
+    snap = current()
+    return Response(content=snap.models_body, media_type="application/json", headers={"ETag": f'"{snap.etag}"'})
+
+@app.get("/v1/upstreams")
+async def upstreams(_: dict = Depends(verify_spiffe_identity)):
+    """Reports the adaptive concurrency state of each provider, and calls cancelled on disconnect."""
+    return {
+        "data": {name: limiter.snapshot() for name, limiter in LIMITERS.items()},
+        "cancellations": CANCELLATIONS.snapshot(),
+    }
+
+@app.get("/v1/cache/semantic")
+async def semantic_cache_stats(_: dict = Depends(verify_spiffe_identity)):
+    """Reports semantic cache hit rate, lookup latency and sampled hit scores (prompt digests only) for false-hit review."""
+    return SEMANTIC_CACHE.snapshot()
+
+@app.get("/v1/streams")
+async def stream_stats(_: dict = Depends(verify_spiffe_identity)):
+    """Reports resumable stream buffers: active, buffered, subscribers and resumes."""
+    return STREAMS.snapshot()
+
+@app.get("/v1/deferred")
+async def deferred_stats(_: dict = Depends(verify_spiffe_identity)):
+    """Reports offline batch throughput: queued, submitted and completed requests, batch size, turnaround."""
+    return DEFERRED.snapshot()
+
+@app.get("/v1/deferred/{result_id}")
+async def deferred_result(result_id: str, ident: dict = Depends(verify_spiffe_identity)):
+    """Returns a deferred request's status, and its response once the batch has completed."""
+    result = DEFERRED.get(result_id, ident["sub"])
+    if result is None:
+        error = ErrorResponse(error=ErrorDetail(type="NOT_FOUND", message=f"Deferred request '{result_id}' not found."))
+        return JSONResponse(status_code=404, content=error.model_dump())
+    return result.public()
 
 @app.post("/v1/chat", response_model_exclude_none=True)
 async def chat(
@@ -24,101 +155,281 @@ async def chat(
     req: Request = None
 ):
     """Handles non-streaming chat requests."""
-    job_id = (body.metadata or {}).get("job_id", "unknown")
-
+    priority = priority_of(body.metadata)
+    deadline = deadline_from(req.headers if req is not None else None, body.metadata)
     try:
-        adapter, provider_model = resolve(body.model)
+        model, adapter, provider_model = admit(body.model, priority, deadline)
+        nreq = normalize(body, model=model)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamSaturated as e:
+        return overloaded_response(e)
+    job_id = nreq.job_id
+    deferred = wants_deferred(nreq.metadata)
+    if deferred and not DEFERRED.accepts(adapter.name):
+        raise HTTPException(status_code=400, detail=f"Provider '{adapter.name}' does not support deferred requests.")
+    callback_url = nreq.metadata.get("callback_url") if deferred else None
+    if callback_url:
+        try:
+            await vet_callback(ident, callback_url)
+        except CallbackRejected as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    probe = None
+    if wants_semantic_cache(nreq.metadata) and not nreq.tools:
+        probe = await SEMANTIC_CACHE.lookup(ident["sub"], nreq.model, nreq.messages, nreq.shape_params)
+        if probe is not None and probe.response is not None:
+            await audit_event("ucapi_chat_cache_hit", ident["sub"], {"job_id": job_id, "model": nreq.model, "request_hash": nreq.content_hash, "score": probe.score})
+            return JSONResponse(probe.response, headers={"X-UCAPI-Cache": "semantic", "X-UCAPI-Cache-Score": f"{probe.score:.4f}"})
 
     # --- Zero-Trust Gates ---
     await check_egress(service_spiffe=ident["sub"], host=f"api.{adapter.name}.com")
-    await estimate_and_reserve_budget(job_id, body.model, body.model_dump())
+    await estimate_and_reserve_budget(job_id, nreq.model, nreq.budget_params)
     # ------------------------
 
+    if deferred:
+        result = enqueue_deferred(ident, nreq, adapter, provider_model, callback_url)
+        await audit_event("ucapi_chat_deferred", ident["sub"], {"job_id": job_id, "model": nreq.model, "request_hash": nreq.content_hash, "deferred_id": result.id})
+        return JSONResponse(status_code=202, content=result.public())
+
+    started = False
+
+    async def call_upstream():
+        nonlocal started
+        async with limiter_for(adapter.name).slot(priority, deadline, tenant=ident["sub"]):
+            started = True
+            return await adapter.chat(
+                provider_model,
+                nreq.messages,
+                nreq.tools,
+                nreq.tool_choice,
+                nreq.params,
+                stream=False,
+            )
+
     try:
-        params = {
-            "temperature": body.temperature,
-            "max_tokens": body.max_tokens,
-        }
-        resp = await adapter.chat(
-            provider_model,
-            [msg.model_dump() for msg in body.messages],
-            [tool.model_dump() for tool in body.tools] if body.tools else None,
-            body.tool_choice,
-            params,
-            stream=False,
-        )
-        await audit_event("ucapi_chat", ident["sub"], {"job_id": job_id, "model": body.model, "usage": resp.get("usage")})
+        resp = await run_until_disconnect(req, call_upstream())
+        if probe is not None:
+            SEMANTIC_CACHE.store(probe, resp)
+        await audit_event("ucapi_chat", ident["sub"], {"job_id": job_id, "model": nreq.model, "request_hash": nreq.content_hash, "usage": resp.get("usage")})
         return JSONResponse(resp)
+    except ClientDisconnected:
+        await cancelled("chat", ident, nreq, started)
+        return Response(status_code=CLIENT_CLOSED_STATUS)
+    except UpstreamSaturated as e:
+        return overloaded_response(e)
     except Exception as e:
         error = ErrorResponse(error=ErrorDetail(type="PROVIDER_ERROR", message=str(e)))
         return JSONResponse(status_code=502, content=error.model_dump())
 
 
 @app.post("/v1/chat/stream")
-async def chat_stream(body: ChatRequest, ident: dict = Depends(verify_spiffe_identity)):
-    """Handles streaming chat requests using Server-Sent Events."""
-    job_id = (body.metadata or {}).get("job_id", "unknown")
+async def chat_stream(body: ChatRequest, ident: dict = Depends(verify_spiffe_identity), req: Request = None):
+    """
+    Handles streaming chat requests using Server-Sent Events.
 
+    The upstream call runs detached from this response and its events are
+    buffered under the stream id returned in ``X-UCAPI-Stream-Id``, so a
+    dropped client can resume via ``GET /v1/chat/stream/{id}``.
+    """
+    priority = priority_of(body.metadata)
+    deadline = deadline_from(req.headers if req is not None else None, body.metadata)
     try:
-        adapter, provider_model = resolve(body.model)
+        model, adapter, provider_model = admit(body.model, priority, deadline)
+        nreq = normalize(body, model=model)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except UpstreamSaturated as e:
+        return overloaded_response(e)
+    job_id = nreq.job_id
+
+    # --- Zero-Trust Gates ---
+    await check_egress(service_spiffe=ident["sub"], host=f"api.{adapter.name}.com")
+    await estimate_and_reserve_budget(job_id, nreq.model, nreq.budget_params)
+    # ------------------------
 
-    async def event_generator():
-        q = asyncio.Queue()
+    meter = CompletionMeter()
+    started = False
 
-        def push_to_queue(event: dict):
-            q.put_nowait(event)
+    async def stream_adapter(buf: StreamBuffer):
+        nonlocal started
 
-        # --- Zero-Trust Gates ---
-        await check_egress(service_spiffe=ident["sub"], host=f"api.{adapter.name}.com")
-        await estimate_and_reserve_budget(job_id, body.model, body.model_dump())
-        # ------------------------
+        def publish(event: dict):
+            meter.observe(event)
+            buf.publish(event)
 
-        async def stream_adapter():
-            try:
-                params = {
-                    "temperature": body.temperature,
-                    "max_tokens": body.max_tokens,
-                }
+        try:
+            # The upstream slot is held until the stream has been fully drained
+            async with limiter_for(adapter.name).slot(priority, deadline, tenant=ident["sub"]):
+                started = True
                 # The adapter's chat method returns an async generator for streaming
                 streamer = await adapter.chat(
                     provider_model,
-                    [msg.model_dump() for msg in body.messages],
-                    [tool.model_dump() for tool in body.tools] if body.tools else None,
-                    body.tool_choice,
-                    params,
+                    nreq.messages,
+                    nreq.tools,
+                    nreq.tool_choice,
+                    nreq.params,
                     stream=True,
-                    stream_cb=push_to_queue,
+                    stream_cb=publish,
                 )
                 # We need to iterate over the generator to drive it
                 async for _ in streamer:
                     pass
-            except Exception as e:
-                error_event = {"event": "error", "data": {"type": "PROVIDER_ERROR", "message": str(e)}}
-                push_to_queue(error_event)
+        except asyncio.CancelledError:
+            # Every subscriber left and the grace period ran out
+            await cancelled("stream", ident, nreq, started, meter.tokens)
+            raise
+        except UpstreamSaturated as e:
+            buf.publish({"event": "error", "data": overload_error(e).error.model_dump(exclude_none=True)})
+        except Exception as e:
+            buf.publish({"event": "error", "data": {"type": "PROVIDER_ERROR", "message": str(e)}})
+        finally:
+            await audit_event("ucapi_stream_done", ident["sub"], {"job_id": job_id, "model": nreq.model, "request_hash": nreq.content_hash, "stream_id": buf.id, "events": buf.last_seq})
+
+    buf = STREAMS.open(ident["sub"], stream_adapter)
+    return StreamingResponse(STREAMS.subscribe(buf), media_type="text/event-stream", headers={STREAM_ID_HEADER: buf.id})
+
+
+@app.get("/v1/chat/stream/{stream_id}")
+async def chat_stream_resume(stream_id: str, ident: dict = Depends(verify_spiffe_identity), req: Request = None):
+    """Replays a stream after ``Last-Event-ID`` and follows it live; any number of subscribers may attach."""
+    after = parse_last_event_id(req.headers.get("Last-Event-ID") if req is not None else None)
+    try:
+        buf = STREAMS.get(stream_id, ident["sub"], after)
+    except ReplayUnavailable as e:
+        error = ErrorResponse(error=ErrorDetail(type="STREAM_UNAVAILABLE", message=str(e)))
+        return JSONResponse(status_code=404, content=error.model_dump())
+    return StreamingResponse(STREAMS.subscribe(buf, after), media_type="text/event-stream", headers={STREAM_ID_HEADER: buf.id})
+
+
+@app.post("/v1/chat/batch")
+async def chat_batch(body: BatchChatRequest, ident: dict = Depends(verify_spiffe_identity), req: Request = None):
+    """
+    Runs many independent chat requests and streams results back as NDJSON.
+
+    Each line carries the item's stable id (``metadata.custom_id`` or its index)
+    and is emitted in completion order. Egress and budget gates run once per
+    batch rather than once per item. A deadline header applies to every item
+    that does not set its own ``metadata.deadline_ms``.
+
+    With ``metadata.deferred`` the items go to the offline batch queue
+    instead, and the response is a 202 listing each item's deferred id.
+    """
+    job_id = (body.metadata or {}).get("job_id", "unknown")
+    deferred = wants_deferred(body.metadata)
+    batch_deadline = deadline_from(req.headers if req is not None else None, None)
+    ready: list[dict] = []
+    work: list[tuple] = []
+    reservations: dict[str, dict] = {}
+    callbacks: dict[int, str] = {}
+    batch_callback = (body.metadata or {}).get("callback_url") if deferred else None
+    if batch_callback:
+        try:
+            await vet_callback(ident, batch_callback)
+        except CallbackRejected as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    for index, item in enumerate(body.requests):
+        item_id = str((item.metadata or {}).get("custom_id", index))
+        priority = priority_of(item.metadata, default="batch")
+        deadline = deadline_from(None, item.metadata) or batch_deadline
+        try:
+            model, adapter, provider_model = admit(item.model, priority, deadline)
+            nreq = normalize(item, model=model)
+        except ValueError as e:
+            error = ErrorResponse(error=ErrorDetail(type="INVALID_REQUEST", message=str(e)))
+            ready.append({"id": item_id, "index": index, "status": 400, **error.model_dump()})
+            continue
+        except UpstreamSaturated as e:
+            ready.append({"id": item_id, "index": index, "status": 503, **overload_error(e).model_dump()})
+            continue
+        if deferred and not DEFERRED.accepts(adapter.name):
+            error = ErrorResponse(error=ErrorDetail(type="INVALID_REQUEST", message=f"Provider '{adapter.name}' does not support deferred requests."))
+            ready.append({"id": item_id, "index": index, "status": 400, **error.model_dump()})
+            continue
+        if deferred:
+            item_callback = (item.metadata or {}).get("callback_url")
+            if item_callback and item_callback != batch_callback:
+                try:
+                    await vet_callback(ident, item_callback)
+                except CallbackRejected as e:
+                    error = ErrorResponse(error=ErrorDetail(type="INVALID_REQUEST", message=str(e)))
+                    ready.append({"id": item_id, "index": index, "status": 400, **error.model_dump()})
+                    continue
+            if item_callback or batch_callback:
+                callbacks[index] = item_callback or batch_callback
+        work.append((item_id, index, nreq, adapter, provider_model, priority, deadline))
+        r = reservations.setdefault(nreq.model, {"prompt_tokens": 0, "max_tokens": 0, "requests": 0})
+        r["prompt_tokens"] += nreq.prompt_tokens
+        r["max_tokens"] += nreq.max_tokens or 0
+        r["requests"] += 1
+
+    # --- Zero-Trust Gates (once per batch) ---
+    for host in sorted({f"api.{w[3].name}.com" for w in work}):
+        await check_egress(service_spiffe=ident["sub"], host=host)
+    for alias, params in reservations.items():
+        await estimate_and_reserve_budget(job_id, alias, params)
+    # ------------------------------------------
+
+    if deferred:
+        lines = list(ready)
+        for item_id, index, nreq, adapter, provider_model, *_ in work:
+            result = enqueue_deferred(ident, nreq, adapter, provider_model, callbacks.get(index))
+            lines.append({"id": item_id, "index": index, "status": 202, "deferred": result.public()})
+        await audit_event("ucapi_chat_batch_deferred", ident["sub"], {
+            "job_id": job_id,
+            "requests": len(body.requests),
+            "rejected": len(ready),
+            "models": sorted(reservations),
+        })
+        return JSONResponse(status_code=202, content={"data": sorted(lines, key=lambda line: line["index"])})
+
+    async def ndjson_generator():
+        q: asyncio.Queue = asyncio.Queue()
+        limits = {
+            name: asyncio.Semaphore(BATCH_CONCURRENCY.get(name, DEFAULT_BATCH_CONCURRENCY))
+            for name in {w[3].name for w in work}
+        }
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-        # Run the adapter streaming in a background task
-        task = asyncio.create_task(stream_adapter())
+        async def run(item_id, index, nreq, adapter, provider_model, priority, deadline):
+            async with limits[adapter.name]:
+                try:
+                    # Batch items yield to interactive traffic unless they ask otherwise
+                    async with limiter_for(adapter.name).slot(priority, deadline, tenant=ident["sub"]):
+                        resp = await adapter.chat(
+                            provider_model,
+                            nreq.messages,
+                            nreq.tools,
+                            nreq.tool_choice,
+                            nreq.params,
+                            stream=False,
+                        )
+                    for k, v in (resp.get("usage") or {}).items():
+                        if k in usage:
+                            usage[k] += v
+                    q.put_nowait({"id": item_id, "index": index, "status": 200, "response": resp})
+                except UpstreamSaturated as e:
+                    q.put_nowait({"id": item_id, "index": index, "status": 503, **overload_error(e).model_dump()})
+                except Exception as e:
+                    error = ErrorResponse(error=ErrorDetail(type="PROVIDER_ERROR", message=str(e)))
+                    q.put_nowait({"id": item_id, "index": index, "status": 502, **error.model_dump()})
 
+        tasks = [asyncio.create_task(run(*w)) for w in work]
         try:
-            while True:
-                event = await q.get()
-                if event.get("event") == "error":
-                    yield f"event: error\n"
-                    yield f"data: {json.dumps(event.get('data'))}\n\n"
-                    break
-                if event.get("event") == "message.done":
-                    yield f"event: message.done\n"
-                    yield f"data: {json.dumps(event)}\n\n"
-                    break
-
-                yield f"event: {event.get('event', 'message')}\n"
-                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            for line in ready:
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            for _ in tasks:
+                yield json.dumps(await q.get(), ensure_ascii=False) + "\n"
         finally:
-            task.cancel()
-            await audit_event("ucapi_stream_done", ident["sub"], {"job_id": job_id, "model": body.model})
+            for task in tasks:
+                task.cancel()
+            await audit_event("ucapi_chat_batch", ident["sub"], {
+                "job_id": job_id,
+                "requests": len(body.requests),
+                "rejected": len(ready),
+                "models": sorted(reservations),
+                "usage": usage,
+            })
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
\ No newline at end of file
+    return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
@@ -0,0 +1,98 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Mapping, Optional
+
+from .schemas import ChatRequest
+from .tokens import fit_to_window
+
+
+@dataclass(frozen=True)
+class NormalizedRequest:
+    """
+    A ChatRequest dumped once and shared by every stage of the pipeline.
+
+    The budget gate, semantic cache, adapter call and audit event all read the
+    same message and tool dicts instead of re-serializing the pydantic model.
+    Canonical bytes and the content hash are computed on first use and cached.
+    Treat the contained dicts as read-only.
+    """
+    model: str
+    messages: tuple[dict, ...]
+    tools: Optional[tuple[dict, ...]]
+    tool_choice: Optional[str]
+    temperature: Optional[float]
+    max_tokens: Optional[int]
+    metadata: Mapping[str, Any]
+    prompt_tokens: int
+
+    @property
+    def job_id(self) -> str:
+        return self.metadata.get("job_id", "unknown")
+
+    @cached_property
+    def params(self) -> dict:
+        return {"temperature": self.temperature, "max_tokens": self.max_tokens}
+
+    @cached_property
+    def shape_params(self) -> dict:
+        """Everything besides the messages that shapes the completion; part of the semantic cache key."""
+        return {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "tool_choice": self.tool_choice,
+            "tools": self.tools,
+        }
+
+    @cached_property
+    def budget_params(self) -> dict:
+        return {
+            "model": self.model,
+            "messages": self.messages,
+            "tools": self.tools,
+            "max_tokens": self.max_tokens,
+            "prompt_tokens": self.prompt_tokens,
+        }
+
+    @cached_property
+    def canonical(self) -> bytes:
+        """Sorted-key, whitespace-free JSON of everything that determines the completion."""
+        return json.dumps(
+            {
+                "model": self.model,
+                "messages": self.messages,
+                "tools": self.tools,
+                "tool_choice": self.tool_choice,
+                "temperature": self.temperature,
+                "max_tokens": self.max_tokens,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+    @cached_property
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.canonical).hexdigest()
+
+
+def normalize(body: ChatRequest, model: Optional[str] = None) -> NormalizedRequest:
+    """Dumps the request once and fits its history to the alias's context window.
+
+    ``model`` overrides the requested alias, e.g. after a deadline downgrade.
+    Raises ValueError if the prompt cannot fit.
+    """
+    data = body.model_dump()
+    model = model or data["model"]
+    messages, prompt_tokens = fit_to_window(model, data["messages"], data["max_tokens"], tools=data["tools"])
+    return NormalizedRequest(
+        model=model,
+        messages=tuple(messages),
+        tools=tuple(data["tools"]) if data["tools"] else None,
+        tool_choice=data["tool_choice"],
+        temperature=data["temperature"],
+        max_tokens=data["max_tokens"],
+        metadata=data["metadata"] or {},
+        prompt_tokens=prompt_tokens,
+    )
@@ -0,0 +1,472 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Optional, Protocol
+from urllib.parse import urlsplit
+
+import httpx
+
+from .security import refund_budget
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_REQUESTS = int(os.getenv("UCAPI_BATCH_MAX_REQUESTS", "50000"))
+MAX_BATCH_BYTES = int(os.getenv("UCAPI_BATCH_MAX_BYTES", str(100 * 2**20)))
+FLUSH_SECONDS = float(os.getenv("UCAPI_BATCH_FLUSH_SECONDS", "60"))
+POLL_SECONDS = float(os.getenv("UCAPI_BATCH_POLL_SECONDS", "30"))
+RESULT_RETENTION = int(os.getenv("UCAPI_BATCH_RESULT_RETENTION", "100000"))
+BATCH_BACKEND_ENV = "UCAPI_BATCH_BACKEND"
+# Comma-separated hosts that deferred results may be POSTed to; unset allows any public host
+CALLBACK_HOSTS_ENV = "UCAPI_CALLBACK_HOSTS"
+
+# Provider batch states after which no more output will appear
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+def wants_deferred(metadata: Optional[dict]) -> bool:
+    """Offline batching is opt-in via ``metadata.deferred``; it trades latency for batch pricing."""
+    return bool((metadata or {}).get("deferred"))
+
+
+class BatchFailed(RuntimeError):
+    """The provider rejected or gave up on a batch without producing output."""
+
+
+class CallbackRejected(ValueError):
+    """A callback URL is malformed, not allowlisted, or resolves to a non-public address."""
+
+
+def resolve_host(host: str) -> list[str]:
+    return [info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)]
+
+
+def check_callback_url(url: str, allowed_hosts: Optional[set[str]] = None,
+                       resolver: Callable[[str], list[str]] = resolve_host) -> str:
+    """
+    Vets a client-supplied callback URL and returns its host.
+
+    The server POSTs results to it, so it must be http(s), on the allowlist
+    when one is configured, and resolve only to public addresses; anything
+    else would let a caller reach internal services through the gateway.
+    Blocking (DNS); raises CallbackRejected.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise CallbackRejected(f"Callback URL '{url}' must be an absolute http(s) URL.")
+    if parts.username or parts.password:
+        raise CallbackRejected("Callback URLs may not carry credentials.")
+    if allowed_hosts is not None and host not in allowed_hosts:
+        raise CallbackRejected(f"Callback host '{host}' is not allowed.")
+    try:
+        addresses = [ipaddress.ip_address(host)]
+    except ValueError:
+        try:
+            addresses = [ipaddress.ip_address(a.split("%", 1)[0]) for a in resolver(host)]
+        except (OSError, ValueError) as e:
+            raise CallbackRejected(f"Callback host '{host}' does not resolve: {e}") from None
+    if not addresses or any(not a.is_global for a in addresses):
+        raise CallbackRejected(f"Callback host '{host}' resolves to a non-public address.")
+    return host
+
+
+def allowed_callback_hosts() -> Optional[set[str]]:
+    hosts = os.getenv(CALLBACK_HOSTS_ENV)
+    if hosts is None:
+        return None
+    return {h.strip().lower() for h in hosts.split(",") if h.strip()}
+
+
+class BatchBackend(Protocol):
+    async def submit(self, jsonl: bytes) -> str:
+        """Uploads a JSONL batch file and returns the provider's batch id."""
+
+    async def poll(self, batch_id: str) -> Optional[bytes]:
+        """Returns the output JSONL once the batch is finished, None while it is still running."""
+
+
+class OpenAIBatchBackend:
+    """OpenAI Batch API: upload the file, create a 24h batch against Chat Completions, fetch output files."""
+
+    base_url = "https://api.openai.com/v1"
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport
+
+    def _client(self) -> httpx.AsyncClient:
+        key = os.getenv("OPENAI_API_KEY")
+        if not key:
+            raise RuntimeError("OPENAI_API_KEY is not set.")
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Authorization": f"Bearer {key}"},
+            timeout=60.0,
+            transport=self._transport,
+        )
+
+    async def submit(self, jsonl: bytes) -> str:
+        async with self._client() as client:
+            r = await client.post("/files", data={"purpose": "batch"}, files={"file": ("batch.jsonl", jsonl, "application/jsonl")})
+            r.raise_for_status()
+            r = await client.post("/batches", json={
+                "input_file_id": r.json()["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            })
+            r.raise_for_status()
+            return r.json()["id"]
+
+    async def poll(self, batch_id: str) -> Optional[bytes]:
+        async with self._client() as client:
+            r = await client.get(f"/batches/{batch_id}")
+            r.raise_for_status()
+            batch = r.json()
+            if batch["status"] not in TERMINAL_STATES:
+                return None
+            # Expired or cancelled batches still return whatever finished
+            out = b""
+            for key in ("output_file_id", "error_file_id"):
+                if batch.get(key):
+                    r = await client.get(f"/files/{batch[key]}/content")
+                    r.raise_for_status()
+                    out += r.content if r.content.endswith(b"\n") else r.content + b"\n"
+            if not out and batch["status"] != "completed":
+                raise BatchFailed(f"Batch {batch_id} ended as '{batch['status']}' with no output.")
+            return out
+
+
+def echo_completion(body: dict) -> dict:
+    """Default LocalBatchServer responder: answers with the last user message."""
+    last = next((m.get("content") for m in reversed(body.get("messages", [])) if m.get("role") == "user"), "")
+    return {
+        "object": "chat.completion",
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": last}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class LocalBatchServer:
+    """
+    In-process stand-in for a provider batch API, for tests and throughput runs.
+
+    Accepts OpenAI-format batch files, "finishes" each one ``latency`` seconds
+    after submission and answers every line with ``responder(body)``.
+    """
+
+    def __init__(self, responder: Callable[[dict], dict] = echo_completion, latency: float = 0.0):
+        self.responder = responder
+        self.latency = latency
+        self._batches: dict[str, tuple[float, list[dict]]] = {}
+        self.stats = {"batches": 0, "requests": 0, "bytes": 0}
+
+    async def submit(self, jsonl: bytes) -> str:
+        lines = [json.loads(line) for line in jsonl.splitlines() if line.strip()]
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        self._batches[batch_id] = (time.monotonic() + self.latency, lines)
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(lines)
+        self.stats["bytes"] += len(jsonl)
+        return batch_id
+
+    async def poll(self, batch_id: str) -> Optional[bytes]:
+        ready_at, lines = self._batches[batch_id]
+        if time.monotonic() < ready_at:
+            return None
+        del self._batches[batch_id]
+        out = []
+        for line in lines:
+            try:
+                response, error = {"status_code": 200, "body": self.responder(line["body"])}, None
+            except Exception as e:
+                response, error = None, {"code": "responder_error", "message": str(e)}
+            out.append(json.dumps({"custom_id": line["custom_id"], "response": response, "error": error}))
+        return ("\n".join(out) + "\n").encode()
+
+
+def default_backend(adapter_name: str) -> Optional[BatchBackend]:
+    if os.getenv(BATCH_BACKEND_ENV) == "local":
+        return _LOCAL
+    return OpenAIBatchBackend() if adapter_name == "openai" else None
+
+
+_LOCAL = LocalBatchServer()
+
+
+@dataclass
+class DeferredResult:
+    id: str
+    owner: str
+    job_id: str
+    model: str
+    callback_url: Optional[str] = None
+    reserved_tokens: int = 0  # refunded if the request fails
+    status: str = "queued"  # queued -> submitted -> completed | failed
+    batch_id: Optional[str] = None
+    response: Optional[dict] = None
+    error: Optional[dict] = None
+    created_at: float = field(default_factory=time.time)
+    completed_at: Optional[float] = None
+
+    def public(self) -> dict[str, Any]:
+        out = asdict(self)
+        del out["owner"], out["callback_url"], out["reserved_tokens"]
+        return out
+
+
+class DeferredQueue:
+    """
+    Packs deferred chat requests into provider batch files.
+
+    Requests accumulate per adapter until ``max_requests``/``max_bytes`` is
+    reached or the oldest has waited ``flush_seconds``. Each file is
+    submitted once, polled until it finishes, and every result is stored for
+    ``GET /v1/deferred/{id}`` and POSTed to its callback URL if it has one.
+    A failed request's budget reservation is refunded.
+
+    Queued requests, batch ids and results live in this process's memory
+    only, capped at ``retention`` results: a restart loses pending requests
+    and unread results, and batches already submitted are not polled again.
+    """
+
+    def __init__(
+        self,
+        backend_for: Callable[[str], Optional[BatchBackend]] = default_backend,
+        max_requests: int = MAX_BATCH_REQUESTS,
+        max_bytes: int = MAX_BATCH_BYTES,
+        flush_seconds: float = FLUSH_SECONDS,
+        poll_seconds: float = POLL_SECONDS,
+        retention: int = RESULT_RETENTION,
+        callback_transport: Optional[httpx.AsyncBaseTransport] = None,
+        callback_hosts: Optional[set[str]] = None,
+        resolver: Callable[[str], list[str]] = resolve_host,
+        refund: Callable[[str, str, int], Awaitable[Any]] = refund_budget,
+    ):
+        self.backend_for = backend_for
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.flush_seconds = flush_seconds
+        self.poll_seconds = poll_seconds
+        self.retention = retention
+        self._callback_transport = callback_transport
+        self.callback_hosts = callback_hosts if callback_hosts is not None else allowed_callback_hosts()
+        self._resolver = resolver
+        self._refund = refund
+        self._backends: dict[str, BatchBackend] = {}
+        self._pending: dict[str, list[tuple[str, bytes]]] = {}
+        self._pending_bytes: dict[str, int] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.results: OrderedDict[str, DeferredResult] = OrderedDict()
+        self.stats = {
+            "queued": 0, "batches": 0, "submitted": 0, "completed": 0, "failed": 0,
+            "callbacks_failed": 0, "callbacks_rejected": 0, "corrupt_lines": 0, "refunded_tokens": 0,
+            "turnaround_seconds": 0.0,
+        }
+        self._first_submit: Optional[float] = None
+
+    def accepts(self, adapter_name: str) -> bool:
+        """Whether the provider has a batch backend; check before reserving budget."""
+        if adapter_name not in self._backends:
+            backend = self.backend_for(adapter_name)
+            if backend is None:
+                return False
+            self._backends[adapter_name] = backend
+        return True
+
+    def check_callback(self, url: str) -> str:
+        """Vets a callback URL against this queue's allowlist; blocking, raises CallbackRejected."""
+        return check_callback_url(url, self.callback_hosts, self._resolver)
+
+    def enqueue(self, adapter_name: str, owner: str, job_id: str, model: str, body: dict,
+                callback_url: Optional[str] = None, reserved_tokens: int = 0) -> DeferredResult:
+        """
+        Queues one provider request body; raises ValueError if the provider has no batch API.
+
+        ``callback_url`` should already have passed ``check_callback``; it is
+        checked again before each delivery.
+        """
+        if not self.accepts(adapter_name):
+            raise ValueError(f"Provider '{adapter_name}' does not support deferred requests.")
+
+        result = DeferredResult(id=f"dfr_{uuid.uuid4().hex}", owner=owner, job_id=job_id, model=model,
+                                callback_url=callback_url, reserved_tokens=reserved_tokens)
+        line = json.dumps(
+            {"custom_id": result.id, "method": "POST", "url": "/v1/chat/completions", "body": body},
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).encode("utf-8") + b"\n"
+        self._remember(result)
+        self._pending.setdefault(adapter_name, []).append((result.id, line))
+        self._pending_bytes[adapter_name] = self._pending_bytes.get(adapter_name, 0) + len(line)
+        self.stats["queued"] += 1
+
+        if len(self._pending[adapter_name]) >= self.max_requests or self._pending_bytes[adapter_name] >= self.max_bytes:
+            # Cut the batch now so requests enqueued before the submit runs start a new one
+            self._spawn(self._submit(adapter_name, self._take(adapter_name)))
+        elif adapter_name not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[adapter_name] = loop.call_later(
+                self.flush_seconds, lambda: self._spawn(self.flush(adapter_name))
+            )
+        return result
+
+    def get(self, result_id: str, owner: str) -> Optional[DeferredResult]:
+        result = self.results.get(result_id)
+        return result if result is not None and result.owner == owner else None
+
+    async def flush(self, adapter_name: Optional[str] = None) -> list[str]:
+        """Submits pending requests now; returns the new batch ids."""
+        names = [adapter_name] if adapter_name else list(self._pending)
+        batch_ids = []
+        for name in names:
+            batch_id = await self._submit(name, self._take(name))
+            if batch_id is not None:
+                batch_ids.append(batch_id)
+        return batch_ids
+
+    def _take(self, adapter_name: str) -> list[tuple[str, bytes]]:
+        timer = self._timers.pop(adapter_name, None)
+        if timer is not None:
+            timer.cancel()
+        self._pending_bytes.pop(adapter_name, None)
+        return self._pending.pop(adapter_name, [])
+
+    async def _submit(self, adapter_name: str, items: list[tuple[str, bytes]]) -> Optional[str]:
+        if not items:
+            return None
+        ids = [rid for rid, _ in items]
+        try:
+            batch_id = await self._backends[adapter_name].submit(b"".join(line for _, line in items))
+        except Exception as e:
+            await self._fail(ids, {"type": "BATCH_SUBMIT_FAILED", "message": str(e)})
+            return None
+        if self._first_submit is None:
+            self._first_submit = time.monotonic()
+        self.stats["batches"] += 1
+        self.stats["submitted"] += len(ids)
+        for rid in ids:
+            if rid in self.results:
+                self.results[rid].status, self.results[rid].batch_id = "submitted", batch_id
+        self._spawn(self._poll(adapter_name, batch_id, ids))
+        return batch_id
+
+    async def _poll(self, adapter_name: str, batch_id: str, ids: list[str]) -> None:
+        backend = self._backends[adapter_name]
+        while True:
+            try:
+                output = await backend.poll(batch_id)
+            except BatchFailed as e:
+                await self._fail(ids, {"type": "BATCH_FAILED", "message": str(e)})
+                return
+            except Exception as e:
+                logger.warning("Polling batch %s failed, retrying: %s", batch_id, e)
+                output = None
+            if output is not None:
+                break
+            await asyncio.sleep(self.poll_seconds)
+
+        seen = set()
+        try:
+            for line in output.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                if not isinstance(row, dict):
+                    # A corrupt or truncated line loses only its own result; the pass below fails it
+                    self.stats["corrupt_lines"] += 1
+                    logger.warning("Skipping unreadable line in batch %s output: %.80r", batch_id, line)
+                    continue
+                rid = row.get("custom_id")
+                result = self.results.get(rid)
+                if result is None:
+                    continue
+                seen.add(rid)
+                response = row.get("response") or {}
+                if response.get("status_code") == 200 and row.get("error") is None:
+                    await self._finish(result, "completed", response=response.get("body"))
+                else:
+                    error = row.get("error") or {"message": json.dumps(response.get("body"))}
+                    await self._finish(result, "failed", error={"type": "PROVIDER_ERROR", **error})
+        finally:
+            # Every id without a result is failed and refunded, even if reading the output blew up
+            await self._fail([rid for rid in ids if rid not in seen],
+                             {"type": "BATCH_INCOMPLETE", "message": f"No result in batch {batch_id}."})
+
+    async def _fail(self, ids: list[str], error: dict) -> None:
+        for rid in ids:
+            result = self.results.get(rid)
+            if result is not None:
+                await self._finish(result, "failed", error=error)
+
+    async def _finish(self, result: DeferredResult, status: str, response: Optional[dict] = None,
+                      error: Optional[dict] = None) -> None:
+        result.status, result.response, result.error = status, response, error
+        result.completed_at = time.time()
+        self.stats[status] += 1
+        self.stats["turnaround_seconds"] += result.completed_at - result.created_at
+        if status == "failed" and result.reserved_tokens:
+            try:
+                await self._refund(result.job_id, result.model, result.reserved_tokens)
+                self.stats["refunded_tokens"] += result.reserved_tokens
+            except Exception:
+                logger.exception("Refunding %s tokens for %s failed", result.reserved_tokens, result.id)
+        if result.callback_url:
+            await self._deliver(result)
+
+    async def _deliver(self, result: DeferredResult) -> None:
+        try:
+            # Re-resolved at delivery, so a DNS change since enqueue cannot point it inward
+            await asyncio.to_thread(self.check_callback, result.callback_url)
+        except CallbackRejected as e:
+            self.stats["callbacks_rejected"] += 1
+            logger.warning("Callback for %s rejected: %s", result.id, e)
+            return
+        try:
+            # Redirects are not followed (httpx default), for the same reason
+            async with httpx.AsyncClient(timeout=10.0, transport=self._callback_transport) as client:
+                r = await client.post(result.callback_url, json=result.public())
+                r.raise_for_status()
+        except Exception as e:
+            self.stats["callbacks_failed"] += 1
+            logger.warning("Callback for %s to %s failed: %s", result.id, result.callback_url, e)
+
+    def _remember(self, result: DeferredResult) -> None:
+        self.results[result.id] = result
+        while len(self.results) > self.retention:
+            self.results.popitem(last=False)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self) -> None:
+        """Flushes everything and waits for all outstanding batches; for shutdown and benchmarks."""
+        await self.flush()
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def snapshot(self) -> dict[str, Any]:
+        done = self.stats["completed"] + self.stats["failed"]
+        elapsed = time.monotonic() - self._first_submit if self._first_submit is not None else 0.0
+        return {
+            **{k: v for k, v in self.stats.items() if k != "turnaround_seconds"},
+            "pending": sum(len(v) for v in self._pending.values()),
+            "avg_batch_size": self.stats["submitted"] / self.stats["batches"] if self.stats["batches"] else 0.0,
+            "avg_turnaround_s": self.stats["turnaround_seconds"] / done if done else 0.0,
+            "completed_per_second": self.stats["completed"] / elapsed if elapsed else 0.0,
+        }
+
+
+DEFERRED = DeferredQueue()
@@ -1,6 +1,170 @@
-# Static or DB-backed; can be swapped by Focus Index router
-REGISTRY = {
-  "gpt-4o-mini": {"adapter":"openai","provider_model":"gpt-4o-mini"},
-  "sonnet-latest": {"adapter":"anthropic","provider_model":"claude-3-5-sonnet-20240620"},
+import asyncio
+import itertools
+import json
+import os
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Iterator, Mapping, Optional
+
+# Seed routes, served until (or unless) the CockroachDB registry is loaded.
+# "fallback" names the alias a request is downgraded to when this route cannot
+# meet its deadline; aliases without one are shed instead.
+STATIC_REGISTRY = {
+  "gpt-4o-mini": {"adapter":"openai","provider_model":"gpt-4o-mini","context_window":128000},
+  "sonnet-latest": {"adapter":"anthropic","provider_model":"claude-3-5-sonnet-20240620","context_window":200000,"fallback":"gpt-4o-mini"},
   # "local-ollama": {"adapter":"ollama","provider_model":"llama3:instruct"}
-}
\ No newline at end of file
+}
+
+REGISTRY_DSN_ENV = "UCAPI_REGISTRY_DSN"
+POLL_INTERVAL = float(os.getenv("UCAPI_REGISTRY_POLL_SECONDS", "15"))
+
+
+@dataclass(frozen=True)
+class RegistrySnapshot:
+    """
+    An immutable view of the routes, with the /v1/models body serialized once.
+
+    ``version`` is the source revision the routes derive from; ``override``
+    numbers local edits on top of it and is 0 for an unmodified revision.
+    """
+    version: int
+    routes: Mapping[str, Mapping[str, Any]]
+    models_body: bytes
+    override: int = 0
+
+    @property
+    def etag(self) -> str:
+        return f"registry-{self.version}" if not self.override else f"registry-{self.version}-local{self.override}"
+
+
+def build_snapshot(routes: Mapping[str, Mapping[str, Any]], version: int, override: int = 0) -> RegistrySnapshot:
+    frozen = MappingProxyType({alias: MappingProxyType(dict(cfg)) for alias, cfg in routes.items()})
+    body = json.dumps({"data": [{"id": k, **v} for k, v in frozen.items()]}, separators=(",", ":")).encode()
+    return RegistrySnapshot(version=version, routes=frozen, models_body=body, override=override)
+
+
+_current = build_snapshot(STATIC_REGISTRY, 0)
+
+
+def current() -> RegistrySnapshot:
+    """Lock-free read of the active snapshot; swaps are a single reference assignment."""
+    return _current
+
+
+def publish(routes: Mapping[str, Mapping[str, Any]], version: int, override: int = 0) -> RegistrySnapshot:
+    """Atomically swaps in a new snapshot."""
+    global _current
+    _current = build_snapshot(routes, version, override)
+    return _current
+
+
+# Never reused, so a local edit cannot share an ETag with a source revision or another edit
+_overrides = itertools.count(1)
+
+
+class _RegistryView(MutableMapping):
+    """
+    Dict-like access to the active snapshot.
+
+    Reads go straight to the current snapshot. Writes (local overrides, tests)
+    are copy-on-write and publish a new snapshot with a fresh override number
+    on top of the current source revision.
+    """
+
+    def __getitem__(self, alias: str) -> Mapping[str, Any]:
+        return _current.routes[alias]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_current.routes)
+
+    def __len__(self) -> int:
+        return len(_current.routes)
+
+    def __setitem__(self, alias: str, config: Mapping[str, Any]) -> None:
+        snap = _current
+        publish({**snap.routes, alias: config}, snap.version, next(_overrides))
+
+    def __delitem__(self, alias: str) -> None:
+        snap = _current
+        routes = dict(snap.routes)
+        del routes[alias]
+        publish(routes, snap.version, next(_overrides))
+
+
+REGISTRY = _RegistryView()
+
+
+def check_fallbacks(routes: dict[str, dict[str, Any]]) -> None:
+    """Drops, with a warning, fallbacks that name a missing or disabled alias or the route itself."""
+    for alias, cfg in routes.items():
+        fallback = cfg.get("fallback")
+        if fallback is not None and (fallback == alias or fallback not in routes):
+            print(f"Registry route '{alias}' names unusable fallback '{fallback}'; it will be shed under overload")
+            del cfg["fallback"]
+
+
+class CockroachRegistrySource:
+    """Reads routes from the ``ucapi_model_registry`` table (see db/ddl_ucapi_model_registry.sql)."""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.loaded_revision: Optional[int] = None
+        self._conn = None
+
+    async def _connection(self):
+        if self._conn is None or self._conn.closed:
+            import psycopg
+            self._conn = await psycopg.AsyncConnection.connect(self.dsn, autocommit=True)
+        return self._conn
+
+    async def revision(self) -> Optional[int]:
+        conn = await self._connection()
+        cur = await conn.execute("SELECT max(revision) FROM ucapi_model_registry")
+        row = await cur.fetchone()
+        return None if row is None or row[0] is None else int(row[0])
+
+    async def routes(self) -> tuple[int, dict[str, dict[str, Any]]]:
+        conn = await self._connection()
+        cur = await conn.execute("""
+            SELECT alias, adapter, provider_model, context_window, fallback, revision, enabled
+            FROM ucapi_model_registry
+        """)
+        routes, version = {}, 0
+        for alias, adapter, provider_model, context_window, fallback, revision, enabled in await cur.fetchall():
+            version = max(version, int(revision))
+            if not enabled:
+                continue
+            cfg = {"adapter": adapter, "provider_model": provider_model}
+            if context_window is not None:
+                cfg["context_window"] = int(context_window)
+            if fallback is not None:
+                cfg["fallback"] = fallback
+            routes[alias] = cfg
+        check_fallbacks(routes)
+        return version, routes
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._conn.close()
+
+
+async def poll_once(source) -> bool:
+    """Reloads the registry if the source's revision moved; returns True when a swap happened."""
+    revision = await source.revision()
+    if revision is None or revision == source.loaded_revision:
+        return False
+    version, routes = await source.routes()
+    publish(routes, version)
+    source.loaded_revision = version
+    return True
+
+
+async def run_poller(source, interval: float = POLL_INTERVAL) -> None:
+    """Polls the source forever, keeping the last good snapshot on errors."""
+    while True:
+        try:
+            await poll_once(source)
+        except Exception as e:
+            print(f"Registry reload failed, keeping version {_current.version}: {e}")
+        await asyncio.sleep(interval)
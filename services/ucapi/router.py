@@ -1,4 +1,4 @@
-from .registry import REGISTRY
+from .registry import current
 from .adapters.base import ChatAdapter
 from .adapters.openai_adapter import OpenAIAdapter
 from .adapters.anthropic_adapter import AnthropicAdapter
@@ -12,10 +12,10 @@ def resolve(model_alias: str) -> tuple[ChatAdapter, str]:
     """
     Resolves a model alias to the corresponding adapter instance and provider-specific model name.
     """
-    if model_alias not in REGISTRY:
+    config = current().routes.get(model_alias)
+    if config is None:
         raise ValueError(f"Model alias '{model_alias}' not found in registry.")
 
-    config = REGISTRY[model_alias]
     adapter_name = config["adapter"]
     provider_model = config["provider_model"]
 
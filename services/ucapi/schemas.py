@@ -28,6 +28,11 @@ class ChatRequest(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
 
 
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest] = Field(..., min_length=1, max_length=1000)
+    metadata: Optional[Dict[str, Any]] = None
+
+
 class FunctionCall(BaseModel):
     name: str
     arguments: str
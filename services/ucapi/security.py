@@ -1,5 +1,7 @@
 import asyncio
 
+from .tokens import COUNTER
+
 # Placeholder functions for Zero-Trust components
 
 async def check_egress(service_spiffe: str, host: str):
@@ -10,7 +12,17 @@ async def check_egress(service_spiffe: str, host: str):
 
 async def estimate_and_reserve_budget(job_id: str, model_alias: str, params: dict):
     """Placeholder for cost estimation and reservation in CockroachDB."""
-    print(f"Reserving budget for job {job_id} with model {model_alias}")
+    prompt_tokens = params.get("prompt_tokens")
+    if prompt_tokens is None:
+        prompt_tokens = COUNTER.count_messages(params.get("messages") or [], params.get("tools"))
+    estimated = prompt_tokens + (params.get("max_tokens") or 0)
+    print(f"Reserving budget for job {job_id} with model {model_alias}: ~{estimated} tokens")
+    await asyncio.sleep(0.01) # Simulate async check
+    return True
+
+async def refund_budget(job_id: str, model_alias: str, tokens: int):
+    """Placeholder for releasing the unspent part of a reservation in CockroachDB."""
+    print(f"Refunding budget for job {job_id} with model {model_alias}: {tokens} tokens")
     await asyncio.sleep(0.01) # Simulate async check
     return True
 
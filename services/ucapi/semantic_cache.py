@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+DEFAULT_THRESHOLD = float(os.getenv("UCAPI_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+DEFAULT_AUDIT_RATE = float(os.getenv("UCAPI_SEMANTIC_CACHE_AUDIT_RATE", "0.01"))
+
+
+def wants_semantic_cache(metadata: Optional[dict]) -> bool:
+    """The semantic tier is opt-in per request via ``metadata.semantic_cache``."""
+    return bool((metadata or {}).get("semantic_cache"))
+
+
+@dataclass
+class Probe:
+    """Result of a lookup; carries the embedding so a miss can be stored without re-encoding."""
+    partition: str
+    prompt: str
+    embedding: np.ndarray
+    response: Optional[dict] = None
+    score: float = 0.0
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class _Partition:
+    """Growable ring of normalized embeddings searched by dot product; the oldest entry is evicted first."""
+
+    INITIAL_CAPACITY = 8
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((self.INITIAL_CAPACITY, dim), dtype=np.float32)
+        self.prompts: list[Optional[str]] = [None] * self.INITIAL_CAPACITY  # digests, never raw text
+        self.responses: list[Optional[dict]] = [None] * self.INITIAL_CAPACITY
+        self.head = 0
+        self.size = 0
+
+    def search(self, query: np.ndarray) -> tuple[int, float]:
+        if self.size == 0:
+            return -1, 0.0
+        # Free slots are zeroed, so they never outscore a live entry above a positive threshold
+        scores = self.vectors @ query
+        best = int(np.argmax(scores))
+        if self.responses[best] is None:
+            return -1, 0.0
+        return best, float(scores[best])
+
+    def _grow(self) -> None:
+        capacity = len(self.prompts)
+        order = [(self.head + i) % capacity for i in range(self.size)]
+        vectors = np.zeros((2 * capacity, self.vectors.shape[1]), dtype=np.float32)
+        vectors[: self.size] = self.vectors[order]
+        self.vectors = vectors
+        self.prompts = [self.prompts[i] for i in order] + [None] * (2 * capacity - self.size)
+        self.responses = [self.responses[i] for i in order] + [None] * (2 * capacity - self.size)
+        self.head = 0
+
+    def add(self, embedding: np.ndarray, prompt: str, response: dict) -> None:
+        if self.size == len(self.prompts):
+            self._grow()
+        i = (self.head + self.size) % len(self.prompts)
+        self.vectors[i] = embedding
+        self.prompts[i] = prompt
+        self.responses[i] = response
+        self.size += 1
+
+    def evict_oldest(self) -> None:
+        i = self.head
+        self.vectors[i] = 0.0
+        self.prompts[i] = None
+        self.responses[i] = None
+        self.head = (i + 1) % len(self.prompts)
+        self.size -= 1
+
+
+class SemanticCache:
+    """
+    Near-duplicate response cache keyed on the embedding of the final user turn.
+
+    Entries are partitioned by tenant, model alias, the request parameters that
+    shape the completion (temperature, max_tokens, tools, tool_choice) and
+    everything that precedes the final turn (system prompt and history), so
+    only paraphrases of the same question from the same caller in the same
+    context with the same parameters can match. Embeddings come
+    from SemanticsComparator's sentence-transformer; without it the cache stays
+    empty and every lookup misses.
+
+    ``max_entries`` bounds the cache as a whole: once it is exceeded, the least
+    recently used partition is dropped, or, when only one partition is left,
+    its oldest entry. Partition arrays grow with their entries rather than
+    being allocated at full capacity.
+    """
+
+    def __init__(
+        self,
+        comparator=None,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = 5000,
+        audit_rate: float = DEFAULT_AUDIT_RATE,
+        audit_size: int = 200,
+    ):
+        self._comparator = comparator
+        self._model_lock = threading.Lock()  # lookups embed in worker threads; build the model once
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.audit_rate = audit_rate
+        self._partitions: OrderedDict[str, _Partition] = OrderedDict()
+        self._entries = 0
+        self.audit_samples: deque = deque(maxlen=audit_size)
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "evictions": 0, "lookup_seconds": 0.0}
+
+    def _model(self):
+        if self._comparator is None:
+            with self._model_lock:
+                if self._comparator is None:
+                    from services.semantics.comparator import SemanticsComparator
+                    self._comparator = SemanticsComparator()
+        return self._comparator.model if self._comparator.ready else None
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        model = self._model()
+        if model is None:
+            return None
+        vec = np.asarray(model.encode(text), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    @staticmethod
+    def _partition_key(
+        tenant: str, model_alias: str, messages: list[dict], params: Optional[dict] = None
+    ) -> Optional[tuple[str, str]]:
+        if not messages or messages[-1].get("role") != "user":
+            return None
+        h = hashlib.sha256(tenant.encode("utf-8") + b"\x1d" + model_alias.encode("utf-8"))
+        h.update(b"\x1d" + json.dumps(params or {}, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+        for m in messages[:-1]:
+            h.update(b"\x1e" + m.get("role", "").encode("utf-8") + b"\x1f" + (m.get("content") or "").encode("utf-8"))
+        return h.hexdigest(), messages[-1].get("content") or ""
+
+    async def lookup(
+        self, tenant: str, model_alias: str, messages: list[dict], params: Optional[dict] = None
+    ) -> Optional[Probe]:
+        """Returns a Probe (with ``response`` set on a hit), or None if the request is not cacheable."""
+        key = self._partition_key(tenant, model_alias, messages, params)
+        if key is None:
+            return None
+        partition_id, prompt = key
+        start = time.perf_counter()
+        embedding = await asyncio.to_thread(self._embed, prompt)
+        if embedding is None:
+            return None
+        probe = Probe(partition=partition_id, prompt=prompt, embedding=embedding)
+        partition = self._partitions.get(partition_id)
+        if partition is not None:
+            self._partitions.move_to_end(partition_id)
+            idx, score = partition.search(embedding)
+            if idx >= 0 and score >= self.threshold:
+                probe.response, probe.score = partition.responses[idx], score
+                if random.random() < self.audit_rate:
+                    # Digests only: the snapshot is readable by every authenticated caller
+                    self.audit_samples.append({
+                        "model": model_alias,
+                        "prompt_sha256": _digest(prompt),
+                        "matched_prompt_sha256": partition.prompts[idx],
+                        "score": round(score, 4),
+                        "at": time.time(),
+                    })
+        self.stats["lookups"] += 1
+        self.stats["hits" if probe.response is not None else "misses"] += 1
+        self.stats["lookup_seconds"] += time.perf_counter() - start
+        return probe
+
+    def store(self, probe: Probe, response: dict) -> None:
+        partition = self._partitions.get(probe.partition)
+        if partition is None:
+            partition = self._partitions[probe.partition] = _Partition(probe.embedding.shape[0])
+        self._partitions.move_to_end(probe.partition)
+        partition.add(probe.embedding, _digest(probe.prompt), response)
+        self._entries += 1
+        self.stats["stores"] += 1
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._entries > self.max_entries:
+            partition_id, partition = next(iter(self._partitions.items()))
+            if len(self._partitions) > 1:
+                del self._partitions[partition_id]
+                dropped = partition.size
+            else:
+                partition.evict_oldest()
+                dropped = 1
+            self._entries -= dropped
+            self.stats["evictions"] += dropped
+
+    def snapshot(self) -> dict[str, Any]:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "avg_lookup_ms": 1000 * self.stats["lookup_seconds"] / lookups if lookups else 0.0,
+            "threshold": self.threshold,
+            "partitions": len(self._partitions),
+            "entries": self._entries,
+            "audit_samples": list(self.audit_samples),
+        }
+
+
+SEMANTIC_CACHE = SemanticCache()
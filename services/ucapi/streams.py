@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+STREAM_ID_HEADER = "X-UCAPI-Stream-Id"
+BUFFER_EVENTS = int(os.getenv("UCAPI_STREAM_BUFFER_EVENTS", "2048"))
+GRACE_SECONDS = float(os.getenv("UCAPI_STREAM_GRACE_SECONDS", "30"))
+
+# Events after which no more are published for a stream
+TERMINAL_EVENTS = {"message.done", "error"}
+
+
+class ReplayUnavailable(LookupError):
+    """The requested stream is unknown, expired, or has dropped the events after Last-Event-ID."""
+
+
+def sse_frame(seq: int, event: dict) -> str:
+    name = event.get("event", "message")
+    # Errors carry only their detail as data; everything else is sent whole
+    data = event.get("data") if name == "error" else event
+    return f"id: {seq}\nevent: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def reset_frame(after: int, oldest: int) -> str:
+    """
+    Ends a subscription that fell behind the ring.
+
+    Sent as an ``error`` event without an id, so the client's Last-Event-ID
+    stays put and it learns the stream must be restarted rather than
+    mistaking the gap for a normal end.
+    """
+    data = {
+        "type": "STREAM_RESET",
+        "message": f"Events {after + 1}-{oldest - 1} are no longer buffered; restart the request.",
+        "last_event_id": after,
+    }
+    return f"event: error\ndata: {json.dumps(data)}\n\n"
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    try:
+        return max(int(value), 0) if value else 0
+    except ValueError:
+        return 0
+
+
+class StreamBuffer:
+    """
+    The replayable output of one upstream stream.
+
+    Events are serialized to SSE frames once, numbered from 1 and kept in a
+    bounded ring, so any number of subscribers can tail the same generation
+    and a reconnecting client can resume after the last id it saw.
+    """
+
+    def __init__(self, owner: str, capacity: int = BUFFER_EVENTS):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.frames: deque[tuple[int, str]] = deque(maxlen=capacity)
+        self.last_seq = 0
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: dict) -> None:
+        if self.done:
+            return
+        self.last_seq += 1
+        self.frames.append((self.last_seq, sse_frame(self.last_seq, event)))
+        if event.get("event") in TERMINAL_EVENTS:
+            self.done = True
+        self._notify()
+
+    def close(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def can_resume(self, after: int) -> bool:
+        return not self.frames or after >= self.frames[0][0] - 1
+
+    async def follow(self, after: int = 0) -> AsyncIterator[str]:
+        """Yields frames with id > ``after`` until the stream ends, or a reset frame if they were evicted."""
+        cursor = after
+        while True:
+            changed = self._changed
+            while cursor < self.last_seq:
+                # Ids are contiguous, so the next frame's ring index follows from the oldest id
+                oldest = self.frames[0][0]
+                if cursor + 1 < oldest:
+                    yield reset_frame(cursor, oldest)
+                    return
+                cursor, frame = self.frames[cursor + 1 - oldest]
+                yield frame
+            if self.done:
+                return
+            await changed.wait()
+
+
+class StreamHub:
+    """
+    Owns in-progress streams independently of the HTTP responses reading them.
+
+    When the last subscriber goes away the upstream call keeps running for
+    ``grace`` seconds; a reconnect within that window resumes from the buffer,
+    otherwise the producer is cancelled. Finished streams stay replayable for
+    the same window.
+    """
+
+    def __init__(self, grace: float = GRACE_SECONDS, capacity: int = BUFFER_EVENTS):
+        self.grace = grace
+        self.capacity = capacity
+        self.streams: dict[str, StreamBuffer] = {}
+        self._expiry: dict[str, asyncio.TimerHandle] = {}
+        self.stats = {"opened": 0, "resumed": 0, "expired": 0, "abandoned": 0}
+
+    def open(self, owner: str, producer: Callable[[StreamBuffer], Awaitable[None]]) -> StreamBuffer:
+        buf = StreamBuffer(owner, self.capacity)
+        self.streams[buf.id] = buf
+
+        async def run():
+            try:
+                await producer(buf)
+            finally:
+                buf.close()
+                self._schedule_expiry(buf)
+
+        buf.task = asyncio.create_task(run())
+        self.stats["opened"] += 1
+        return buf
+
+    def get(self, stream_id: str, owner: str, after: int = 0) -> StreamBuffer:
+        buf = self.streams.get(stream_id)
+        if buf is None or buf.owner != owner:
+            raise ReplayUnavailable(f"Stream '{stream_id}' not found or expired.")
+        if not buf.can_resume(after):
+            raise ReplayUnavailable(f"Stream '{stream_id}' no longer buffers events after id {after}.")
+        return buf
+
+    async def subscribe(self, buf: StreamBuffer, after: int = 0) -> AsyncIterator[str]:
+        """Follows ``buf``, tracking the subscriber so an abandoned stream can expire."""
+        buf.subscribers += 1
+        if after:
+            self.stats["resumed"] += 1
+        handle = self._expiry.pop(buf.id, None)
+        if handle is not None:
+            handle.cancel()
+        try:
+            async for frame in buf.follow(after):
+                yield frame
+        finally:
+            buf.subscribers -= 1
+            self._schedule_expiry(buf)
+
+    def _schedule_expiry(self, buf: StreamBuffer) -> None:
+        if buf.subscribers or buf.id not in self.streams:
+            return
+        handle = self._expiry.pop(buf.id, None)
+        if handle is not None:
+            handle.cancel()
+        self._expiry[buf.id] = asyncio.get_running_loop().call_later(self.grace, self._expire, buf.id)
+
+    def _expire(self, stream_id: str) -> None:
+        self._expiry.pop(stream_id, None)
+        buf = self.streams.get(stream_id)
+        if buf is None or buf.subscribers:
+            return
+        del self.streams[stream_id]
+        self.stats["expired"] += 1
+        if buf.task is not None and not buf.task.done():
+            self.stats["abandoned"] += 1
+            buf.task.cancel()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "active": sum(1 for b in self.streams.values() if not b.done),
+            "buffered": len(self.streams),
+            "subscribers": sum(b.subscribers for b in self.streams.values()),
+        }
+
+
+STREAMS = StreamHub()
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from services.ucapi.cancellation import (
+    CancellationStats,
+    ClientDisconnected,
+    CompletionMeter,
+    run_until_disconnect,
+    unused_reservation,
+)
+from services.ucapi.concurrency import AdaptiveLimiter
+from services.ucapi.gateway import chat
+from services.ucapi.schemas import ChatRequest
+
+
+class FakeRequest:
+    """Reports a disconnect after ``after`` polls."""
+
+    def __init__(self, after: int = 0):
+        self.headers = {}
+        self.polls = 0
+        self.after = after
+
+    async def is_disconnected(self):
+        self.polls += 1
+        return self.polls > self.after
+
+
+def test_unused_reservation():
+    """Tests refunds: everything before the provider call, unspent completion after it."""
+    assert unused_reservation(100, 500, started=False) == 600
+    assert unused_reservation(100, 500, started=True, completion_tokens=120) == 380
+    assert unused_reservation(100, None, started=True, completion_tokens=50) == 0
+
+
+def test_completion_meter_counts_text_deltas():
+    """Tests that only text deltas count toward generated tokens."""
+    meter = CompletionMeter()
+    meter.observe({"event": "message.delta", "delta": "hello there"})
+    meter.observe({"event": "tool_call.delta", "delta": [{"index": 0}]})
+    meter.observe({"event": "message.done"})
+    assert meter.tokens > 0
+    assert meter.tokens < 10
+
+
+@pytest.mark.asyncio
+async def test_run_until_disconnect_cancels_work():
+    """Tests that a disconnect cancels the awaited call and raises ClientDisconnected."""
+    cancelled = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(ClientDisconnected):
+        await run_until_disconnect(FakeRequest(after=1), slow(), poll=0.01)
+    assert cancelled.is_set()
+
+    async def fast():
+        return "ok"
+
+    assert await run_until_disconnect(FakeRequest(after=100), fast(), poll=0.01) == "ok"
+    assert await run_until_disconnect(None, fast()) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_chat_disconnect_refunds_and_frees_slot():
+    """Tests that a client disconnect aborts the provider call, releases the slot and refunds."""
+    adapter = MagicMock()
+    adapter.name = "mock_adapter"
+    aborted = asyncio.Event()
+
+    async def hang(*args, **kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            aborted.set()
+            raise
+
+    adapter.chat.side_effect = hang
+    limiter = AdaptiveLimiter("mock_adapter", initial_limit=4)
+    stats = CancellationStats()
+    body = ChatRequest(model="gpt-4o-mini", messages=[{"role": "user", "content": "Hi"}], max_tokens=300)
+
+    with patch("services.ucapi.gateway.resolve", return_value=(adapter, "mock-model")), \
+         patch("services.ucapi.gateway.limiter_for", return_value=limiter), \
+         patch("services.ucapi.gateway.check_egress", new=AsyncMock()), \
+         patch("services.ucapi.gateway.estimate_and_reserve_budget", new=AsyncMock()), \
+         patch("services.ucapi.gateway.refund_budget", new=AsyncMock()) as refund, \
+         patch("services.ucapi.gateway.audit_event", new=AsyncMock()) as audit, \
+         patch("services.ucapi.gateway.CANCELLATIONS", stats):
+        response = await chat(body, {"sub": "spiffe://test.org/service"}, FakeRequest(after=1))
+
+    assert response.status_code == 499
+    assert aborted.is_set()
+    assert limiter.in_flight == 0
+    assert limiter.stats["throttled"] == 0
+    assert refund.call_args.args[2] == 300
+    assert audit.call_args.args[0] == "ucapi_chat_cancelled"
+    assert stats.snapshot()["chat"] == 1
+    assert stats.snapshot()["tokens_saved"] == 300
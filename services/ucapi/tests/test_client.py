@@ -0,0 +1,230 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from services.ucapi.client import StreamTruncated, UCAPIClient, UCAPIError, iter_sse
+
+
+def client_for(handler, **kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    return UCAPIClient("http://ucapi", "key", transport=httpx.MockTransport(handler), **kwargs)
+
+
+def completion(text):
+    return {"choices": [{"message": {"role": "assistant", "content": text}}]}
+
+
+class DroppingStream(httpx.AsyncByteStream):
+    """Sends some bytes, then fails like a connection reset."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def __aiter__(self):
+        yield self.body
+        raise httpx.ReadError("connection reset")
+
+
+async def lines(*items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.asyncio
+async def test_iter_sse_reassembles_events():
+    """Tests multi-line data, ids, comments and a trailing event without a blank line."""
+    events = [e async for e in iter_sse(lines(
+        ": keep-alive", "id: 1", "event: message.delta", 'data: {"delta":', 'data: "hi"}', "",
+        "id: 2", "data: tail",
+    ))]
+    assert [(e.id, e.event) for e in events] == [("1", "message.delta"), ("2", "message")]
+    assert events[0].json() == {"delta": "hi"}
+    assert events[1].data == "tail"
+
+
+@pytest.mark.asyncio
+async def test_chat_retries_throttling_then_succeeds():
+    """Tests retry on 503 with Retry-After, and no retry on client errors."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(503, headers={"Retry-After": "0"}, json={"error": {"type": "UPSTREAM_SATURATED", "message": "busy"}})
+        return httpx.Response(200, json=completion("ok"))
+
+    async with client_for(handler) as client:
+        assert await client.chat_text("m", [{"role": "user", "content": "hi"}]) == "ok"
+        assert client.stats["retries"] == 1
+
+    def bad_request(request):
+        return httpx.Response(400, json={"detail": "Model alias 'x' not found"})
+
+    async with client_for(bad_request) as client:
+        with pytest.raises(UCAPIError) as info:
+            await client.chat("x", [])
+    assert info.value.status == 400
+    assert "not found" in str(info.value)
+
+
+@pytest.mark.asyncio
+async def test_chat_posts_are_not_resent_once_they_may_have_reached_upstream():
+    """Tests that chat is only retried when provably unsent, while idempotent GETs retry broadly."""
+    for failure in [lambda: httpx.Response(502), lambda: httpx.Response(503), lambda: httpx.Response(504)]:
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return failure()
+
+        async with client_for(handler) as client:
+            with pytest.raises(UCAPIError):
+                await client.chat("m", [{"role": "user", "content": "hi"}])
+        assert len(calls) == 1
+
+    calls = []
+
+    def broken_exchange(request):
+        calls.append(request)
+        raise httpx.RemoteProtocolError("server disconnected")
+
+    async with client_for(broken_exchange) as client:
+        with pytest.raises(httpx.RemoteProtocolError):
+            await client.chat("m", [{"role": "user", "content": "hi"}])
+    assert len(calls) == 1
+
+    calls = []
+
+    def unreachable_then_ok(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused")
+        if request.url.path == "/v1/models" and len(calls) == 3:
+            return httpx.Response(502)
+        return httpx.Response(200, json={"data": []} if request.url.path == "/v1/models" else completion("ok"))
+
+    async with client_for(unreachable_then_ok) as client:
+        assert await client.chat_text("m", [{"role": "user", "content": "hi"}]) == "ok"
+        assert await client.models() == []
+    assert len(calls) == 4
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_hands_the_call_to_a_follower():
+    """Tests that cancelling the caller whose request is in flight does not cancel coalesced followers."""
+    calls = 0
+    gate = asyncio.Event()
+
+    async def handler(request):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await gate.wait()  # the leader's request hangs until it is cancelled
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json=completion("shared"))
+
+    async with client_for(handler) as client:
+        messages = [{"role": "user", "content": "same"}]
+        leader = asyncio.create_task(client.chat("m", messages))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(client.chat("m", messages)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        gate.set()
+
+    assert leader.cancelled()
+    assert results == [completion("shared")] * 3
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_chats_are_coalesced():
+    """Tests that identical in-flight requests share one HTTP call unless opted out."""
+    calls = 0
+
+    async def handler(request):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json=completion("shared"))
+
+    async with client_for(handler) as client:
+        messages = [{"role": "user", "content": "same"}]
+        results = await asyncio.gather(*[client.chat("m", messages) for _ in range(5)])
+        assert calls == 1
+        assert client.stats["coalesced"] == 4
+        assert all(r == completion("shared") for r in results)
+
+        await asyncio.gather(client.chat("m", messages, coalesce=False), client.chat("m", messages, coalesce=False))
+        assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_stream_resumes_after_connection_drop():
+    """Tests that a dropped stream is resumed from Last-Event-ID without repeating events."""
+    seen = []
+
+    def frame(seq, event):
+        return f"id: {seq}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n".encode()
+
+    def handler(request):
+        seen.append((request.method, request.url.path, request.headers.get("Last-Event-ID")))
+        headers = {"X-UCAPI-Stream-Id": "abc", "Content-Type": "text/event-stream"}
+        if request.method == "POST":
+            body = frame(1, {"event": "message.delta", "delta": "Hel"})
+            return httpx.Response(200, headers=headers, stream=DroppingStream(body))
+        body = frame(2, {"event": "message.delta", "delta": "lo"}) + frame(3, {"event": "message.done"})
+        return httpx.Response(200, headers=headers, content=body)
+
+    async with client_for(handler) as client:
+        events = [e async for e in client.stream("m", [{"role": "user", "content": "hi"}])]
+
+    assert [e.get("delta") for e in events] == ["Hel", "lo", None]
+    assert events[-1]["event"] == "message.done"
+    assert seen == [("POST", "/v1/chat/stream", None), ("GET", "/v1/chat/stream/abc", "1")]
+
+
+@pytest.mark.asyncio
+async def test_stream_error_event_raises():
+    """Tests that an SSE error event surfaces as UCAPIError."""
+    def handler(request):
+        body = b'event: error\ndata: {"type": "PROVIDER_ERROR", "message": "down"}\n\n'
+        return httpx.Response(200, headers={"X-UCAPI-Stream-Id": "x"}, content=body)
+
+    async with client_for(handler) as client:
+        with pytest.raises(UCAPIError) as info:
+            async for _ in client.stream("m", []):
+                pass
+    assert info.value.type == "PROVIDER_ERROR"
+
+
+@pytest.mark.asyncio
+async def test_stream_closed_before_done_resumes_then_reports_truncation():
+    """Tests that an EOF without message.done is resumed, and raises StreamTruncated when it keeps happening."""
+    seen = []
+
+    def handler(request):
+        seen.append((request.method, request.headers.get("Last-Event-ID")))
+        body = b'id: 1\nevent: message.delta\ndata: {"delta": "Hel"}\n\n' if request.method == "POST" else b""
+        return httpx.Response(200, headers={"X-UCAPI-Stream-Id": "abc"}, content=body)
+
+    async with client_for(handler, retries=2) as client:
+        events = []
+        with pytest.raises(StreamTruncated) as info:
+            async for event in client.stream("m", []):
+                events.append(event)
+
+    assert [e["delta"] for e in events] == ["Hel"]
+    assert (info.value.stream_id, info.value.last_event_id) == ("abc", "1")
+    assert seen == [("POST", None), ("GET", "1"), ("GET", "1")]
+
+    def no_id(request):
+        return httpx.Response(200, content=b'event: message.delta\ndata: {"delta": "x"}\n\n')
+
+    async with client_for(no_id) as client:
+        with pytest.raises(StreamTruncated):
+            async for _ in client.stream("m", []):
+                pass
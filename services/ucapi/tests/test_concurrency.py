@@ -0,0 +1,251 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from services.ucapi.concurrency import (
+    AdaptiveLimiter,
+    DEADLINE_HEADER,
+    DeadlineUnmeetable,
+    PRIORITIES,
+    UpstreamSaturated,
+    classify_failure,
+    deadline_from,
+    parse_retry_after,
+    priority_of,
+)
+
+
+def throttled(retry_after: str | None = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    headers = {"retry-after": retry_after} if retry_after else {}
+    response = httpx.Response(429, headers=headers, request=request)
+    return httpx.HTTPStatusError("Too Many Requests", request=request, response=response)
+
+
+def test_priority_of_reads_metadata():
+    """Tests that priority classes come from metadata with a sane fallback."""
+    assert priority_of({"priority": "interactive"}) == PRIORITIES["interactive"]
+    assert priority_of(None) == PRIORITIES["normal"]
+    assert priority_of({}, default="batch") == PRIORITIES["batch"]
+    assert priority_of({"priority": "whatever"}) == PRIORITIES["normal"]
+
+
+def test_parse_retry_after_and_classify():
+    """Tests Retry-After parsing and overload classification."""
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert classify_failure(throttled("3")) == (True, 3.0)
+    assert classify_failure(httpx.ReadTimeout("slow")) == (True, None)
+    assert classify_failure(ValueError("bad")) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_additive_increase_and_multiplicative_decrease():
+    """Tests the AIMD adjustments of the in-flight limit."""
+    limiter = AdaptiveLimiter("test", initial_limit=4)
+    # Idle successes say nothing about spare capacity
+    for _ in range(4):
+        async with limiter.slot():
+            pass
+    assert limiter.limit == 4
+
+    release = asyncio.Event()
+
+    async def busy():
+        async with limiter.slot():
+            await release.wait()
+
+    tasks = [asyncio.create_task(busy()) for _ in range(4)]
+    await asyncio.sleep(0)
+    assert limiter.in_flight == 4
+    release.set()
+    await asyncio.gather(*tasks)
+    grown = limiter.limit
+    assert grown == pytest.approx(4.25)  # only the completion at full utilisation counts
+
+    with pytest.raises(httpx.HTTPStatusError):
+        async with limiter.slot():
+            raise throttled()
+    assert limiter.limit == pytest.approx(grown / 2)
+
+    # A burst of 429s inside the cooldown counts as one congestion event
+    limit_after_first = limiter.limit
+    with pytest.raises(httpx.HTTPStatusError):
+        async with limiter.slot():
+            raise throttled()
+    assert limiter.limit == limit_after_first
+    assert limiter.stats["throttled"] == 2
+    assert limiter.in_flight == 0
+
+    # Errors that are not overload signals release the slot without moving the limit
+    with pytest.raises(ValueError):
+        async with limiter.slot():
+            raise ValueError("bad request")
+    assert limiter.limit == limit_after_first
+    assert limiter.stats["succeeded"] == 8
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_dispatches_by_priority():
+    """Tests that queued requests are admitted in priority order."""
+    limiter = AdaptiveLimiter("test", initial_limit=1)
+    order = []
+    await limiter.acquire()
+
+    async def waiter(name, priority):
+        async with limiter.slot(priority):
+            order.append(name)
+
+    tasks = [
+        asyncio.create_task(waiter("batch", PRIORITIES["batch"])),
+        asyncio.create_task(waiter("normal", PRIORITIES["normal"])),
+        asyncio.create_task(waiter("interactive", PRIORITIES["interactive"])),
+    ]
+    await asyncio.sleep(0)
+    assert limiter.snapshot()["queued"] == 3
+
+    limiter.release()
+    await asyncio.gather(*tasks)
+    assert order == ["interactive", "normal", "batch"]
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_every_request():
+    """Tests that one Retry-After holds back all queued requests to the provider."""
+    limiter = AdaptiveLimiter("test", initial_limit=4)
+    with pytest.raises(httpx.HTTPStatusError):
+        async with limiter.slot():
+            raise throttled("0.05")
+
+    start = time.monotonic()
+    async with limiter.slot():
+        waited = time.monotonic() - start
+    assert waited >= 0.04
+    assert limiter.stats["queued"] == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_and_cancelled_waiters_are_skipped():
+    """Tests queue bounds and that cancelled waiters do not leak slots."""
+    limiter = AdaptiveLimiter("test", initial_limit=1, max_queue=1)
+    await limiter.acquire()
+
+    queued = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(UpstreamSaturated):
+        await limiter.acquire()
+
+    queued.cancel()
+    await asyncio.gather(queued, return_exceptions=True)
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_estimate_wait_uses_service_time():
+    """Tests queue wait estimates built from observed service times."""
+    limiter = AdaptiveLimiter("test", initial_limit=2)
+    assert limiter.estimate_wait() == 0.0
+    limiter.observe(0.2)
+    await limiter.acquire()
+    await limiter.acquire()
+    assert limiter.estimate_wait() == pytest.approx(0.2)
+    assert limiter.can_meet(PRIORITIES["normal"], time.monotonic() + 1.0)
+    assert not limiter.can_meet(PRIORITIES["normal"], time.monotonic() + 0.3)
+    assert limiter.can_meet(PRIORITIES["normal"], None)
+
+
+def test_deadline_from_header_or_metadata():
+    """Tests that deadlines come from the header first, then metadata."""
+    now = time.monotonic()
+    assert deadline_from({DEADLINE_HEADER: "500"}, {"deadline_ms": 10_000}) == pytest.approx(now + 0.5, abs=0.05)
+    assert deadline_from(None, {"deadline_ms": 2000}) == pytest.approx(now + 2.0, abs=0.05)
+    assert deadline_from({}, {"deadline_ms": "soon"}) is None
+
+
+@pytest.mark.asyncio
+async def test_waiters_past_their_deadline_are_shed():
+    """Tests that queued requests whose deadline lapses fail fast instead of running."""
+    limiter = AdaptiveLimiter("test", initial_limit=1)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire(deadline=time.monotonic() + 0.01))
+    await asyncio.sleep(0.02)
+    limiter.release()
+    with pytest.raises(DeadlineUnmeetable):
+        await waiter
+    assert limiter.stats["shed"] == 1
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_codel_sheds_after_sustained_queue_delay():
+    """Tests that waiters are shed only once delay stays above target for an interval."""
+    limiter = AdaptiveLimiter("test", initial_limit=1, codel_target=0.01, codel_interval=0.02)
+    await limiter.acquire()
+    waiters = [asyncio.create_task(limiter.acquire()) for _ in range(3)]
+    await asyncio.sleep(0.05)
+
+    limiter.release()  # first over-target dequeue starts the interval; admitted
+    await waiters[0]
+    await asyncio.sleep(0.03)
+    limiter.release()  # still over target after the interval: shed, next one admitted
+    results = await asyncio.gather(*waiters[1:], return_exceptions=True)
+    assert sum(isinstance(r, UpstreamSaturated) for r in results) == 1
+    assert limiter.stats["shed"] == 1
+    assert limiter.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_noisy_tenant_does_not_starve_others():
+    """Tests that a tenant with a deep backlog shares slots with a late arrival."""
+    limiter = AdaptiveLimiter("test", initial_limit=1)
+    await limiter.acquire(tenant="noisy")
+    order = []
+
+    async def request(tenant):
+        await limiter.acquire(tenant=tenant)
+        order.append(tenant)
+
+    tasks = [asyncio.create_task(request("noisy")) for _ in range(5)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(request("quiet")) for _ in range(2)]
+    await asyncio.sleep(0)
+    for _ in range(7):
+        limiter.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+    assert order.index("quiet") <= 1
+    assert order[:4].count("quiet") == 2
+    tenants = limiter.snapshot()["tenants"]
+    assert tenants["noisy"]["admitted"] == 6
+    assert tenants["quiet"]["admitted"] == 2
+    assert tenants["quiet"]["waiting"] == 0
+
+
+@pytest.mark.asyncio
+async def test_tenant_weights_scale_share():
+    """Tests that a tenant with weight 2 gets two slots per slot of a weight-1 tenant."""
+    limiter = AdaptiveLimiter("test", initial_limit=1)
+    await limiter.acquire(tenant="a")
+    order = []
+
+    async def request(tenant):
+        await limiter.acquire(tenant=tenant)
+        order.append(tenant)
+
+    with patch.dict("services.ucapi.concurrency.TENANT_WEIGHTS", {"heavy": 2}):
+        tasks = [asyncio.create_task(request(t)) for t in ["a"] * 4 + ["heavy"] * 4]
+        await asyncio.sleep(0)
+        for _ in range(8):
+            limiter.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    assert order[:6].count("heavy") == 4
+    assert order[:6].count("a") == 2
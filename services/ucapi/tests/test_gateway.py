@@ -115,4 +115,104 @@ def test_chat_provider_error(mock_adapter_fixture):
     assert response.status_code == 502
     error_data = response.json()["error"]
     assert error_data["type"] == "PROVIDER_ERROR"
-    assert "Provider is down" in error_data["message"]
\ No newline at end of file
+    assert "Provider is down" in error_data["message"]
+
+def test_chat_batch_streams_ndjson_results(mock_adapter_fixture):
+    """Tests that a batch returns one NDJSON line per request with stable ids."""
+    async def mock_chat(provider_model, messages, *args, **kwargs):
+        return {"choices": [{"message": {"content": messages[-1]["content"].upper()}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}
+
+    mock_adapter_fixture.chat.side_effect = mock_chat
+
+    payload = {
+        "requests": [
+            {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "a"}], "metadata": {"custom_id": "first"}},
+            {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "b"}]},
+        ],
+        "metadata": {"job_id": "nightly"},
+    }
+    with patch("services.ucapi.gateway.check_egress", new=AsyncMock()) as egress, \
+         patch("services.ucapi.gateway.estimate_and_reserve_budget", new=AsyncMock()) as budget:
+        response = client.post("/v1/chat/batch", json=payload)
+
+    assert response.status_code == 200
+    assert "application/x-ndjson" in response.headers["content-type"]
+    lines = {line["id"]: line for line in map(json.loads, response.text.splitlines())}
+    assert lines["first"]["response"]["choices"][0]["message"]["content"] == "A"
+    assert lines["1"]["index"] == 1
+    assert lines["1"]["status"] == 200
+    assert mock_adapter_fixture.chat.call_count == 2
+    egress.assert_awaited_once()
+    budget.assert_awaited_once()
+    assert budget.call_args.args[2]["requests"] == 2
+
+
+def test_chat_batch_reports_item_errors(mock_adapter_fixture):
+    """Tests that invalid items and provider failures are reported per item."""
+    mock_adapter_fixture.chat.side_effect = Exception("Provider is down")
+
+    payload = {
+        "requests": [
+            {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "a"}]},
+            {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "b"}]},
+        ],
+    }
+    with patch("services.ucapi.normalized.fit_to_window", side_effect=[ValueError("too long"), ([], 0)]):
+        response = client.post("/v1/chat/batch", json=payload)
+
+    lines = sorted(map(json.loads, response.text.splitlines()), key=lambda line: line["index"])
+    assert [line["status"] for line in lines] == [400, 502]
+    assert lines[0]["error"]["type"] == "INVALID_REQUEST"
+    assert "Provider is down" in lines[1]["error"]["message"]
+
+
+def test_chat_batch_rejects_empty_batch():
+    """Tests that an empty batch fails validation."""
+    response = client.post("/v1/chat/batch", json={"requests": []})
+    assert response.status_code == 422
+
+
+def test_chat_fails_fast_when_deadline_cannot_be_met(mock_adapter_fixture):
+    """Tests that a request whose deadline is shorter than the service time gets a 503."""
+    from services.ucapi.concurrency import limiter_for
+    limiter = limiter_for(mock_adapter_fixture.name)
+    previous = limiter.service_time
+    limiter.service_time = 5.0
+    try:
+        with patch("services.ucapi.gateway.estimate_and_reserve_budget", new=AsyncMock()) as budget:
+            response = client.post(
+                "/v1/chat",
+                json={"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "Hi"}]},
+                headers={"X-UCAPI-Deadline-Ms": "100"},
+            )
+    finally:
+        limiter.service_time = previous
+
+    assert response.status_code == 503
+    assert response.json()["error"]["type"] == "DEADLINE_UNMEETABLE"
+    budget.assert_not_awaited()
+    mock_adapter_fixture.chat.assert_not_called()
+
+
+def test_chat_downgrades_to_fallback_alias_under_deadline(monkeypatch):
+    """Tests that a slow primary route is swapped for its registry fallback."""
+    from services.ucapi.concurrency import limiter_for
+    slow, fast = AsyncMock(), AsyncMock()
+    slow.name, fast.name = "slow_provider", "fast_provider"
+    fast.chat.return_value = {"choices": [{"message": {"content": "quick"}}]}
+    limiter_for("slow_provider").service_time = 5.0
+    limiter_for("fast_provider").service_time = 0.01
+    monkeypatch.setitem(REGISTRY, "big", {"adapter": "slow", "provider_model": "big-1", "fallback": "small"})
+    monkeypatch.setitem(REGISTRY, "small", {"adapter": "fast", "provider_model": "small-1"})
+    routes = {"big": (slow, "big-1"), "small": (fast, "small-1")}
+
+    with patch("services.ucapi.gateway.resolve", side_effect=lambda alias: routes[alias]):
+        response = client.post(
+            "/v1/chat",
+            json={"model": "big", "messages": [{"role": "user", "content": "Hi"}], "metadata": {"deadline_ms": 1000}},
+        )
+
+    assert response.status_code == 200
+    assert fast.chat.call_args.args[0] == "small-1"
+    slow.chat.assert_not_called()
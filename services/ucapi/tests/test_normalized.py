@@ -0,0 +1,43 @@
+from services.ucapi.normalized import normalize
+from services.ucapi.schemas import ChatRequest
+
+
+def make_request(**overrides):
+    data = {
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "user", "content": "Hi"}],
+        "tools": [{"type": "function", "name": "lookup", "description": "d", "parameters": {"type": "object"}}],
+        "metadata": {"job_id": "job-1"},
+    }
+    data.update(overrides)
+    return ChatRequest(**data)
+
+
+def test_normalize_dumps_once_and_shares_dicts():
+    """Tests that every pipeline stage reads the same dumped structures."""
+    nreq = normalize(make_request())
+    assert nreq.job_id == "job-1"
+    assert nreq.messages == ({"role": "user", "content": "Hi"},)
+    assert nreq.budget_params["messages"] is nreq.messages
+    assert nreq.budget_params["tools"] is nreq.tools
+    assert nreq.params == {"temperature": 0.2, "max_tokens": 1000}
+    assert nreq.prompt_tokens > 0
+
+
+def test_canonical_bytes_and_hash_are_stable():
+    """Tests that the canonical form ignores metadata and is cached."""
+    a = normalize(make_request())
+    b = normalize(make_request(metadata={"job_id": "other"}))
+    c = normalize(make_request(temperature=0.9))
+    assert a.canonical == b.canonical
+    assert a.content_hash == b.content_hash
+    assert a.content_hash != c.content_hash
+    assert a.canonical is a.canonical
+    assert b'"messages":[{"content":"Hi","role":"user"}]' in a.canonical
+
+
+def test_missing_metadata_defaults():
+    """Tests defaults when the request carries no metadata or tools."""
+    nreq = normalize(ChatRequest(model="gpt-4o-mini", messages=[{"role": "user", "content": "Hi"}]))
+    assert nreq.job_id == "unknown"
+    assert nreq.tools is None
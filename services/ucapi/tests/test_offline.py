@@ -0,0 +1,275 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+from fastapi.testclient import TestClient
+
+from services.ucapi.gateway import app, verify_spiffe_identity
+from services.ucapi.offline import (
+    CallbackRejected, DeferredQueue, LocalBatchServer, OpenAIBatchBackend, check_callback_url, wants_deferred,
+)
+
+OWNER = "spiffe://test.org/service"
+
+
+def body(text):
+    return {"model": "m", "messages": [{"role": "user", "content": text}]}
+
+
+def public_dns(host):
+    return {"cb": ["93.184.216.34"], "internal": ["10.0.0.7"]}.get(host, ["93.184.216.35"])
+
+
+def local_queue(server, **kwargs):
+    kwargs.setdefault("flush_seconds", 60)
+    kwargs.setdefault("resolver", public_dns)
+    kwargs.setdefault("refund", AsyncMock())
+    return DeferredQueue(backend_for=lambda name: server if name == "openai" else None, poll_seconds=0.01, **kwargs)
+
+
+def test_wants_deferred_is_opt_in():
+    """Tests that only requests flagged deferred take the offline path."""
+    assert wants_deferred({"deferred": True})
+    assert not wants_deferred({"priority": "batch"})
+    assert not wants_deferred(None)
+
+
+@pytest.mark.asyncio
+async def test_requests_pack_into_one_batch_and_complete():
+    """Tests that a full batch is submitted as one file and each result is delivered by callback."""
+    server = LocalBatchServer()
+    callbacks = []
+
+    def handler(request):
+        callbacks.append(json.loads(request.content))
+        return httpx.Response(204)
+
+    queue = local_queue(server, max_requests=3, callback_transport=httpx.MockTransport(handler))
+    results = [queue.enqueue("openai", OWNER, "job", "gpt-4o-mini", body(t), callback_url="http://cb/hook")
+               for t in ["a", "b", "c"]]
+    assert not queue.accepts("anthropic")
+    with pytest.raises(ValueError):
+        queue.enqueue("anthropic", OWNER, "job", "sonnet-latest", body("x"))
+
+    await queue.drain()
+
+    assert server.stats == {"batches": 1, "requests": 3, "bytes": server.stats["bytes"]}
+    assert [queue.get(r.id, OWNER).response["choices"][0]["message"]["content"] for r in results] == ["a", "b", "c"]
+    assert all(queue.get(r.id, OWNER).status == "completed" for r in results)
+    assert queue.get(results[0].id, "spiffe://test.org/other") is None
+    assert sorted(c["id"] for c in callbacks) == sorted(r.id for r in results)
+    stats = queue.snapshot()
+    assert stats["completed"] == 3
+    assert stats["avg_batch_size"] == 3
+    assert stats["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_partial_batches_flush_after_timeout():
+    """Tests that a batch below the size limit is still submitted once the flush timer fires."""
+    server = LocalBatchServer(latency=0.02)
+    queue = local_queue(server, flush_seconds=0.01)
+    result = queue.enqueue("openai", OWNER, "job", "gpt-4o-mini", body("hi"))
+    await asyncio.sleep(0.02)
+    assert result.status == "submitted"
+    for _ in range(100):
+        if result.status == "completed":
+            break
+        await asyncio.sleep(0.01)
+    assert result.status == "completed"
+
+
+@pytest.mark.asyncio
+async def test_failed_lines_and_submit_errors_are_reported():
+    """Tests per-line provider errors and whole-batch submission failures."""
+    def responder(b):
+        if b["messages"][0]["content"] == "bad":
+            raise ValueError("nope")
+        return {"ok": True}
+
+    queue = local_queue(LocalBatchServer(responder=responder))
+    good = queue.enqueue("openai", OWNER, "job", "m", body("good"))
+    bad = queue.enqueue("openai", OWNER, "job", "m", body("bad"))
+    await queue.drain()
+    assert good.status == "completed"
+    assert bad.status == "failed"
+    assert bad.error["message"] == "nope"
+
+    broken = MagicMock()
+    broken.submit = AsyncMock(side_effect=RuntimeError("upload refused"))
+    refund = AsyncMock()
+    queue = local_queue(broken, refund=refund)
+    result = queue.enqueue("openai", OWNER, "job", "m", body("x"), reserved_tokens=120)
+    await queue.drain()
+    assert result.status == "failed"
+    assert result.error["type"] == "BATCH_SUBMIT_FAILED"
+    refund.assert_awaited_once_with("job", "m", 120)
+    assert queue.snapshot()["refunded_tokens"] == 120
+    assert "reserved_tokens" not in result.public()
+
+
+@pytest.mark.asyncio
+async def test_failed_lines_refund_but_completed_ones_do_not():
+    """Tests that only failed requests give their budget reservation back."""
+    def responder(b):
+        if b["messages"][0]["content"] == "bad":
+            raise ValueError("nope")
+        return {"ok": True}
+
+    refund = AsyncMock()
+    queue = local_queue(LocalBatchServer(responder=responder), refund=refund)
+    queue.enqueue("openai", OWNER, "job", "m", body("good"), reserved_tokens=10)
+    queue.enqueue("openai", OWNER, "job", "m", body("bad"), reserved_tokens=30)
+    await queue.drain()
+    refund.assert_awaited_once_with("job", "m", 30)
+
+
+class CorruptingBatchServer(LocalBatchServer):
+    """Truncates the second output line and prepends lines that are not result objects."""
+
+    async def poll(self, batch_id):
+        output = await super().poll(batch_id)
+        if output is None:
+            return None
+        lines = output.decode().splitlines()
+        lines[1] = lines[1][:25]
+        return ("\n".join(["{not json", "[1, 2]", *lines]) + "\n").encode()
+
+
+@pytest.mark.asyncio
+async def test_corrupt_output_lines_fail_only_their_requests():
+    """Tests that unreadable output lines are skipped and their requests failed and refunded."""
+    refund = AsyncMock()
+    queue = local_queue(CorruptingBatchServer(), refund=refund)
+    results = [queue.enqueue("openai", OWNER, "job", "m", body(t), reserved_tokens=10 * (i + 1))
+               for i, t in enumerate(["a", "b", "c"])]
+    await queue.drain()
+
+    assert [r.status for r in results] == ["completed", "failed", "completed"]
+    assert results[1].error["type"] == "BATCH_INCOMPLETE"
+    refund.assert_awaited_once_with("job", "m", 20)
+    assert queue.snapshot()["corrupt_lines"] == 3
+
+
+def test_callback_urls_must_be_public_and_allowlisted():
+    """Tests that callbacks cannot target private, loopback or link-local addresses, or unlisted hosts."""
+    assert check_callback_url("https://cb/hook", resolver=public_dns) == "cb"
+    for url in ["http://127.0.0.1/x", "http://169.254.169.254/latest/meta-data", "http://[::1]/x",
+                "http://10.1.2.3/x", "ftp://cb/x", "/relative", "http://user:pw@cb/x", "http://internal/x"]:
+        with pytest.raises(CallbackRejected):
+            check_callback_url(url, resolver=public_dns)
+    assert check_callback_url("https://cb/hook", {"cb"}, resolver=public_dns) == "cb"
+    with pytest.raises(CallbackRejected):
+        check_callback_url("https://elsewhere/hook", {"cb"}, resolver=public_dns)
+
+    def broken(host):
+        raise OSError("no such host")
+
+    with pytest.raises(CallbackRejected):
+        check_callback_url("https://nowhere/hook", resolver=broken)
+
+
+@pytest.mark.asyncio
+async def test_callbacks_are_rechecked_before_delivery():
+    """Tests that a callback host which now resolves inward is never POSTed to."""
+    posted = []
+    dns = {"cb": ["93.184.216.34"]}
+    queue = local_queue(LocalBatchServer(), resolver=lambda host: dns[host],
+                        callback_transport=httpx.MockTransport(lambda r: posted.append(r) or httpx.Response(204)))
+    result = queue.enqueue("openai", OWNER, "job", "m", body("x"), callback_url="http://cb/hook")
+    dns["cb"] = ["127.0.0.1"]
+    await queue.drain()
+    assert result.status == "completed"
+    assert posted == []
+    assert queue.snapshot()["callbacks_rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_openai_backend_uploads_and_collects_output(monkeypatch):
+    """Tests the OpenAI Batch API calls: file upload, batch create, status poll, output download."""
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    status = {"value": "in_progress"}
+    output = b'{"custom_id":"dfr_1","response":{"status_code":200,"body":{"ok":true}},"error":null}'
+
+    def handler(request):
+        path = request.url.path
+        if path == "/v1/files":
+            assert b'name="purpose"' in request.content
+            return httpx.Response(200, json={"id": "file-in"})
+        if path == "/v1/batches":
+            assert json.loads(request.content)["input_file_id"] == "file-in"
+            return httpx.Response(200, json={"id": "batch_1"})
+        if path == "/v1/batches/batch_1":
+            return httpx.Response(200, json={"id": "batch_1", "status": status["value"], "output_file_id": "file-out"})
+        if path == "/v1/files/file-out/content":
+            return httpx.Response(200, content=output)
+        return httpx.Response(404)
+
+    backend = OpenAIBatchBackend(transport=httpx.MockTransport(handler))
+    assert await backend.submit(b"{}\n") == "batch_1"
+    assert await backend.poll("batch_1") is None
+    status["value"] = "completed"
+    assert await backend.poll("batch_1") == output + b"\n"
+
+
+def test_gateway_defers_flagged_requests():
+    """Tests that a deferred chat returns 202 and its result is served once the batch completes."""
+    async def override():
+        return {"sub": OWNER}
+
+    app.dependency_overrides[verify_spiffe_identity] = override
+    adapter = MagicMock()
+    adapter.name = "openai"
+    adapter.payload.side_effect = lambda model, messages, *args: {"model": model, "messages": list(messages)}
+    queue = local_queue(LocalBatchServer(), flush_seconds=0)
+
+    with TestClient(app) as client, \
+         patch("services.ucapi.gateway.resolve", return_value=(adapter, "gpt-4o-mini")), \
+         patch("services.ucapi.gateway.check_egress", new=AsyncMock()), \
+         patch("services.ucapi.gateway.estimate_and_reserve_budget", new=AsyncMock()), \
+         patch("services.ucapi.gateway.DEFERRED", queue):
+        response = client.post("/v1/chat", json={"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "later"}],
+                                                 "metadata": {"deferred": True}})
+        assert response.status_code == 202
+        result_id = response.json()["id"]
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            result = client.get(f"/v1/deferred/{result_id}").json()
+            if result["status"] == "completed":
+                break
+            time.sleep(0.01)
+        stats = client.get("/v1/deferred").json()
+
+    assert result["response"]["choices"][0]["message"]["content"] == "later"
+    assert stats["completed"] == 1
+    adapter.chat.assert_not_called()
+
+
+def test_gateway_rejects_internal_callbacks_before_reserving_budget():
+    """Tests that a deferred request with an internal callback URL is refused up front."""
+    async def override():
+        return {"sub": OWNER}
+
+    app.dependency_overrides[verify_spiffe_identity] = override
+    adapter = MagicMock()
+    adapter.name = "openai"
+    reserve = AsyncMock()
+    queue = local_queue(LocalBatchServer())
+
+    with TestClient(app) as client, \
+         patch("services.ucapi.gateway.resolve", return_value=(adapter, "gpt-4o-mini")), \
+         patch("services.ucapi.gateway.check_egress", new=AsyncMock()), \
+         patch("services.ucapi.gateway.estimate_and_reserve_budget", new=reserve), \
+         patch("services.ucapi.gateway.DEFERRED", queue):
+        chat = client.post("/v1/chat", json={"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "x"}],
+                                             "metadata": {"deferred": True, "callback_url": "http://169.254.169.254/"}})
+        batch = client.post("/v1/chat/batch", json={"requests": [{"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "x"}]}],
+                                                    "metadata": {"deferred": True, "callback_url": "http://internal/hook"}})
+
+    assert chat.status_code == 400
+    assert batch.status_code == 400
+    reserve.assert_not_awaited()
+    assert queue.snapshot()["queued"] == 0
@@ -1,4 +1,9 @@
+import asyncio
+import time
+
 import pytest
+from services.ucapi import registry
+from services.ucapi.registry import REGISTRY
 from services.ucapi.router import resolve
 from services.ucapi.adapters.openai_adapter import OpenAIAdapter
 from services.ucapi.adapters.anthropic_adapter import AnthropicAdapter
@@ -20,11 +25,116 @@ def test_resolve_invalid_model():
     with pytest.raises(ValueError, match="Model alias 'invalid-model' not found in registry."):
         resolve("invalid-model")
 
-from services.ucapi.registry import REGISTRY
-
 def test_resolve_model_with_unregistered_adapter(monkeypatch):
     """Tests that a model with an unregistered adapter raises a ValueError."""
     # Temporarily add a model to the registry that points to a non-existent adapter
     monkeypatch.setitem(REGISTRY, "new-model", {"adapter": "unregistered", "provider_model": "some-model"})
     with pytest.raises(ValueError, match="Adapter 'unregistered' not found."):
-        resolve("new-model")
\ No newline at end of file
+        resolve("new-model")
+
+class FakeRegistrySource:
+    """Stands in for CockroachRegistrySource."""
+
+    def __init__(self, revision, routes):
+        self.rev = revision
+        self.rows = routes
+        self.loaded_revision = None
+        self.loads = 0
+
+    async def revision(self):
+        return self.rev
+
+    async def routes(self):
+        self.loads += 1
+        return self.rev, self.rows
+
+
+def test_poll_swaps_snapshot_only_when_revision_changes(monkeypatch):
+    """Tests that the registry reloads on a new revision and is otherwise left alone."""
+    monkeypatch.setattr(registry, "_current", registry.current())
+    source = FakeRegistrySource(7, {"db-model": {"adapter": "openai", "provider_model": "gpt-4o"}})
+
+    assert asyncio.run(registry.poll_once(source)) is True
+    snap = registry.current()
+    assert snap.version == 7
+    assert resolve("db-model")[1] == "gpt-4o"
+    assert b'"id":"db-model"' in snap.models_body
+    with pytest.raises(ValueError):
+        resolve("gpt-4o-mini")
+
+    assert asyncio.run(registry.poll_once(source)) is False
+    assert registry.current() is snap
+    assert source.loads == 1
+
+
+def test_snapshot_routes_are_immutable():
+    """Tests that lookups cannot mutate the shared snapshot."""
+    with pytest.raises(TypeError):
+        registry.current().routes["gpt-4o-mini"]["adapter"] = "anthropic"
+
+
+def test_local_overrides_never_reuse_a_source_revision_etag(monkeypatch):
+    """Tests that a local edit publishes a snapshot whose ETag differs from every source revision."""
+    monkeypatch.setattr(registry, "_current", registry.build_snapshot(registry.STATIC_REGISTRY, 7))
+    base = registry.current().etag
+    REGISTRY["edited"] = {"adapter": "openai", "provider_model": "gpt-4o"}
+    first = registry.current()
+    assert first.version == 7
+    assert first.etag not in (base, "registry-8")
+    del REGISTRY["edited"]
+    assert registry.current().etag not in (base, first.etag)
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetchone(self):
+        return self.rows[0]
+
+    async def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    """Answers the two queries CockroachRegistrySource issues from fixed ucapi_model_registry rows."""
+    closed = False
+
+    def __init__(self, rows):
+        self.rows = rows  # (alias, adapter, provider_model, context_window, fallback, revision, enabled)
+
+    async def execute(self, sql):
+        if "max(revision)" in sql:
+            return FakeCursor([(max(r[5] for r in self.rows),)])
+        return FakeCursor(self.rows)
+
+
+def test_registry_fallback_column_drives_deadline_downgrades(monkeypatch):
+    """Tests that a fallback loaded from ucapi_model_registry is what admit() downgrades to."""
+    from services.ucapi.concurrency import limiter_for
+    from services.ucapi.gateway import admit
+
+    monkeypatch.setattr(registry, "_current", registry.current())
+    source = registry.CockroachRegistrySource("postgresql://unused")
+    source._conn = FakeConnection([
+        ("big", "anthropic", "claude-big", 200000, "small", 11, True),
+        ("small", "openai", "gpt-small", 128000, None, 12, True),
+        ("orphan", "openai", "gpt-x", None, "retired", 13, True),
+        ("retired", "openai", "gpt-old", None, None, 14, False),
+    ])
+    assert asyncio.run(registry.poll_once(source)) is True
+    routes = registry.current().routes
+    assert routes["big"]["fallback"] == "small"
+    assert "fallback" not in routes["orphan"]  # points at a disabled alias
+
+    monkeypatch.setattr(limiter_for("anthropic"), "service_time", 5.0)
+    monkeypatch.setattr(limiter_for("openai"), "service_time", 0.01)
+    alias, adapter, provider_model = admit("big", 1, time.monotonic() + 1.0)
+    assert (alias, adapter.name, provider_model) == ("small", "openai", "gpt-small")
+
+
+def test_static_routes_fall_back_to_a_registered_alias():
+    """Tests that every static fallback names another static alias."""
+    fallbacks = {alias: cfg["fallback"] for alias, cfg in registry.STATIC_REGISTRY.items() if "fallback" in cfg}
+    assert fallbacks
+    assert all(fb in registry.STATIC_REGISTRY and fb != alias for alias, fb in fallbacks.items())
@@ -0,0 +1,194 @@
+import threading
+import time
+
+import pytest
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+
+from services.semantics import comparator
+from services.ucapi.gateway import app, verify_spiffe_identity
+from services.ucapi.semantic_cache import SemanticCache, wants_semantic_cache
+
+
+class LetterModel:
+    """Embeds text as letter frequencies, so reworded prompts with the same letters score ~1."""
+
+    def encode(self, text):
+        vec = [0.0] * 26
+        for ch in text.lower():
+            if "a" <= ch <= "z":
+                vec[ord(ch) - 97] += 1.0
+        return vec
+
+
+class FakeComparator:
+    ready = True
+    model = LetterModel()
+
+
+TENANT = "spiffe://test.org/service"
+
+
+def user(text):
+    return [{"role": "system", "content": "be helpful"}, {"role": "user", "content": text}]
+
+
+@pytest.fixture
+def cache():
+    return SemanticCache(comparator=FakeComparator(), threshold=0.95, audit_rate=1.0)
+
+
+def test_wants_semantic_cache_is_opt_in():
+    """Tests that the semantic tier only applies when requested."""
+    assert wants_semantic_cache({"semantic_cache": True})
+    assert not wants_semantic_cache(None)
+    assert not wants_semantic_cache({"job_id": "x"})
+
+
+@pytest.mark.asyncio
+async def test_paraphrase_hits_and_unrelated_misses(cache):
+    """Tests that near-duplicates hit above the threshold and others miss."""
+    probe = await cache.lookup(TENANT, "gpt-4o-mini", user("what is an apple"))
+    assert probe.response is None
+    cache.store(probe, {"answer": "a fruit"})
+
+    hit = await cache.lookup(TENANT, "gpt-4o-mini", user("an apple is what"))
+    assert hit.response == {"answer": "a fruit"}
+    assert hit.score > 0.99
+
+    miss = await cache.lookup(TENANT, "gpt-4o-mini", user("explain kubernetes networking"))
+    assert miss.response is None
+
+    stats = cache.snapshot()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+    sample = stats["audit_samples"][0]
+    assert "what is an apple" not in str(sample)
+    assert sample["matched_prompt_sha256"] != sample["prompt_sha256"]
+
+
+@pytest.mark.asyncio
+async def test_partitions_by_alias_and_context(cache):
+    """Tests that the tenant, alias and preceding turns isolate cache entries."""
+    probe = await cache.lookup(TENANT, "gpt-4o-mini", user("what is an apple"))
+    cache.store(probe, {"answer": "a fruit"})
+
+    assert (await cache.lookup(TENANT, "sonnet-latest", user("what is an apple"))).response is None
+    other_tenant = await cache.lookup("spiffe://test.org/other", "gpt-4o-mini", user("what is an apple"))
+    assert other_tenant.response is None
+    other_system = [{"role": "system", "content": "answer in French"}, {"role": "user", "content": "what is an apple"}]
+    assert (await cache.lookup(TENANT, "gpt-4o-mini", other_system)).response is None
+
+
+@pytest.mark.asyncio
+async def test_partitions_by_sampling_parameters(cache):
+    """Tests that an answer cached under one temperature, max_tokens or tool setup never serves another."""
+    params = {"temperature": 0.2, "max_tokens": 10, "tool_choice": None, "tools": None}
+    probe = await cache.lookup(TENANT, "gpt-4o-mini", user("what is an apple"), params)
+    cache.store(probe, {"answer": "a fruit"})
+    assert (await cache.lookup(TENANT, "gpt-4o-mini", user("what is an apple"), dict(params))).response is not None
+
+    for change in ({"temperature": 1.5}, {"max_tokens": 500}, {"tool_choice": "auto"},
+                   {"tools": ({"type": "function", "function": {"name": "f"}},)}):
+        probe = await cache.lookup(TENANT, "gpt-4o-mini", user("what is an apple"), {**params, **change})
+        assert probe.response is None, change
+
+
+def test_lazy_model_is_built_once_under_concurrency(monkeypatch):
+    """Tests that concurrent first lookups share one SemanticsComparator."""
+    built = []
+
+    class SlowComparator(FakeComparator):
+        def __init__(self):
+            built.append(self)
+            time.sleep(0.05)
+
+    monkeypatch.setattr(comparator, "SemanticsComparator", SlowComparator)
+    cache = SemanticCache()
+    threads = [threading.Thread(target=cache._model) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(built) == 1
+
+
+@pytest.mark.asyncio
+async def test_uncacheable_requests_return_none(cache):
+    """Tests that requests not ending in a user turn, or without a model, are skipped."""
+    assert await cache.lookup(TENANT, "gpt-4o-mini", [{"role": "assistant", "content": "hi"}]) is None
+
+    class Unready:
+        ready = False
+        model = None
+
+    assert await SemanticCache(comparator=Unready()).lookup(TENANT, "gpt-4o-mini", user("hi")) is None
+
+
+def fill(cache, partitions):
+    import asyncio
+
+    async def run():
+        for system, texts in partitions:
+            for text in texts:
+                messages = [{"role": "system", "content": system}, {"role": "user", "content": text}]
+                cache.store(await cache.lookup(TENANT, "m", messages), {"answer": text})
+
+    asyncio.run(run())
+
+
+def test_single_partition_evicts_oldest_entries():
+    """Tests that a partition never grows past max_entries and drops its oldest entries first."""
+    cache = SemanticCache(comparator=FakeComparator(), max_entries=2)
+    fill(cache, [("s", ["alpha", "bravo", "charlie"])])
+    stats = cache.snapshot()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_capacity_is_shared_and_lru_partitions_are_evicted():
+    """Tests that max_entries bounds all partitions together and the least recently used goes first."""
+    cache = SemanticCache(comparator=FakeComparator(), max_entries=20)
+    fill(cache, [(f"context {i}", ["alpha", "bravo", "charlie"]) for i in range(10)])
+    stats = cache.snapshot()
+    assert stats["entries"] <= 20
+    assert stats["partitions"] < 10
+    assert sum(p.size for p in cache._partitions.values()) == stats["entries"]
+    # The newest contexts survive
+    assert cache._partition_key(TENANT, "m", [{"role": "system", "content": "context 9"}, {"role": "user", "content": "x"}])[0] in cache._partitions
+
+
+def test_partitions_grow_with_their_entries():
+    """Tests that partition arrays are not allocated at full capacity up front."""
+    cache = SemanticCache(comparator=FakeComparator(), max_entries=5000)
+    fill(cache, [("s", [f"text {chr(97 + i)}" for i in range(20)])])
+    (partition,) = cache._partitions.values()
+    assert partition.size == 20
+    assert len(partition.prompts) < 64
+
+
+def test_gateway_serves_semantic_hits():
+    """Tests that an opted-in paraphrase is served without calling the provider."""
+    async def override():
+        return {"sub": "spiffe://test.org/service"}
+
+    app.dependency_overrides[verify_spiffe_identity] = override
+    client = TestClient(app)
+    cache = SemanticCache(comparator=FakeComparator(), threshold=0.95)
+    adapter = AsyncMock()
+    adapter.name = "mock_adapter"
+    adapter.chat.return_value = {"choices": [{"message": {"content": "a fruit"}}]}
+
+    with patch("services.ucapi.gateway.SEMANTIC_CACHE", cache), \
+         patch("services.ucapi.gateway.resolve", return_value=(adapter, "mock-model")):
+        first = client.post("/v1/chat", json={"model": "gpt-4o-mini", "messages": user("what is an apple"),
+                                               "metadata": {"semantic_cache": True}})
+        second = client.post("/v1/chat", json={"model": "gpt-4o-mini", "messages": user("an apple is what"),
+                                                "metadata": {"semantic_cache": True}})
+
+    assert first.status_code == 200
+    assert "X-UCAPI-Cache" not in first.headers
+    assert second.headers["X-UCAPI-Cache"] == "semantic"
+    assert second.json() == first.json()
+    adapter.chat.assert_called_once()
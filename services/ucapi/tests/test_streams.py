@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from services.ucapi.gateway import app, verify_spiffe_identity
+from services.ucapi.streams import ReplayUnavailable, StreamBuffer, StreamHub, parse_last_event_id
+
+OWNER = "spiffe://test.org/service"
+
+
+def ids(frames):
+    return [int(f.split("\n", 1)[0].removeprefix("id: ")) for f in frames]
+
+
+async def collect(agen):
+    return [frame async for frame in agen]
+
+
+def test_parse_last_event_id():
+    """Tests that malformed Last-Event-ID values fall back to a full replay."""
+    assert parse_last_event_id("7") == 7
+    assert parse_last_event_id(None) == 0
+    assert parse_last_event_id("abc") == 0
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_after_last_event_id():
+    """Tests that a reconnect receives only the events it missed, then the live tail."""
+    hub = StreamHub(grace=1)
+    release = asyncio.Event()
+
+    async def producer(buf):
+        for i in range(3):
+            buf.publish({"event": "message.delta", "delta": str(i)})
+        await release.wait()
+        buf.publish({"event": "message.done"})
+
+    buf = hub.open(OWNER, producer)
+    await asyncio.sleep(0)
+    resumed = asyncio.create_task(collect(hub.subscribe(hub.get(buf.id, OWNER, 2), 2)))
+    await asyncio.sleep(0)
+    release.set()
+
+    frames = await resumed
+    assert ids(frames) == [3, 4]
+    assert "event: message.done" in frames[-1]
+    assert hub.stats["resumed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_multiple_subscribers_share_one_upstream():
+    """Tests that several subscribers see the same events from a single producer run."""
+    hub = StreamHub(grace=1)
+    calls = 0
+    release = asyncio.Event()
+
+    async def producer(buf):
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        buf.publish({"event": "message.delta", "delta": "hi"})
+        buf.publish({"event": "message.done"})
+
+    buf = hub.open(OWNER, producer)
+    readers = [asyncio.create_task(collect(hub.subscribe(buf))) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert hub.snapshot()["subscribers"] == 3
+    release.set()
+
+    results = await asyncio.gather(*readers)
+    assert all(ids(r) == [1, 2] for r in results)
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_abandoned_stream_is_cancelled_after_grace():
+    """Tests that the upstream keeps running through the grace period, then is cancelled."""
+    hub = StreamHub(grace=0.05)
+    cancelled = asyncio.Event()
+
+    async def producer(buf):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    buf = hub.open(OWNER, producer)
+    reader = asyncio.create_task(collect(hub.subscribe(buf)))
+    await asyncio.sleep(0.01)
+    reader.cancel()
+    await asyncio.gather(reader, return_exceptions=True)
+
+    await asyncio.sleep(0.01)
+    assert not buf.task.done()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert hub.stats["abandoned"] == 1
+    with pytest.raises(ReplayUnavailable):
+        hub.get(buf.id, OWNER)
+
+
+@pytest.mark.asyncio
+async def test_resume_rejected_once_events_left_the_ring():
+    """Tests that a resume point older than the ring, or another owner, is refused."""
+    hub = StreamHub(grace=1, capacity=2)
+
+    async def producer(buf):
+        for i in range(4):
+            buf.publish({"event": "message.delta", "delta": str(i)})
+
+    buf = hub.open(OWNER, producer)
+    await buf.task
+    assert hub.get(buf.id, OWNER, 2) is buf
+    with pytest.raises(ReplayUnavailable):
+        hub.get(buf.id, OWNER, 1)
+    with pytest.raises(ReplayUnavailable):
+        hub.get(buf.id, "spiffe://test.org/other", 3)
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_gets_reset_instead_of_silent_eof():
+    """Tests that a subscriber overtaken by the ring ends with a STREAM_RESET error event."""
+    buf = StreamBuffer(OWNER, capacity=2)
+    reader = buf.follow(0)
+    buf.publish({"event": "message.delta", "delta": "0"})
+    first = await reader.__anext__()
+    for i in range(1, 4):
+        buf.publish({"event": "message.delta", "delta": str(i)})
+    buf.publish({"event": "message.done"})
+
+    rest = await collect(reader)
+    assert ids([first]) == [1]
+    assert len(rest) == 1
+    assert rest[0].startswith("event: error\n")
+    assert '"type": "STREAM_RESET"' in rest[0]
+    assert '"last_event_id": 1' in rest[0]
+
+
+def test_gateway_resumes_buffered_stream():
+    """Tests the resume endpoint replays after Last-Event-ID and 404s unknown streams."""
+    async def override():
+        return {"sub": OWNER}
+
+    app.dependency_overrides[verify_spiffe_identity] = override
+    client = TestClient(app)
+    hub = StreamHub(grace=1)
+    buf = StreamBuffer(OWNER)
+    for event in [{"event": "message.delta", "delta": "a"}, {"event": "message.delta", "delta": "b"},
+                  {"event": "message.done"}]:
+        buf.publish(event)
+    hub.streams[buf.id] = buf
+
+    with patch("services.ucapi.gateway.STREAMS", hub):
+        response = client.get(f"/v1/chat/stream/{buf.id}", headers={"Last-Event-ID": "1"})
+        missing = client.get("/v1/chat/stream/nope")
+
+    assert response.status_code == 200
+    assert response.headers["X-UCAPI-Stream-Id"] == buf.id
+    assert response.text.startswith("id: 2\nevent: message.delta\n")
+    assert "event: message.done" in response.text
+    assert missing.status_code == 404
+    assert missing.json()["error"]["type"] == "STREAM_UNAVAILABLE"
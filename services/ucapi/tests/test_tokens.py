@@ -0,0 +1,116 @@
+import pytest
+
+from services.ucapi.registry import REGISTRY
+from services.ucapi.tokens import TokenCounter, context_budget, fit_to_window, REPLY_PRIMER
+
+
+@pytest.fixture
+def counter():
+    """A fresh counter so cache statistics start at zero."""
+    return TokenCounter()
+
+
+def test_counts_are_cached_per_message(counter):
+    """Tests that re-counting a growing conversation only counts the new turns."""
+    history = [{"role": "user", "content": "hello " * 50}, {"role": "assistant", "content": "hi there"}]
+    first = counter.count_messages(history)
+    assert counter.misses == 2
+
+    history.append({"role": "user", "content": "and another question"})
+    second = counter.count_messages(history)
+    assert counter.misses == 3
+    assert counter.hits == 2
+    assert second > first
+
+
+def test_identical_content_with_different_role_is_counted_separately(counter):
+    """Tests that the cache key covers the role as well as the content."""
+    counter.count_message({"role": "user", "content": "same"})
+    counter.count_message({"role": "assistant", "content": "same"})
+    assert counter.misses == 2
+
+
+def test_context_budget_reserves_completion_tokens():
+    """Tests that the prompt budget subtracts max_tokens from the alias window."""
+    assert context_budget("gpt-4o-mini", 1000) == REGISTRY["gpt-4o-mini"]["context_window"] - 1000
+    assert context_budget("unknown-alias", 1000) is None
+
+
+def test_fit_to_window_keeps_short_prompts(counter):
+    """Tests that prompts under the budget are passed through untouched."""
+    messages = [{"role": "user", "content": "Hi"}]
+    fitted, tokens = fit_to_window("gpt-4o-mini", messages, 1000, counter)
+    assert fitted is messages
+    assert tokens == counter.count_messages(messages)
+
+
+def test_fit_to_window_drops_oldest_turns(counter, monkeypatch):
+    """Tests that the oldest non-system turns are trimmed first."""
+    monkeypatch.setitem(REGISTRY, "tiny", {"adapter": "openai", "provider_model": "x", "context_window": 120})
+    messages = [
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "content": "a" * 400},
+        {"role": "assistant", "content": "b" * 40},
+        {"role": "user", "content": "latest question"},
+    ]
+    fitted, tokens = fit_to_window("tiny", messages, 20, counter)
+    assert [m["role"] for m in fitted] == ["system", "user"]
+    assert tokens <= 100
+    assert tokens == REPLY_PRIMER + sum(counter.count_message(m) for m in fitted)
+
+
+def test_fit_to_window_rejects_oversized_final_turn(counter, monkeypatch):
+    """Tests that a final turn larger than the window raises a ValueError."""
+    monkeypatch.setitem(REGISTRY, "tiny", {"adapter": "openai", "provider_model": "x", "context_window": 50})
+    with pytest.raises(ValueError, match="allows 30"):
+        fit_to_window("tiny", [{"role": "user", "content": "z" * 400}], 20, counter)
+
+
+def test_fit_to_window_drops_tool_calls_with_their_results(counter, monkeypatch):
+    """Tests that an assistant tool call is never kept without its tool results, or vice versa."""
+    monkeypatch.setitem(REGISTRY, "tiny", {"adapter": "openai", "provider_model": "x", "context_window": 140})
+    call = {"id": "call_1", "type": "function", "function": {"name": "lookup", "arguments": "{}"}}
+    messages = [
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "content": "look it up"},
+        {"role": "assistant", "content": "", "tool_calls": [call]},
+        {"role": "tool", "content": "r" * 200, "tool_call_id": "call_1"},
+        {"role": "assistant", "content": "done"},
+        {"role": "user", "content": "thanks"},
+        {"role": "assistant", "content": "welcome"},
+        {"role": "user", "content": "latest question"},
+    ]
+    fitted, tokens = fit_to_window("tiny", messages, 20, counter)
+    assert [m["content"] for m in fitted] == ["be brief", "thanks", "welcome", "latest question"]
+    assert tokens == counter.count_messages(fitted)
+
+
+def test_fit_to_window_never_leaves_a_reply_without_its_user_turn(counter, monkeypatch):
+    """Tests that replies go with their user turn, so no assistant message follows the system prompt."""
+    monkeypatch.setitem(REGISTRY, "tiny", {"adapter": "openai", "provider_model": "x", "context_window": 120})
+    messages = [
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "content": "a" * 300},
+        {"role": "assistant", "content": "short answer"},
+        {"role": "user", "content": "and?"},
+        {"role": "assistant", "content": "more"},
+        {"role": "user", "content": "latest question"},
+    ]
+    fitted, _ = fit_to_window("tiny", messages, 20, counter)
+    assert [m["role"] for m in fitted] == ["system", "user", "assistant", "user"]
+    assert fitted[1]["content"] == "and?"
+
+
+def test_tool_schemas_count_toward_the_prompt(counter, monkeypatch):
+    """Tests that serialized tools are added to the count and can push a prompt over the window."""
+    tools = [{"type": "function", "name": "search", "description": "d" * 400, "parameters": {"type": "object"}}]
+    messages = [{"role": "user", "content": "Hi"}]
+    plain = counter.count_messages(messages)
+    with_tools = counter.count_messages(messages, tools)
+    assert with_tools > plain + 100
+    _, tokens = fit_to_window("gpt-4o-mini", messages, 1000, counter, tools=tools)
+    assert tokens == with_tools
+
+    monkeypatch.setitem(REGISTRY, "tiny", {"adapter": "openai", "provider_model": "x", "context_window": 120})
+    with pytest.raises(ValueError):
+        fit_to_window("tiny", messages, 20, counter, tools=tools)
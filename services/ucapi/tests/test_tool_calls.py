@@ -0,0 +1,64 @@
+import json
+
+from services.ucapi.tool_calls import ToolCallAssembler
+
+
+def delta(index, arguments=None, name=None, call_id=None):
+    d = {"index": index, "function": {}}
+    if call_id:
+        d["id"] = call_id
+    if name:
+        d["function"]["name"] = name
+    if arguments is not None:
+        d["function"]["arguments"] = arguments
+    return d
+
+
+def test_ready_fires_when_arguments_close():
+    """Tests that a call is ready on the chunk that completes its JSON, not before."""
+    asm = ToolCallAssembler()
+    assert asm.feed([delta(0, "", name="get_weather", call_id="call_1")]) == []
+    assert asm.feed([delta(0, '{"city": "Par')]) == []
+    assert asm.feed([delta(0, 'is", "units"')]) == []
+    ready = asm.feed([delta(0, ': ["c", "f"]}')])
+    assert ready == [{
+        "event": "tool_call.ready",
+        "index": 0,
+        "id": "call_1",
+        "name": "get_weather",
+        "arguments": {"city": "Paris", "units": ["c", "f"]},
+    }]
+    assert asm.finish() == []
+
+
+def test_brackets_and_escapes_inside_strings_are_ignored():
+    """Tests that braces, quotes and backslashes in string values, split across chunks, don't end a call."""
+    args = {"q": 'say "}" then \\ and {', "n": {"x": [1, 2]}}
+    text = json.dumps(args)
+    asm = ToolCallAssembler()
+    ready = []
+    for ch in text:
+        ready += asm.feed([delta(0, ch, name="f" if not ready else None)])
+    assert len(ready) == 1
+    assert ready[0]["arguments"] == args
+
+
+def test_parallel_calls_complete_independently():
+    """Tests interleaved deltas for two calls, the second finishing first."""
+    asm = ToolCallAssembler()
+    early = asm.feed([delta(0, '{"a": ', name="first"), delta(1, '{"b": 2}', name="second")])
+    assert [(r["index"], r["name"], r["arguments"]) for r in early] == [(1, "second", {"b": 2})]
+    ready = asm.feed([delta(0, "1}")])
+    assert [r["name"] for r in ready] == ["first"]
+    assert asm.finish() == []
+
+
+def test_finish_flushes_incomplete_calls():
+    """Tests that calls left open at end of stream are reported, empty args parse as {}."""
+    asm = ToolCallAssembler()
+    asm.feed([delta(0, "", name="no_args"), delta(1, '{"a": tru', name="cut_off")])
+    events = {e["name"]: e for e in asm.finish()}
+    assert events["no_args"]["event"] == "tool_call.ready"
+    assert events["no_args"]["arguments"] == {}
+    assert events["cut_off"]["event"] == "tool_call.invalid"
+    assert events["cut_off"]["arguments"] == '{"a": tru'
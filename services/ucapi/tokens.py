@@ -0,0 +1,143 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional
+
+from .registry import REGISTRY
+
+# Chat formats wrap every message in a few framing tokens (role, separators)
+# and prime the reply with a few more; these match OpenAI's published counts.
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMER = 3
+CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    """
+    Estimates prompt sizes locally, caching per-message counts by content hash.
+
+    Uses tiktoken when it is installed and falls back to a bytes-per-token
+    heuristic otherwise. Because counts are keyed by the hash of each message,
+    re-sending a long conversation only pays for the turns that are new.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base", cache_size: int = 65536):
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(encoding_name)
+        except Exception:  # not installed, or the encoding cannot be loaded offline
+            self._encoding = None
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return -(-len(text.encode("utf-8")) // CHARS_PER_TOKEN)
+
+    def _cached(self, key: bytes, count) -> int:
+        n = self._cache.get(key)
+        if n is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return n
+        self.misses += 1
+        n = self._cache[key] = count()
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return n
+
+    def count_message(self, message: dict) -> int:
+        role = message.get("role", "")
+        content = message.get("content") or ""
+        # Tool calls and their ids are sent to the provider too, so they count
+        extra = {k: message[k] for k in ("name", "tool_calls", "tool_call_id") if message.get(k)}
+        extra_text = json.dumps(extra, sort_keys=True, separators=(",", ":")) if extra else ""
+        key = hashlib.sha256(f"{role}\x00{content}\x00{extra_text}".encode("utf-8")).digest()
+        return self._cached(key, lambda: MESSAGE_OVERHEAD + self.count_text(role) + self.count_text(content)
+                            + self.count_text(extra_text))
+
+    def count_tools(self, tools) -> int:
+        """Tokens taken by the tool/function schemas, counted from their serialized JSON."""
+        if not tools:
+            return 0
+        text = json.dumps(list(tools), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        key = hashlib.sha256(b"tools\x00" + text.encode("utf-8")).digest()
+        return self._cached(key, lambda: self.count_text(text))
+
+    def count_messages(self, messages: list[dict], tools=None) -> int:
+        return REPLY_PRIMER + self.count_tools(tools) + sum(self.count_message(m) for m in messages)
+
+
+COUNTER = TokenCounter()
+
+
+def context_budget(model_alias: str, max_tokens: Optional[int]) -> Optional[int]:
+    """Prompt tokens available for an alias once room for the completion is reserved."""
+    window = REGISTRY.get(model_alias, {}).get("context_window")
+    if window is None:
+        return None
+    return window - (max_tokens or 0)
+
+
+def turn_groups(messages: list[dict]) -> list[range]:
+    """
+    Splits messages into units that must be kept or dropped together.
+
+    A user message is grouped with the assistant replies and ``tool``
+    results that follow it, so trimming never leaves a tool result without
+    its tool call, nor an assistant reply right after the system prompt
+    with its user turn gone; some providers reject both. System messages
+    are units on their own.
+    """
+    groups = []
+    for i, m in enumerate(messages):
+        if not groups or m.get("role") in ("user", "system") or messages[i - 1].get("role") == "system":
+            groups.append(range(i, i + 1))
+        else:
+            groups[-1] = range(groups[-1].start, i + 1)
+    return groups
+
+
+def fit_to_window(
+    model_alias: str,
+    messages: list[dict],
+    max_tokens: Optional[int],
+    counter: TokenCounter = COUNTER,
+    tools=None,
+) -> tuple[list[dict], int]:
+    """
+    Drops the oldest conversational turns until the prompt fits the alias's window.
+
+    System messages and the final turn are always kept; a user turn is
+    dropped together with the replies and tool results that answer it. ``tools`` count toward
+    the prompt but are never trimmed. Returns the (possibly trimmed) messages
+    and their prompt token count, tools included, and raises ValueError when
+    even the pinned messages do not fit.
+    """
+    counts = [counter.count_message(m) for m in messages]
+    total = REPLY_PRIMER + counter.count_tools(tools) + sum(counts)
+    budget = context_budget(model_alias, max_tokens)
+    if budget is None or total <= budget:
+        return messages, total
+
+    last = len(messages) - 1
+    keep = [True] * len(messages)
+    for group in turn_groups(messages):
+        if total <= budget:
+            break
+        if last in group or any(messages[i].get("role") == "system" for i in group):
+            continue
+        for i in group:
+            keep[i] = False
+            total -= counts[i]
+
+    if total > budget:
+        raise ValueError(
+            f"Prompt needs {total} tokens but '{model_alias}' allows {budget} with max_tokens={max_tokens}."
+        )
+    return [m for m, k in zip(messages, keep) if k], total
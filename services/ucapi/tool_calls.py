@@ -0,0 +1,131 @@
+import json
+import re
+from typing import Any, Optional
+
+# Next character that can change the scanner's state, inside and outside strings
+_IN_STRING = re.compile(r'["\\]')
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+
+
+class _PendingCall:
+    """One tool call's streamed fields, plus a bracket scanner over its argument text."""
+
+    __slots__ = ("index", "id", "name", "parts", "depth", "in_string", "escape", "opened", "closed", "emitted")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.id: Optional[str] = None
+        self.name = ""
+        self.parts: list[str] = []
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.opened = False
+        self.closed = False
+        self.emitted = False
+
+    def feed(self, chunk: str) -> bool:
+        """Scans only the new chunk; returns True once the top-level value has closed."""
+        if self.closed:
+            return True
+        self.parts.append(chunk)
+        pos, end = 0, len(chunk)
+        if self.escape:
+            self.escape = False
+            pos = 1
+        while pos < end:
+            if self.in_string:
+                m = _IN_STRING.search(chunk, pos)
+                if m is None:
+                    return False
+                if m.group() == "\\":
+                    if m.end() >= end:
+                        self.escape = True  # the escaped character arrives in the next chunk
+                        return False
+                    pos = m.end() + 1
+                    continue
+                self.in_string = False
+                pos = m.end()
+                continue
+            m = _STRUCTURAL.search(chunk, pos)
+            if m is None:
+                return False
+            c = m.group()
+            pos = m.end()
+            if c == '"':
+                self.in_string = True
+            elif c in "{[":
+                self.depth += 1
+                self.opened = True
+            else:
+                self.depth -= 1
+                if self.depth == 0 and self.opened:
+                    self.closed = True
+                    # Drop anything after the closing bracket
+                    self.parts[-1] = chunk[:pos]
+                    return True
+        return False
+
+
+class ToolCallAssembler:
+    """
+    Reassembles streamed OpenAI ``tool_calls`` deltas into complete calls.
+
+    Each argument chunk is scanned once for brackets and string boundaries, so
+    the moment a call's arguments close we know they are complete and parse
+    them exactly once. ``feed`` returns ``tool_call.ready`` events as calls
+    complete, letting agents start tools while the model is still generating.
+    """
+
+    def __init__(self):
+        self._calls: dict[int, _PendingCall] = {}
+
+    def feed(self, deltas: list[dict]) -> list[dict[str, Any]]:
+        ready = []
+        for delta in deltas:
+            index = delta.get("index", 0)
+            call = self._calls.get(index)
+            if call is None:
+                call = self._calls[index] = _PendingCall(index)
+            if delta.get("id"):
+                call.id = delta["id"]
+            function = delta.get("function") or {}
+            if function.get("name"):
+                call.name += function["name"]
+            args = function.get("arguments")
+            if args and call.feed(args):
+                event = self._ready(call)
+                if event is not None:
+                    ready.append(event)
+        return ready
+
+    def finish(self) -> list[dict[str, Any]]:
+        """Flushes calls still open when the stream ends; unparseable ones become ``tool_call.invalid``."""
+        events = []
+        for call in self._calls.values():
+            if call.emitted:
+                continue
+            event = self._ready(call)
+            if event is None:
+                call.emitted = True
+                event = {
+                    "event": "tool_call.invalid",
+                    "index": call.index,
+                    "id": call.id,
+                    "name": call.name,
+                    "arguments": "".join(call.parts),
+                }
+            events.append(event)
+        return events
+
+    @staticmethod
+    def _ready(call: _PendingCall) -> Optional[dict[str, Any]]:
+        if call.emitted:
+            return None
+        text = "".join(call.parts)
+        try:
+            arguments = json.loads(text) if text.strip() else {}
+        except json.JSONDecodeError:
+            return None
+        call.emitted = True
+        return {"event": "tool_call.ready", "index": call.index, "id": call.id, "name": call.name, "arguments": arguments}
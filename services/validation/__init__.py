@@ -0,0 +1,48 @@
+"""Compiled JSON Schema validators for the repo's record formats."""
+from __future__ import annotations
+
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, List, Tuple
+
+from .compiler import SchemaError, ValidationError, Validator, compile_schema, validate_many
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+SCHEMA_FILES = {
+    "lesson": REPO_ROOT / "schemas" / "lesson.schema.json",
+    "step": REPO_ROOT / "schemas" / "step.schema.json",
+    "noosphere_manifest": REPO_ROOT / "datasets" / "noosphere" / "manifest_schema.json",
+    "syzygy_matrix": REPO_ROOT / "configs" / "syzygy_matrix.schema.json",
+}
+
+
+@lru_cache(maxsize=None)
+def validator_for_file(path: Path) -> Validator:
+    """The compiled validator for a schema file, built on first use and reused after."""
+    return compile_schema(json.loads(Path(path).read_text()))
+
+
+def validator(name: str) -> Validator:
+    """The compiled validator for one of ``SCHEMA_FILES``."""
+    try:
+        path = SCHEMA_FILES[name]
+    except KeyError:
+        raise KeyError(f"Unknown schema '{name}'; expected one of {sorted(SCHEMA_FILES)}.") from None
+    return validator_for_file(path)
+
+
+def validate(name: str, record: Any) -> None:
+    validator(name)(record)
+
+
+def validate_records(name: str, records: Iterable[Any]) -> List[Tuple[int, ValidationError]]:
+    """Validates a batch against a named schema; returns ``(index, error)`` per invalid record."""
+    return validate_many(validator(name), records)
+
+
+__all__ = [
+    "SCHEMA_FILES", "SchemaError", "ValidationError", "Validator", "compile_schema", "validate",
+    "validate_many", "validate_records", "validator", "validator_for_file",
+]
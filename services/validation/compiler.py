@@ -0,0 +1,398 @@
+"""
+Compiles JSON Schemas (the draft-07 subset used in this repo) into plain Python functions.
+
+The schema is walked once and turned into straight-line checks, so a record
+is validated without re-reading the schema or dispatching per keyword.
+Error paths are only assembled when a check fails. Schemas using keywords
+the compiler does not know fall back to a cached ``jsonschema`` validator.
+"""
+from __future__ import annotations
+
+import re
+from collections import deque
+from fractions import Fraction
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+Validator = Callable[[Any], None]
+
+# Keywords that never affect validity
+ANNOTATIONS = {
+    "$schema", "$id", "$comment", "title", "description", "default", "examples",
+    "definitions", "$defs", "format", "readOnly", "writeOnly",
+}
+
+TYPE_CHECKS = {
+    "object": "isinstance({v}, dict)",
+    "array": "isinstance({v}, list)",
+    "string": "isinstance({v}, str)",
+    "boolean": "isinstance({v}, bool)",
+    "null": "{v} is None",
+    "number": "(isinstance({v}, (int, float)) and not isinstance({v}, bool))",
+    "integer": "((isinstance({v}, int) and not isinstance({v}, bool)) or (isinstance({v}, float) and {v}.is_integer()))",
+}
+
+OBJECT_KEYWORDS = {"required", "properties", "patternProperties", "additionalProperties", "minProperties", "maxProperties"}
+ARRAY_KEYWORDS = {"items", "minItems", "maxItems", "uniqueItems"}
+STRING_KEYWORDS = {"minLength", "maxLength", "pattern"}
+NUMBER_KEYWORDS = {"minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum", "multipleOf"}
+
+
+class SchemaError(ValueError):
+    """The schema itself cannot be compiled (and no fallback is available)."""
+
+
+class ValidationError(ValueError):
+    """A record does not match its schema; ``path`` locates the offending value."""
+
+    def __init__(self, message: str, path: Iterable[Any] = ()):
+        super().__init__(message)
+        self.message = message
+        self.path = deque(path)
+
+    def __str__(self) -> str:
+        where = "/".join(str(p) for p in self.path)
+        return f"{where}: {self.message}" if where else self.message
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _equal(a: Any, b: Any) -> bool:
+    """JSON equality: unlike ``==``, ``True`` is not ``1``."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool) and a is b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _in_enum(value: Any, options: Tuple[Any, ...]) -> bool:
+    return any(_equal(value, option) for option in options)
+
+
+def _unique(items: List[Any]) -> bool:
+    return not any(_equal(items[i], items[j]) for i in range(len(items)) for j in range(i))
+
+
+def _multiple_of(value: Any, step: Any) -> bool:
+    """jsonschema's multipleOf: float division first, exact fractions when that overflows."""
+    if not isinstance(step, float):
+        return not value % step
+    try:
+        quotient = value / step
+        return int(quotient) == quotient
+    except (OverflowError, ValueError):
+        try:
+            return (Fraction(value) / Fraction(step)).denominator == 1
+        except (OverflowError, ValueError):  # inf and nan are nobody's multiple
+            return False
+
+
+class _Compiler:
+    def __init__(self, root: Any):
+        self.root = root
+        self.namespace: Dict[str, Any] = {
+            "ValidationError": ValidationError, "_equal": _equal, "_in_enum": _in_enum, "_unique": _unique,
+            "_multiple_of": _multiple_of,
+        }
+        self.functions: List[str] = []
+        self.refs: Dict[str, str] = {}
+        self.counter = 0
+
+    def fresh(self, prefix: str) -> str:
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def const(self, value: Any, prefix: str = "C") -> str:
+        name = self.fresh(prefix)
+        self.namespace[name] = value
+        return name
+
+    def resolve(self, ref: str) -> Any:
+        if not ref.startswith("#"):
+            raise _Unsupported(f"$ref {ref!r}")
+        node = self.root
+        for part in filter(None, ref[1:].split("/")):
+            part = part.replace("~1", "/").replace("~0", "~")
+            try:
+                node = node[int(part)] if isinstance(node, list) else node[part]
+            except (KeyError, IndexError, ValueError):
+                raise SchemaError(f"Unresolvable $ref {ref!r}") from None
+        return node
+
+    def function(self, schema: Any) -> str:
+        """Compiles a subschema into its own ``(x, path)`` function; used for $ref and combinators."""
+        name = self.fresh("_s")
+        body: List[str] = []
+        self.emit(schema, "x", ["*path"], body, 1)
+        self.functions.append("\n".join([f"def {name}(x, path):"] + (body or ["    pass"])))
+        return name
+
+    def ref_function(self, ref: str) -> str:
+        name = self.refs.get(ref)
+        if name is None:
+            # Registered before compiling, so recursive references terminate
+            name = self.refs[ref] = self.fresh("_r")
+            target = self.function(self.resolve(ref))
+            self.functions.append(f"{name} = {target}")
+        return name
+
+    def emit(self, schema: Any, v: str, path: List[str], out: List[str], ind: int) -> None:
+        pad = "    " * ind
+        where = "[" + ", ".join(path) + "]"
+
+        def fail(message_expr: str, at: str = where) -> str:
+            return f"raise ValidationError({message_expr}, {at})"
+
+        if schema is True or schema == {}:
+            return
+        if schema is False:
+            out.append(f"{pad}{fail(repr('False schema does not allow the value'))}")
+            return
+        if not isinstance(schema, dict):
+            raise SchemaError(f"Schema must be an object or boolean, got {schema!r}")
+
+        if "$ref" in schema:  # draft-07: siblings of $ref are ignored
+            out.append(f"{pad}{self.ref_function(schema['$ref'])}({v}, {where})")
+            return
+
+        unknown = set(schema) - ANNOTATIONS - OBJECT_KEYWORDS - ARRAY_KEYWORDS - STRING_KEYWORDS - NUMBER_KEYWORDS \
+            - {"type", "enum", "const", "allOf", "anyOf", "oneOf", "not"}
+        if unknown:
+            raise _Unsupported(", ".join(sorted(unknown)))
+
+        types = schema.get("type")
+        if isinstance(types, str):
+            types = [types]
+        if types is not None:
+            check = " or ".join(TYPE_CHECKS[t].format(v=v) for t in types)
+            message = " is not of type " + ", ".join(repr(t) for t in types)
+            out.append(f"{pad}if not ({check}):")
+            out.append(f"{pad}    {fail(f'repr({v}) + {message!r}')}")
+
+        if "enum" in schema:
+            options = tuple(schema["enum"])
+            message = " is not one of " + repr(list(options))
+            if all(isinstance(o, str) for o in options):
+                out.append(f"{pad}if not (isinstance({v}, str) and {v} in {self.const(frozenset(options), 'E')}):")
+            else:
+                out.append(f"{pad}if not _in_enum({v}, {self.const(options, 'E')}):")
+            out.append(f"{pad}    {fail(f'repr({v}) + {message!r}')}")
+        if "const" in schema:
+            message = repr(schema["const"]) + " was expected"
+            out.append(f"{pad}if not _equal({v}, {self.const(schema['const'])}):")
+            out.append(f"{pad}    {fail(repr(message))}")
+
+        def guarded(kind: str, keywords: set, emit_body: Callable[[List[str], int], None]) -> None:
+            if not keywords & set(schema):
+                return
+            if types == [kind] or (kind == "number" and types in (["integer"], ["number"])):
+                emit_body(out, ind)
+                return
+            body: List[str] = []
+            emit_body(body, ind + 1)
+            if body:
+                out.append(f"{pad}if {TYPE_CHECKS[kind].format(v=v)}:")
+                out.extend(body)
+
+        guarded("object", OBJECT_KEYWORDS, lambda o, i: self.emit_object(schema, v, path, o, i))
+        guarded("array", ARRAY_KEYWORDS, lambda o, i: self.emit_array(schema, v, path, o, i))
+        guarded("string", STRING_KEYWORDS, lambda o, i: self.emit_string(schema, v, path, o, i))
+        guarded("number", NUMBER_KEYWORDS, lambda o, i: self.emit_number(schema, v, path, o, i))
+
+        for sub in schema.get("allOf", ()):
+            self.emit(sub, v, path, out, ind)
+        for keyword, test, message in (
+            ("anyOf", "{n} == 0", " is not valid under any of the given schemas"),
+            ("oneOf", "{n} != 1", " is not valid under exactly one of the given schemas"),
+        ):
+            if keyword in schema:
+                funcs = self.const(tuple(self.namespace_function(s) for s in schema[keyword]), "F")
+                n = self.fresh("n")
+                out.append(f"{pad}{n} = 0")
+                out.append(f"{pad}for f in {funcs}:")
+                out.append(f"{pad}    try:")
+                out.append(f"{pad}        f({v}, ())")
+                out.append(f"{pad}        {n} += 1")
+                out.append(f"{pad}    except ValidationError:")
+                out.append(f"{pad}        pass")
+                out.append(f"{pad}if {test.format(n=n)}:")
+                out.append(f"{pad}    {fail(f'repr({v}) + {message!r}')}")
+        if "not" in schema:
+            func = self.const(self.namespace_function(schema["not"]), "F")
+            message = " should not be valid under the given schema"
+            out.append(f"{pad}try:")
+            out.append(f"{pad}    {func}({v}, ())")
+            out.append(f"{pad}except ValidationError:")
+            out.append(f"{pad}    pass")
+            out.append(f"{pad}else:")
+            out.append(f"{pad}    {fail(f'repr({v}) + {message!r}')}")
+
+    def namespace_function(self, schema: Any) -> Callable:
+        """A combinator branch, compiled standalone so its failures can be caught and counted."""
+        return _compile(schema, root=self.root, as_branch=True)
+
+    def emit_object(self, schema: Dict[str, Any], v: str, path: List[str], out: List[str], ind: int) -> None:
+        pad = "    " * ind
+        where = "[" + ", ".join(path) + "]"
+        required = set(schema.get("required", ()))
+        for key in schema.get("required", ()):
+            out.append(f"{pad}if {key!r} not in {v}:")
+            message = repr(key) + " is a required property"
+            out.append(f"{pad}    raise ValidationError({message!r}, {where})")
+        for bound, op, word in (("minProperties", "<", "few"), ("maxProperties", ">", "many")):
+            if bound in schema:
+                out.append(f"{pad}if len({v}) {op} {int(schema[bound])}:")
+                out.append(f"{pad}    raise ValidationError(repr({v}) + ' has too {word} properties', {where})")
+
+        properties = schema.get("properties", {})
+        for key, sub in properties.items():
+            child = self.fresh("v")
+            body: List[str] = []
+            self.emit(sub, child, path + [repr(key)], body, ind + 1)
+            if not body:
+                continue
+            if key in required:  # presence was checked above
+                out.append(f"{pad}{child} = {v}[{key!r}]")
+                out.extend(line[4:] for line in body)
+            else:
+                out.append(f"{pad}if {key!r} in {v}:")
+                out.append(f"{pad}    {child} = {v}[{key!r}]")
+                out.extend(body)
+
+        patterns = [(re.compile(p), sub) for p, sub in schema.get("patternProperties", {}).items()]
+        additional = schema.get("additionalProperties", True)
+        if not patterns and additional in (True, {}):
+            return
+        k, child = self.fresh("k"), self.fresh("v")
+        out.append(f"{pad}for {k}, {child} in {v}.items():")
+        matched = self.fresh("m") if additional not in (True, {}) else None
+        if matched:
+            out.append(f"{pad}    {matched} = {k} in {self.const(frozenset(properties), 'P')}")
+        for regex, sub in patterns:
+            body: List[str] = []
+            self.emit(sub, child, path + [k], body, ind + 2)
+            out.append(f"{pad}    if {self.const(regex, 'R')}.search({k}):")
+            if matched:
+                out.append(f"{pad}        {matched} = True")
+            out.extend(body or [f"{pad}        pass"])
+        if matched:
+            body = []
+            if additional is False:
+                body.append(f"{pad}        raise ValidationError('Additional properties are not allowed (' + repr({k}) + ' was unexpected)', {where})")
+            else:
+                self.emit(additional, child, path + [k], body, ind + 2)
+            if body:
+                out.append(f"{pad}    if not {matched}:")
+                out.extend(body)
+
+    def emit_array(self, schema: Dict[str, Any], v: str, path: List[str], out: List[str], ind: int) -> None:
+        pad = "    " * ind
+        where = "[" + ", ".join(path) + "]"
+        for bound, op, word in (("minItems", "<", "short"), ("maxItems", ">", "long")):
+            if bound in schema:
+                out.append(f"{pad}if len({v}) {op} {int(schema[bound])}:")
+                out.append(f"{pad}    raise ValidationError(repr({v}) + ' is too {word}', {where})")
+        if schema.get("uniqueItems"):
+            out.append(f"{pad}if not _unique({v}):")
+            out.append(f"{pad}    raise ValidationError(repr({v}) + ' has non-unique elements', {where})")
+        items = schema.get("items", True)
+        if isinstance(items, list):
+            raise _Unsupported("items (tuple form)")
+        i, child = self.fresh("i"), self.fresh("v")
+        body: List[str] = []
+        self.emit(items, child, path + [i], body, ind + 1)
+        if body:
+            out.append(f"{pad}for {i}, {child} in enumerate({v}):")
+            out.extend(body)
+
+    def emit_string(self, schema: Dict[str, Any], v: str, path: List[str], out: List[str], ind: int) -> None:
+        pad = "    " * ind
+        where = "[" + ", ".join(path) + "]"
+        for bound, op, word in (("minLength", "<", "short"), ("maxLength", ">", "long")):
+            if bound in schema:
+                out.append(f"{pad}if len({v}) {op} {int(schema[bound])}:")
+                out.append(f"{pad}    raise ValidationError(repr({v}) + ' is too {word}', {where})")
+        if "pattern" in schema:
+            regex = self.const(re.compile(schema["pattern"]), "R")
+            message = " does not match " + repr(schema["pattern"])
+            out.append(f"{pad}if not {regex}.search({v}):")
+            out.append(f"{pad}    raise ValidationError(repr({v}) + {message!r}, {where})")
+
+    def emit_number(self, schema: Dict[str, Any], v: str, path: List[str], out: List[str], ind: int) -> None:
+        pad = "    " * ind
+        where = "[" + ", ".join(path) + "]"
+        for keyword, op, word in (
+            ("minimum", "<", "less than the minimum of"),
+            ("maximum", ">", "greater than the maximum of"),
+            ("exclusiveMinimum", "<=", "less than or equal to the minimum of"),
+            ("exclusiveMaximum", ">=", "greater than or equal to the maximum of"),
+        ):
+            if keyword in schema:
+                limit = schema[keyword]
+                message = f" is {word} {limit!r}"
+                out.append(f"{pad}if {v} {op} {limit!r}:")
+                out.append(f"{pad}    raise ValidationError(repr({v}) + {message!r}, {where})")
+        if "multipleOf" in schema:
+            step = schema["multipleOf"]
+            message = f" is not a multiple of {step!r}"
+            out.append(f"{pad}if not _multiple_of({v}, {self.const(step, 'M')}):")
+            out.append(f"{pad}    raise ValidationError(repr({v}) + {message!r}, {where})")
+
+
+def _compile(schema: Any, root: Any = None, as_branch: bool = False) -> Callable:
+    compiler = _Compiler(schema if root is None else root)
+    body: List[str] = []
+    compiler.emit(schema, "x", ["*path"] if as_branch else [], body, 1)
+    signature = "def validate(x, path):" if as_branch else "def validate(x):"
+    source = "\n\n".join(compiler.functions + ["\n".join([signature] + (body or ["    pass"]))])
+    exec(compile(source, "<compiled schema>", "exec"), compiler.namespace)
+    validate = compiler.namespace["validate"]
+    validate.source = source
+    return validate
+
+
+def _fallback(schema: Any) -> Optional[Validator]:
+    try:
+        from jsonschema import validators
+    except ImportError:
+        return None
+    cls = validators.validator_for(schema, default=validators.Draft7Validator)  # the draft used across the repo
+    cls.check_schema(schema)
+    checker = cls(schema)
+
+    def validate(record: Any) -> None:
+        error = next(iter(checker.iter_errors(record)), None)
+        if error is not None:
+            raise ValidationError(error.message, error.absolute_path)
+    return validate
+
+
+def compile_schema(schema: Any) -> Validator:
+    """
+    Returns ``validate(record)``, raising ``ValidationError`` on the first violation.
+
+    Compiled to Python source when every keyword is supported; otherwise a
+    prebuilt ``jsonschema`` validator (``SchemaError`` if that is not installed).
+    """
+    try:
+        return _compile(schema)
+    except _Unsupported as e:
+        validate = _fallback(schema)
+        if validate is None:
+            raise SchemaError(f"Unsupported schema keywords ({e}) and jsonschema is not installed.") from None
+        return validate
+
+
+def validate_many(validate: Validator, records: Iterable[Any]) -> List[Tuple[int, ValidationError]]:
+    """Validates a batch; returns ``(index, error)`` for each invalid record, in order."""
+    errors: List[Tuple[int, ValidationError]] = []
+    for i, record in enumerate(records):
+        try:
+            validate(record)
+        except ValidationError as e:
+            errors.append((i, e))
+    return errors
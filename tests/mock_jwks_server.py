@@ -1,11 +1,16 @@
 from fastapi import FastAPI
-from jose import jwa, jwk
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk
 from jose.constants import ALGORITHMS
-import json
 
 # Generate a new RSA key pair
-private_key = jwk.generate_key('RSA', algorithm=ALGORITHMS.RS256)
-public_key = {**private_key, 'd': None} # Remove private component
+_rsa = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+private_key = jwk.construct(
+    _rsa.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                       serialization.NoEncryption()),
+    ALGORITHMS.RS256,
+).to_dict()
 
 # Create a JWKS (JSON Web Key Set)
 jwks = {
@@ -15,8 +20,8 @@ jwks = {
             "kid": "test-key-1",
             "use": "sig",
             "alg": "RS256",
-            "n": public_key['n'],
-            "e": public_key['e'],
+            "n": private_key['n'],
+            "e": private_key['e'],
         }
     ]
 }
@@ -38,4 +43,9 @@ async def get_private_key():
         "n": private_key['n'],
         "e": private_key['e'],
         "d": private_key['d'],
-    }
\ No newline at end of file
+        "p": private_key['p'],
+        "q": private_key['q'],
+        "dp": private_key['dp'],
+        "dq": private_key['dq'],
+        "qi": private_key['qi'],
+    }
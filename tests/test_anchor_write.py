@@ -0,0 +1,160 @@
+import datetime as dt
+import re
+
+import pytest
+
+pytest.importorskip("psycopg")
+pytest.importorskip("jwcrypto")
+
+from services.audit import anchor_write
+from services.audit.anchor_write import compute_root, compute_root_incremental
+
+T0 = dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc)
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakePg:
+    """
+    Just enough of a psycopg dict_row cursor for anchor_write: each statement it issues is
+    matched by shape and run against in-memory tables.
+    """
+
+    def __init__(self):
+        self.now = T0
+        self.entries = {}  # (tenant, player) -> leaderboard row
+        self.state = {}  # tree_version -> audit_merkle_state row
+        self.nodes = {}  # (tree_version, level, pos) -> hash
+        self.leaves = {}  # (tree_version, tenant, player) -> pos
+        self.rebuilds = 0
+
+    def upsert(self, tenant, player, elo):
+        self.entries[(tenant, player)] = {
+            "tenant_id": tenant, "player_id": player, "elo_rating": elo, "rank": 0, "match_count": 1,
+            "updated_at": self.now,
+        }
+
+    def sorted_entries(self, lower=None):
+        return [dict(self.entries[k]) for k in sorted(self.entries) if lower is None or k >= lower]
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        if sql == "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ":
+            return Result([])
+        if sql.startswith("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ; SELECT"):  # compute_root
+            return Result(self.sorted_entries())
+        if sql == "SELECT now() AS now":
+            return Result([{"now": self.now}])
+        if sql.startswith("SELECT leaf_count, synced_at FROM audit_merkle_state"):
+            row = self.state.get(params[0])
+            return Result([dict(row)] if row else [])
+        if sql == "SELECT count(*) AS n FROM leaderboard_entries":
+            return Result([{"n": len(self.entries)}])
+        if re.search(r"FROM leaderboard_entries WHERE updated_at > %s", sql):
+            return Result([r for r in self.sorted_entries() if r["updated_at"] > params[0]])
+        if re.search(r"FROM leaderboard_entries WHERE \(tenant_id, player_id\) >=", sql):
+            return Result(self.sorted_entries(lower=tuple(params)))
+        if re.search(r"FROM leaderboard_entries ORDER BY tenant_id, player_id$", sql):
+            self.rebuilds += 1
+            return Result(self.sorted_entries())
+        if sql.startswith("SELECT tenant_id, player_id, pos FROM audit_merkle_leaves"):
+            tv, tenants, players = params
+            return Result([{"tenant_id": t, "player_id": p, "pos": self.leaves[(tv, t, p)]}
+                           for t, p in zip(tenants, players) if (tv, t, p) in self.leaves])
+        if sql.startswith("DELETE FROM audit_merkle_leaves"):
+            tv, start = params
+            self.leaves = {k: pos for k, pos in self.leaves.items() if k[0] != tv or pos < start}
+            return Result([])
+        if sql.startswith("SELECT level, pos, hash FROM audit_merkle_nodes"):
+            tv, levels, positions = params
+            return Result([{"level": lv, "pos": pos, "hash": self.nodes[(tv, lv, pos)]}
+                           for lv, pos in zip(levels, positions) if (tv, lv, pos) in self.nodes])
+        if sql.startswith("DELETE FROM audit_merkle_nodes"):
+            self.nodes = {k: h for k, h in self.nodes.items() if k[0] != params[0]}
+            return Result([])
+        if sql.startswith("INSERT INTO audit_merkle_state"):
+            tv, leaf_count, synced_at = params
+            self.state[tv] = {"leaf_count": leaf_count, "synced_at": synced_at}
+            return Result([])
+        raise AssertionError(f"Unexpected statement: {sql}")
+
+    def executemany(self, sql, rows):
+        sql = " ".join(sql.split())
+        if sql.startswith("INSERT INTO audit_merkle_leaves"):
+            for tv, tenant, player, pos in rows:
+                assert (tv, tenant, player) not in self.leaves, "duplicate leaf index row"
+                self.leaves[(tv, tenant, player)] = pos
+        elif sql.startswith("INSERT INTO audit_merkle_nodes"):
+            for tv, level, pos, h in rows:
+                self.nodes[(tv, level, pos)] = bytes(getattr(h, "obj", h))
+        else:
+            raise AssertionError(f"Unexpected statement: {sql}")
+
+
+def sync(db):
+    """Advances the clock and runs one incremental sync, checking it against a full recompute."""
+    db.now += dt.timedelta(minutes=10)
+    root, count = compute_root_incremental(db)
+    assert (root, count) == compute_root(db)
+    tv = anchor_write.TREE_VERSION
+    index = {(t, p): pos for (v, t, p), pos in db.leaves.items() if v == tv}
+    assert index == {k: pos for pos, k in enumerate(sorted(db.entries))}
+    return root
+
+
+@pytest.fixture
+def db():
+    db = FakePg()
+    for i in range(0, 60, 2):
+        db.upsert("t1", f"p{i:03d}", 1000 + i)
+    for i in range(10):
+        db.upsert("t2", f"p{i:03d}", 1200 + i)
+    sync(db)
+    assert db.rebuilds == 1
+    return db
+
+
+def test_updates_and_inserts_sync_without_a_rebuild(db):
+    """Tests in-place updates, an insert that sorts into the middle, and appends against compute_root."""
+    db.upsert("t1", "p010", 5)
+    db.upsert("t2", "p003", 6)
+    sync(db)
+
+    db.upsert("t1", "p013", 1500)  # lands between p012 and p014, shifting every later leaf
+    db.upsert("t1", "p020", 7)
+    sync(db)
+
+    db.upsert("t1", "p001", 1501)
+    db.upsert("t3", "p000", 1502)
+    sync(db)
+    assert db.rebuilds == 1
+
+
+def test_deletes_rebuild_the_tree(db):
+    """Tests that a deletion, alone or alongside an insert in the same window, still matches compute_root."""
+    del db.entries[("t1", "p020")]
+    sync(db)
+    assert db.rebuilds == 2
+
+    del db.entries[("t1", "p030")]
+    db.upsert("t1", "p031", 1600)
+    sync(db)
+    assert db.rebuilds == 3
+
+    del db.entries[("t2", "p004")]
+    db.upsert("t2", "p004", 1700)  # deleted and re-inserted under the same key
+    db.upsert("t1", "p041", 1701)
+    sync(db)
+    assert db.rebuilds == 3  # the re-inserted key kept its position, so this was an update plus one insert
@@ -4,6 +4,7 @@ from services.lesson.api import app, LESSONS_DIR
 
 client = TestClient(app)
 
+
 def test_create_lesson():
     # Ensure the lessons directory is clean before test
     if LESSONS_DIR.exists():
@@ -47,6 +48,7 @@ def test_create_lesson():
     for step_id in data["steps"]:
         assert (steps_dir / f"{step_id}.json").exists()
 
+
 def test_get_lesson():
     # First, create a lesson to test against
     source_payload = {"type": "file", "value": "fixture.md"}
@@ -64,6 +66,7 @@ def test_get_lesson():
     assert data["lesson"]["id"] == lesson_id
     assert len(data["steps"]) == len(create_response.json()["steps"])
 
+
 def test_submit_answer_correct():
     # Create lesson
     create_response = client.post("/api/lesson", json={"type": "text", "value": "..."})
@@ -88,6 +91,7 @@ def test_submit_answer_correct():
     assert result["ok"] is True
     assert result["score"] == 1.0
 
+
 def test_submit_answer_incorrect():
     # Create lesson
     create_response = client.post("/api/lesson", json={"type": "text", "value": "..."})
@@ -110,4 +114,155 @@ def test_submit_answer_incorrect():
     result = response.json()
     assert result["ok"] is False
     assert result["score"] == 0.0
-    assert result["correct_choice"] == correct_answer
\ No newline at end of file
+    assert result["correct_choice"] == correct_answer
+
+
+def test_get_lesson_conditional():
+    from services.lesson.api import LESSON_CACHE
+
+    lesson_id = client.post("/api/lesson", json={"type": "text", "value": "etag"}).json()["id"]
+
+    first = client.get(f"/api/lesson/{lesson_id}")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert "max-age" in first.headers["Cache-Control"]
+
+    before = LESSON_CACHE.snapshot()
+    second = client.get(f"/api/lesson/{lesson_id}", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["ETag"] == etag
+
+    after = LESSON_CACHE.snapshot()
+    assert after["hits"] == before["hits"] + 1
+    assert after["bytes_saved"] == before["bytes_saved"] + len(first.content)
+
+    stale = client.get(f"/api/lesson/{lesson_id}", headers={"If-None-Match": '"other"'})
+    assert stale.status_code == 200
+    assert stale.json() == first.json()
+
+
+def test_answers_and_feedback_are_logged():
+    from services.lesson.api import LOG, answers_log, feedback_log
+
+    lesson_id = client.post("/api/lesson", json={"type": "text", "value": "log"}).json()["id"]
+    step = next(s for s in client.get(f"/api/lesson/{lesson_id}").json()["steps"] if s["kind"] == "check")
+
+    client.post(f"/api/lesson/{lesson_id}/answer", json={"step_id": step["id"], "user_choice": 0})
+    response = client.post(f"/api/lesson/{lesson_id}/feedback", json={"step_id": step["id"], "label": "confusing"})
+    assert response.json() == {"queued": True}
+    assert LOG.flush(timeout=5)
+
+    answers = [json.loads(line) for line in answers_log(lesson_id).read_text().splitlines()]
+    assert answers[0]["submission"]["user_choice"] == 0
+    feedback = [json.loads(line) for line in feedback_log(lesson_id).read_text().splitlines()]
+    assert feedback[0]["feedback"]["label"] == "confusing"
+
+
+def test_lesson_stats_follow_answers():
+    lesson_id = client.post("/api/lesson", json={"type": "text", "value": "stats"}).json()["id"]
+    step = next(s for s in client.get(f"/api/lesson/{lesson_id}").json()["steps"] if s["kind"] == "check")
+
+    assert client.get(f"/api/lesson/{lesson_id}/stats").json()["attempts"] == 0
+    for choice in (1, 0, 1):
+        metrics = {"confidence": 0.5, "slop": {"emoji": 1, "emdash": 0, "endash": 0, "nbsp": 0}}
+        client.post(f"/api/lesson/{lesson_id}/answer",
+                    json={"step_id": step["id"], "user_choice": choice, "metrics": metrics})
+
+    stats = client.get(f"/api/lesson/{lesson_id}/stats").json()
+    step_stats = stats["steps"][step["id"]]
+    assert step_stats["attempts"] == 3
+    assert step_stats["choices"] == {"0": 1, "1": 2}
+    assert step_stats["slop"]["emoji"] == 3
+    assert client.get("/api/lesson/lsn_missing/stats").status_code == 404
+
+
+def test_bulk_create_and_export():
+    sources = [{"type": "text", "value": f"bulk {i}"} for i in range(5)]
+    response = client.post("/api/lessons/bulk", json={"sources": sources})
+    assert response.status_code == 200
+    created = response.json()
+    assert [l["source"] for l in created] == sources
+    assert client.get(f"/api/lesson/{created[0]['id']}").status_code == 200
+
+    export = client.get("/api/lessons/export")
+    assert export.headers["content-type"].startswith("application/x-ndjson")
+    records = {r["lesson"]["id"]: r for r in map(json.loads, export.text.splitlines())}
+    for lesson in created:
+        assert [s["id"] for s in records[lesson["id"]]["steps"]] == lesson["steps"]
+
+    assert client.post("/api/lessons/bulk", json={"sources": []}).status_code == 422
+
+
+def test_identical_sources_reuse_generated_content():
+    from services.lesson.api import GENERATION_CACHE
+
+    source = {"type": "url", "value": "https://example.com/generation-cache"}
+    client.post("/api/generation-cache/invalidate", json=source)
+    before = GENERATION_CACHE.snapshot()
+
+    first = client.post("/api/lesson", json=source).json()
+    second = client.post("/api/lesson", json={"type": "url", "value": "https://example.com/generation-cache/"}).json()
+    after = GENERATION_CACHE.snapshot()
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"] + 1
+
+    assert first["id"] != second["id"]
+    assert set(first["steps"]).isdisjoint(second["steps"])
+    first_steps = client.get(f"/api/lesson/{first['id']}").json()["steps"]
+    second_steps = client.get(f"/api/lesson/{second['id']}").json()["steps"]
+    assert [s["payload"] for s in first_steps] == [s["payload"] for s in second_steps]
+
+    assert client.post("/api/generation-cache/invalidate", json=source).json() == {"invalidated": 1}
+    assert client.get("/api/generation-cache").json()["invalidations"] >= 1
+
+
+def test_batch_answers_grade_in_order():
+    from services.lesson.api import LOG, answers_log
+
+    lesson_ids = [l["id"] for l in client.post("/api/lessons/bulk", json={"sources": [
+        {"type": "text", "value": "batch a"}, {"type": "text", "value": "batch b"}]}).json()]
+    checks = {lid: next(s for s in client.get(f"/api/lesson/{lid}").json()["steps"] if s["kind"] == "check")
+              for lid in lesson_ids}
+
+    answers = [
+        {"lesson_id": lesson_ids[0], "step_id": checks[lesson_ids[0]]["id"], "user_choice": 1},
+        {"lesson_id": lesson_ids[1], "step_id": checks[lesson_ids[1]]["id"], "user_choice": 0},
+        {"lesson_id": lesson_ids[0], "step_id": "stp_missing", "user_choice": 1},
+        {"lesson_id": "lsn_missing", "step_id": "stp_missing", "user_choice": 1},
+        {"lesson_id": lesson_ids[0], "step_id": checks[lesson_ids[0]]["id"], "user_choice": 2},
+    ]
+    results = client.post("/api/answers/batch", json={"answers": answers}).json()["results"]
+
+    assert [r["result"]["ok"] if r["result"] else None for r in results] == [True, False, None, None, False]
+    assert results[2]["error"] == {"status": 404, "detail": "Step not found"}
+    assert results[3]["error"] == {"status": 404, "detail": "Lesson not found"}
+    assert LOG.flush(timeout=5)
+    logged = [json.loads(line) for line in answers_log(lesson_ids[0]).read_text().splitlines()]
+    assert [e["submission"]["user_choice"] for e in logged] == [1, 2]
+    assert "lesson_id" not in logged[0]["submission"]
+    assert client.get(f"/api/lesson/{lesson_ids[0]}/stats").json()["attempts"] == 2
+
+
+def test_text_sources_are_searchable():
+    text = "Photosynthesis happens in chloroplasts.\nLeaves capture sunlight.\n" + "Unrelated padding line.\n" * 20
+    lesson_id = client.post("/api/lesson", json={"type": "text", "value": text}).json()["id"]
+
+    results = client.get(f"/api/lesson/{lesson_id}/context", params={"q": "chloroplasts", "k": 1}).json()["results"]
+    assert results[0]["anchor"] == "source.txt#L1-L8"
+    assert "chloroplasts" in results[0]["text"]
+    assert client.get("/api/sources/search", params={"q": "photosynthesis"}).json()["results"]
+    assert client.get("/api/lesson/lsn_missing/context", params={"q": "x"}).status_code == 404
+
+
+def test_answers_schedule_reviews_per_learner():
+    lesson_id = client.post("/api/lesson", json={"type": "text", "value": "review"}).json()["id"]
+    step = next(s for s in client.get(f"/api/lesson/{lesson_id}").json()["steps"] if s["kind"] == "check")
+    learner = f"learner-{lesson_id}"
+
+    client.post(f"/api/lesson/{lesson_id}/answer",
+                json={"step_id": step["id"], "user_choice": 0, "learner_id": learner})
+    assert client.get(f"/api/learner/{learner}/due").json()["due"] == []
+
+    due = client.get(f"/api/learner/{learner}/due", params={"within": 2 * 86400}).json()["due"]
+    assert [(d["lesson_id"], d["step_id"], d["lapses"]) for d in due] == [(lesson_id, step["id"], 1)]
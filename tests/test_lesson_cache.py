@@ -0,0 +1,38 @@
+from services.lesson.cache import LessonResponseCache, etag_matches
+
+
+def test_etag_matching():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches(None, '"a"')
+    assert not etag_matches('"c"', '"a"')
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = LessonResponseCache(max_entries=2, max_bytes=10_000)
+    for lesson_id in ["a", "b", "c"]:
+        cache.put(lesson_id, {"id": lesson_id}, cache.generation())
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    assert cache.stats["evictions"] == 1
+
+    small = LessonResponseCache(max_entries=10, max_bytes=40)
+    small.put("x", {"pad": "x" * 20}, small.generation())
+    small.put("y", {"pad": "y" * 20}, small.generation())
+    assert small.snapshot()["entries"] == 1
+    assert small.snapshot()["bytes"] <= 40
+
+
+def test_fill_racing_an_invalidation_is_not_cached():
+    cache = LessonResponseCache()
+    generation = cache.generation()
+    cache.invalidate("a")  # a write lands while the read was in flight
+    entry = cache.put("a", {"v": 1}, generation)
+    assert entry.body == b'{"v":1}'
+    assert cache.get("a") is None
+
+    cache.put("a", {"v": 2}, cache.generation())
+    etag = cache.get("a").etag
+    cache.invalidate("a")
+    cache.put("a", {"v": 3}, cache.generation())
+    assert cache.get("a").etag != etag
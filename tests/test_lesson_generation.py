@@ -0,0 +1,70 @@
+import asyncio
+
+from services.lesson.generation import GenerationCache, source_key
+
+
+def test_source_key_normalizes_and_tracks_version():
+    """Tests that equivalent sources share a key and a new generator version does not."""
+    assert source_key("url", "HTTPS://Example.com/post/#intro") == source_key(" URL ", "https://example.com/post")
+    assert source_key("text", "a\r\nb  ") == source_key("text", "a\nb")
+    assert source_key("text", "a") != source_key("file", "a")
+    assert source_key("text", "a", version="v1") != source_key("text", "a", version="v2")
+
+
+def test_concurrent_misses_generate_once_and_persist(tmp_path):
+    """Tests single-flight generation, copy-on-read, disk persistence and invalidation."""
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"title": "t", "steps": [{"kind": "check", "payload": {"answer": 1}}]}
+
+    cache = GenerationCache(tmp_path)
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_generate("k", generate) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(r == results[0] for r in results)
+    results[0]["steps"][0]["payload"]["answer"] = 2
+    assert asyncio.run(cache.get_or_generate("k", generate))["steps"][0]["payload"]["answer"] == 1
+    assert cache.snapshot()["coalesced"] == 4
+
+    restarted = GenerationCache(tmp_path)
+    assert asyncio.run(restarted.get_or_generate("k", generate))["title"] == "t"
+    assert restarted.snapshot()["disk_hits"] == 1
+    assert len(calls) == 1
+
+    assert asyncio.run(restarted.invalidate("k")) == 1
+    asyncio.run(restarted.get_or_generate("k", generate))
+    assert len(calls) == 2
+    assert asyncio.run(restarted.invalidate()) == 1
+
+
+def test_cancelled_leader_hands_generation_to_a_waiter(tmp_path):
+    """Tests that cancelling the generating request leaves its waiters served, not cancelled."""
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"title": f"t{len(calls)}", "steps": []}
+
+    cache = GenerationCache(tmp_path)
+
+    async def run():
+        leader = asyncio.create_task(cache.get_or_generate("k", generate))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get_or_generate("k", generate)) for _ in range(3)]
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        return leader, results
+
+    leader, results = asyncio.run(run())
+    assert leader.cancelled()
+    assert [r["title"] for r in results] == ["t2"] * 3
+    assert len(calls) == 2
+    assert cache.snapshot()["coalesced"] == 2
@@ -0,0 +1,84 @@
+import json
+import threading
+
+import pytest
+
+from services.lesson.logwriter import GroupCommitLog, LogCommitError, log_segments
+
+
+def read_all(path):
+    return [json.loads(line) for seg in log_segments(path) for line in seg.read_text().splitlines()]
+
+
+def test_appends_from_many_threads_are_group_committed(tmp_path):
+    """Tests that concurrent appends land intact with far fewer writes than records."""
+    log = GroupCommitLog(durability="group")
+    paths = [tmp_path / f"lsn_{i}" / "answers.log.jsonl" for i in range(4)]
+
+    def worker(n):
+        for j in range(250):
+            log.append(paths[j % 4], {"worker": n, "j": j})
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert log.flush(timeout=10)
+
+    assert sum(len(read_all(p)) for p in paths) == 2000
+    stats = log.snapshot()
+    assert stats["appends"] == 2000
+    assert stats["writes"] < 2000
+    assert stats["fsyncs"] >= 1
+    assert stats["errors"] == 0
+
+
+def test_rotation_keeps_every_record_in_order(tmp_path):
+    """Tests that files rotate past the size limit and segments replay in write order."""
+    log = GroupCommitLog(durability="none", rotate_bytes=200)
+    path = tmp_path / "answers.log.jsonl"
+    for i in range(30):
+        log.append(path, {"i": i, "pad": "x" * 20})
+        log.flush()
+
+    assert len(log_segments(path)) > 1
+    assert [r["i"] for r in read_all(path)] == list(range(30))
+    assert log.snapshot()["rotations"] >= 1
+    assert log.snapshot()["fsyncs"] == 0
+
+
+def test_unknown_durability_policy_is_rejected():
+    """Tests that typos in the durability policy fail fast."""
+    with pytest.raises(ValueError):
+        GroupCommitLog(durability="sometimes")
+
+
+def test_rotation_continues_after_existing_segments(tmp_path):
+    """Tests that rotation numbers past segments left by an earlier process instead of overwriting them."""
+    path = tmp_path / "answers.log.jsonl"
+    old = path.with_name("answers.log.0000000007.jsonl")
+    old.write_text(json.dumps({"i": -1}) + "\n")
+
+    log = GroupCommitLog(durability="none", rotate_bytes=50)
+    for i in range(4):
+        log.append(path, {"i": i, "pad": "x" * 20})
+        log.flush()
+
+    names = [p.name for p in log_segments(path)]
+    assert names[:3] == ["answers.log.0000000007.jsonl", "answers.log.0000000008.jsonl", "answers.log.0000000009.jsonl"]
+    assert [r["i"] for r in read_all(path)] == [-1, 0, 1, 2, 3]
+
+
+def test_failed_commit_is_raised_from_flush(tmp_path):
+    """Tests that a failed group commit reaches the next flush instead of vanishing."""
+    (tmp_path / "blocker").write_text("")
+    log = GroupCommitLog(durability="none")
+    log.append(tmp_path / "blocker" / "answers.log.jsonl", {"i": 0})
+
+    with pytest.raises(LogCommitError):
+        log.flush(timeout=5)
+    assert log.snapshot()["errors"] == 1
+
+    log.append(tmp_path / "answers.log.jsonl", {"i": 1})
+    assert log.flush(timeout=5)
@@ -0,0 +1,129 @@
+from services.lesson import retrieval
+from services.lesson.retrieval import PassageIndex, chunk_lines
+
+FRUIT = "\n".join([
+    "An apple is a sweet, edible fruit produced by an apple tree.",
+    "Apple trees are cultivated worldwide.",
+    "",
+    "Carrots are root vegetables, usually orange in colour.",
+    "Broccoli is an edible green plant in the cabbage family.",
+    "The apple tree originated in Central Asia.",
+])
+RIVERS = "\n".join(f"Line {i} about rivers, deltas and sediment transport." for i in range(1, 31))
+
+
+def build(index):
+    index.add("fruit", FRUIT)
+    index.add("rivers", RIVERS, name="rivers.md")
+
+
+def test_chunks_carry_line_anchors():
+    """Tests overlapping windows with 1-based inclusive line ranges, skipping blank windows."""
+    chunks = list(chunk_lines(RIVERS, lines=8, overlap=2))
+    assert [(a, b) for a, b, _ in chunks] == [(1, 8), (7, 14), (13, 20), (19, 26), (25, 30)]
+    assert chunks[0][2].splitlines()[0].startswith("Line 1 ")
+    assert list(chunk_lines("\n\n\n", lines=2, overlap=0)) == []
+
+
+def test_bm25_ranks_and_filters():
+    """Tests that the best passage wins and that results can be limited to one document."""
+    index = PassageIndex(commit_passages=10**9)
+    index.add("a", "apple apple apple orchard\n" + "filler words here\n" * 10)
+    index.add("b", "one apple among many other unrelated words about weather and trains")
+    index.add("c", "nothing relevant")
+
+    results = index.search("apple orchard", k=2)
+    assert [r["doc"] for r in results] == ["a", "b"]
+    assert results[0]["anchor"] == "source.txt#L1-L8"
+    assert results[0]["score"] > results[1]["score"] > 0
+    assert [r["doc"] for r in index.search("apple", k=5, doc="b")] == ["b"]
+    assert index.search("the of", k=5) == []
+    assert index.add("a", "again") == 0
+
+
+def test_committed_segments_reopen_and_compact(tmp_path):
+    """Tests that mmap'd segments answer exactly like the in-memory index, across reopen and compaction."""
+    memory = PassageIndex()
+    build(memory)
+    expected = memory.search("apple tree", k=3)
+
+    disk = PassageIndex(tmp_path)
+    disk.add("fruit", FRUIT)
+    disk.commit()
+    disk.add("rivers", RIVERS, name="rivers.md")
+    disk.close()
+
+    reopened = PassageIndex(tmp_path)
+    assert reopened.snapshot()["segments"] == 2
+    assert "fruit" in reopened and "rivers" in reopened
+    assert reopened.search("apple tree", k=3) == expected
+    assert reopened.search("sediment", k=1)[0]["anchor"].startswith("rivers.md#L")
+
+    reopened.compact()
+    assert reopened.snapshot()["segments"] == 1
+    assert len(list(tmp_path.glob("*.seg"))) == 1
+    assert reopened.search("apple tree", k=3) == expected
+    reopened.close()
+
+
+def test_doc_filter_scores_only_that_documents_postings(tmp_path):
+    """Tests that a doc-filtered search matches filtering the full ranking, in memory and on disk."""
+    docs = {f"d{i}": "\n".join(f"apple line {j} of doc {i} " + "pear " * (i % 3) for j in range(12)) for i in range(6)}
+    memory = PassageIndex()
+    disk = PassageIndex(tmp_path)
+    for name, text in docs.items():
+        memory.add(name, text)
+        disk.add(name, text)
+        if name == "d2":
+            disk.commit()
+    for index in (memory, disk):
+        everything = index.search("apple pear", k=100)
+        for name in docs:
+            assert index.search("apple pear", k=2, doc=name) == [r for r in everything if r["doc"] == name][:2]
+        assert index.search("apple", k=2, doc="missing") == []
+    disk.close()
+
+
+def test_pending_passages_commit_on_age_and_segments_merge(tmp_path):
+    """Tests the time-based commit trigger and that segment count stays bounded."""
+    index = PassageIndex(tmp_path, commit_seconds=3600, max_segments=2)
+    index.add("fruit", FRUIT)
+    assert not index.commit_if_due()
+    index.commit_seconds = 0
+    assert index.commit_if_due()
+    reopened = PassageIndex(tmp_path)
+    assert reopened.search("apple", k=1)[0]["doc"] == "fruit"
+    reopened.close()
+
+    for i in range(3):
+        index.add(f"rivers{i}", RIVERS)  # due immediately, so each add commits
+    assert index.snapshot()["pending"] == 0
+    assert index.snapshot()["segments"] <= 2
+    assert {r["doc"] for r in index.search("sediment", k=20)} == {"rivers0", "rivers1", "rivers2"}
+    index.close()
+
+
+def test_reopening_reads_no_passages_and_ignores_stray_files(tmp_path, monkeypatch):
+    """Tests that doc ranges come from the segment's doc table and foreign *.seg files are skipped."""
+    index = PassageIndex(tmp_path)
+    index.add("fruit", FRUIT)
+    index.commit()
+    index.add("rivers", RIVERS, name="rivers.md")
+    index.close()
+    (tmp_path / "notes.seg").write_bytes(b"not a segment")
+
+    def no_parsing(*args):
+        raise AssertionError("passage decoded while reopening")
+
+    with monkeypatch.context() as m:
+        m.setattr(retrieval._DiskSegment, "passage", no_parsing)
+        m.setattr(retrieval._DiskSegment, "length", no_parsing)
+        reopened = PassageIndex(tmp_path)
+        assert "fruit" in reopened and "rivers" in reopened and "missing" not in reopened
+        assert reopened.snapshot()["documents"] == 2
+
+    assert reopened.search("sediment", k=1, doc="rivers")[0]["doc"] == "rivers"
+    reopened.add("more", RIVERS)
+    reopened.commit()
+    assert sorted(p.name for p in tmp_path.glob("*.seg")) == ["000000.seg", "000001.seg", "000002.seg", "notes.seg"]
+    reopened.close()
@@ -0,0 +1,46 @@
+from services.lesson.review import DAY, Review, ReviewScheduler, ReviewState, quality, sm2
+
+
+def test_sm2_intervals_grow_and_lapses_reset():
+    """Tests the 1, 6, interval*ease progression and the reset after a failed recall."""
+    state = ReviewState()
+    intervals = []
+    for _ in range(4):
+        state = sm2(state, 4, now=0.0)
+        intervals.append(state.interval)
+    assert intervals == [1.0, 6.0, 15.0, 37.5]  # grade 4 leaves the ease at 2.5
+    assert state.due == intervals[3] * DAY
+
+    lapsed = sm2(state, quality(False), now=100.0)
+    assert (lapsed.reps, lapsed.interval, lapsed.lapses) == (0, 1.0, 1)
+    assert lapsed.ease < state.ease
+    assert sm2(ReviewState(ease=1.3), 0, now=0.0).ease == 1.3
+
+
+def test_quality_uses_confidence():
+    assert quality(True, 0.9) == 5
+    assert quality(True) == 4
+    assert quality(True, 0.2) == 3
+    assert quality(False, 0.9) == 0
+    assert quality(False) == 1
+
+
+def test_due_returns_most_overdue_first(tmp_path):
+    """Tests that only due steps come back, ordered by due date, limited, per learner."""
+    scheduler = ReviewScheduler(tmp_path / "reviews.db")
+    scheduler.record_many([
+        Review("u1", "lsn_1", "stp_a", ok=True, at=0.0),                 # due after 1 day
+        Review("u1", "lsn_1", "stp_b", ok=False, at=-DAY / 2),           # due after half a day
+        Review("u1", "lsn_2", "stp_c", ok=True, at=0.0),
+        Review("u1", "lsn_2", "stp_c", ok=True, at=DAY),                 # second pass: due at day 7
+        Review("u2", "lsn_1", "stp_a", ok=True, at=0.0),
+    ])
+
+    due = scheduler.due("u1", limit=10, now=2 * DAY)
+    assert [d["step_id"] for d in due] == ["stp_b", "stp_a"]
+    assert due[0]["lapses"] == 1
+    assert [d["step_id"] for d in scheduler.due("u1", limit=1, now=10 * DAY)] == ["stp_b"]
+    assert len(scheduler.due("u1", limit=10, now=10 * DAY)) == 3
+    assert scheduler.due("u3", now=10 * DAY) == []
+    assert scheduler.stats["reviews"] == 5
+    scheduler.close()
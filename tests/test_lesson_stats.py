@@ -0,0 +1,103 @@
+import json
+import threading
+
+from services.lesson.logwriter import GroupCommitLog
+from services.lesson.stats import StatsIndex, main, read_answers, replay
+
+
+def answer(step_id, choice, ok, confidence=None, slop=None):
+    metrics = None
+    if confidence is not None or slop is not None:
+        metrics = {"confidence": confidence, "slop": slop or {}}
+    return {
+        "submission": {"step_id": step_id, "user_choice": choice, "free_text": None, "metrics": metrics},
+        "result": {"ok": ok, "correct_choice": 1, "score": float(ok), "explain": "", "safety": {}},
+    }
+
+
+ANSWERS = [
+    answer("stp_a", 1, True, confidence=0.9),
+    answer("stp_a", 0, False, confidence=0.85, slop={"emdash": 2}),
+    answer("stp_a", 1, True, confidence=0.4),
+    answer("stp_b", 2, False),
+]
+
+
+def test_aggregates_per_step():
+    """Tests attempts, correct rate, histogram, confidence and slop per step."""
+    stats = replay(ANSWERS).as_dict()
+
+    assert stats["attempts"] == 4
+    assert stats["correct"] == 2
+    a = stats["steps"]["stp_a"]
+    assert a["attempts"] == 3
+    assert a["correct_rate"] == 2 / 3
+    assert a["choices"] == {"0": 1, "1": 2}
+    assert abs(a["mean_confidence"] - (0.9 + 0.85 + 0.4) / 3) < 1e-9
+    assert a["overconfident"] == 1
+    assert a["slop"]["emdash"] == 2
+    assert a["slop_rate"] == 1 / 3
+    assert stats["steps"]["stp_b"]["mean_confidence"] is None
+
+
+def test_index_loads_once_then_updates_incrementally():
+    """Tests that the log is replayed on first touch only and live answers add on top."""
+    index = StatsIndex()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return ANSWERS[:2]
+
+    index.ensure("lsn_1", loader)
+    index.ensure("lsn_1", loader)
+    index.record("lsn_1", **{k: v for k, v in zip(("submission", "result"), ANSWERS[2].values())})
+
+    assert calls == [1]
+    assert "lsn_1" in index
+    assert index.get("lsn_1")["steps"]["stp_a"]["attempts"] == 3
+    assert index.get("lsn_2") is None
+
+
+def test_slow_replay_does_not_block_other_lessons():
+    """Tests that record/get on a loaded lesson proceed while another lesson's log is being replayed."""
+    index = StatsIndex()
+    index.ensure("lsn_hot", lambda: ANSWERS[:1])
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def slow_loader():
+        loads.append(1)
+        started.set()
+        release.wait(5)
+        return ANSWERS
+
+    cold = [threading.Thread(target=index.ensure, args=("lsn_cold", slow_loader)) for _ in range(2)]
+    for t in cold:
+        t.start()
+    assert started.wait(5)
+    index.record("lsn_hot", **{k: v for k, v in zip(("submission", "result"), ANSWERS[1].values())})
+    assert index.get("lsn_hot")["attempts"] == 2
+    assert "lsn_cold" not in index
+    release.set()
+    for t in cold:
+        t.join(5)
+
+    assert loads == [1]
+    assert index.get("lsn_cold")["attempts"] == 4
+
+
+def test_rebuild_replays_rotated_logs(tmp_path, capsys):
+    """Tests that the rebuild command covers every rotated segment and matches live aggregates."""
+    log = GroupCommitLog(durability="none", rotate_bytes=300)
+    path = tmp_path / "lsn_1" / "answers.log.jsonl"
+    for entry in ANSWERS:
+        log.append(path, entry)
+        log.flush()
+    with path.open("a") as f:
+        f.write('{"torn": \n')
+
+    assert len(list(read_answers(path))) == len(ANSWERS)
+    main(["--lessons-dir", str(tmp_path)])
+    out = json.loads(capsys.readouterr().out)
+    assert out == {"lsn_1": replay(ANSWERS).as_dict()}
@@ -0,0 +1,104 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from services.lesson.migrate import migrate
+from services.lesson.storage import FilesystemLessonStore, SQLiteLessonStore, open_store
+
+
+def lesson(lesson_id, step_ids):
+    return {"id": lesson_id, "source": {"type": "text", "value": "x"}, "title": "t",
+            "state": "practice", "steps": step_ids, "created_at": "2024-01-01T00:00:00Z"}
+
+
+def step(step_id, lesson_id):
+    return {"id": step_id, "lesson_id": lesson_id, "kind": "check", "payload": {"answer": 1}}
+
+
+@pytest.fixture(params=["fs", "sqlite"])
+def store(request, tmp_path):
+    s = open_store(request.param, tmp_path)
+    yield s
+    s.close()
+
+
+def test_roundtrip_and_missing(store):
+    """Tests that both backends save and load lessons and steps, and report misses as None."""
+    asyncio.run(store.save(lesson("lsn_1", ["stp_b", "stp_a"]), [step("stp_b", "lsn_1"), step("stp_a", "lsn_1")]))
+
+    found = asyncio.run(store.lesson_with_steps("lsn_1"))
+    assert found[0]["steps"] == ["stp_b", "stp_a"]
+    assert [s["id"] for s in found[1]] == ["stp_b", "stp_a"]
+    assert asyncio.run(store.step("lsn_1", "stp_a"))["payload"] == {"answer": 1}
+    assert asyncio.run(store.step("lsn_1", "stp_zzz")) is None
+    assert asyncio.run(store.lesson("lsn_missing")) is None
+    assert asyncio.run(store.lesson_with_steps("lsn_missing")) is None
+
+
+def test_sqlite_uses_wal(tmp_path):
+    """Tests that the SQLite backend runs in WAL mode."""
+    store = SQLiteLessonStore(tmp_path / "l.db")
+    store.write_lesson_with_steps(lesson("lsn_1", ["stp_a"]), [step("stp_a", "lsn_1")])
+    mode = sqlite3.connect(tmp_path / "l.db").execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+    store.close()
+
+
+def test_migrate_filesystem_tree_to_sqlite(tmp_path):
+    """Tests that the migration copies every lesson and step and verifies the copy."""
+    fs = FilesystemLessonStore(tmp_path / "lessons")
+    for i in range(3):
+        fs.write_lesson_with_steps(lesson(f"lsn_{i}", [f"stp_{i}a", f"stp_{i}b"]),
+                                   [step(f"stp_{i}a", f"lsn_{i}"), step(f"stp_{i}b", f"lsn_{i}")])
+    (tmp_path / "lessons" / "moderation_queue.log.jsonl").write_text("{}\n")
+
+    db = SQLiteLessonStore(tmp_path / "lessons.db")
+    stats = migrate(fs, db, verify=True)
+    assert stats == {"lessons": 3, "steps": 6, "mismatched": 0, "invalid": 0}
+    assert sorted(db.lesson_ids()) == ["lsn_0", "lsn_1", "lsn_2"]
+
+    # Idempotent
+    assert migrate(fs, db)["lessons"] == 3
+    db.close()
+
+
+def test_bulk_write_and_paged_export(store):
+    """Tests that a batch lands in full and export pages through every lesson with ordered steps."""
+    bundles = [(lesson(f"lsn_{i:02d}", [f"stp_{i}b", f"stp_{i}a"]), [step(f"stp_{i}a", f"lsn_{i:02d}"), step(f"stp_{i}b", f"lsn_{i:02d}")])
+               for i in range(25)]
+    asyncio.run(store.save_many(bundles))
+
+    pages = list(store.export_pages(page_size=10))
+    assert [len(p) for p in pages] == [10, 10, 5]
+
+    async def collect():
+        return [bundle async for bundle in store.export(page_size=7)]
+
+    exported = asyncio.run(collect())
+    assert sorted(l["id"] for l, _ in exported) == [f"lsn_{i:02d}" for i in range(25)]
+    assert all([s["id"] for s in steps] == l["steps"] for l, steps in exported)
+
+
+def test_steps_by_id_loads_each_step_once(store):
+    """Tests batched step lookup, including misses and steps asked for under the wrong lesson."""
+    store.write_lesson_with_steps(lesson("lsn_1", ["stp_a", "stp_b"]), [step("stp_a", "lsn_1"), step("stp_b", "lsn_1")])
+
+    found = asyncio.run(store.steps_by_id([("lsn_1", "stp_a"), ("lsn_1", "stp_b"), ("lsn_1", "stp_a"),
+                                           ("lsn_2", "stp_a"), ("lsn_1", "stp_zzz")]))
+    assert len(found) == 4
+    assert found[("lsn_1", "stp_b")]["id"] == "stp_b"
+    assert found[("lsn_2", "stp_a")] is None
+    assert found[("lsn_1", "stp_zzz")] is None
+
+
+def test_migrate_can_skip_lessons_failing_the_schemas(tmp_path):
+    """Tests that --validate keeps schema-violating lessons out of the destination."""
+    fs = FilesystemLessonStore(tmp_path / "lessons")
+    fs.write_lesson_with_steps(lesson("lsn_ok", ["stp_a"]), [step("stp_a", "lsn_ok")])
+    fs.write_lesson_with_steps(lesson("lsn_bad", ["stp_b"]), [{**step("stp_b", "lsn_bad"), "kind": "quiz"}])
+
+    db = SQLiteLessonStore(tmp_path / "lessons.db")
+    stats = migrate(fs, db, validate=True)
+    assert (stats["lessons"], stats["invalid"]) == (1, 1)
+    assert list(db.lesson_ids()) == ["lsn_ok"]
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from services.audit.merkle import merkle_root, sha256
+from services.audit.merkle_tree import IncrementalMerkleTree, MemoryNodeStore
+
+
+def leaf(i, v=0):
+    return f'{{"player":"p{i:05d}","elo":{v}}}'.encode()
+
+
+def test_matches_full_recompute_for_every_size():
+    """Tests build() against merkle_root, including the empty and odd-width cases."""
+    for n in range(0, 40):
+        leaves = [leaf(i) for i in range(n)]
+        tree = IncrementalMerkleTree(MemoryNodeStore())
+        assert tree.build(leaves) == merkle_root(leaves)
+    assert IncrementalMerkleTree(MemoryNodeStore()).root() == sha256(b'')
+
+
+def test_updates_and_appends_track_merkle_root():
+    """Tests random in-place updates and appends, and that an update rehashes only one path."""
+    rng = random.Random(3)
+    leaves = [leaf(i) for i in range(1000)]
+    tree = IncrementalMerkleTree(MemoryNodeStore())
+    tree.build(leaves)
+
+    for step in range(200):
+        changes = {}
+        for _ in range(rng.randint(1, 5)):
+            pos = rng.randrange(len(leaves))
+            leaves[pos] = changes[pos] = leaf(pos, step)
+        for _ in range(rng.choice([0, 0, 1, 3])):
+            changes[len(leaves)] = leaf(len(leaves))
+            leaves.append(changes[len(leaves)])
+        assert tree.apply(changes, len(leaves)) == merkle_root(leaves)
+
+    before = tree.hashes
+    leaves[17] = leaf(17, -1)
+    assert tree.apply({17: leaves[17]}, len(leaves)) == merkle_root(leaves)
+    assert tree.hashes - before == 1 + (len(leaves) - 1).bit_length()
+
+
+def test_mid_inserts_rehash_the_shifted_suffix():
+    """Tests that an insert expressed as a rewritten suffix still yields the exact root."""
+    leaves = [leaf(i) for i in range(0, 200, 2)]
+    tree = IncrementalMerkleTree(MemoryNodeStore())
+    tree.build(leaves)
+
+    leaves.insert(30, leaf(59))
+    changes = {pos: leaves[pos] for pos in range(30, len(leaves))}
+    assert tree.apply(changes, len(leaves)) == merkle_root(leaves)
+
+
+def test_rejects_shrinking_and_gaps():
+    tree = IncrementalMerkleTree(MemoryNodeStore())
+    tree.build([leaf(i) for i in range(4)])
+    with pytest.raises(ValueError):
+        tree.apply({}, 3)
+    with pytest.raises(ValueError):
+        tree.apply({5: leaf(5)}, 6)
@@ -0,0 +1,131 @@
+import copy
+import json
+import random
+
+import pytest
+import yaml
+
+from services.validation import SCHEMA_FILES, ValidationError, compile_schema, validate_records, validator
+
+jsonschema = pytest.importorskip("jsonschema")
+
+LESSON = {"id": "lsn_abc123", "source": {"type": "url", "value": "https://example.com"}, "title": "t",
+          "state": "practice", "steps": ["stp_1"], "created_at": "2024-01-01T00:00:00Z"}
+STEP = {"id": "stp_abc", "lesson_id": "lsn_abc123", "kind": "check", "payload": {"answer": 1}}
+SYZYGY = yaml.safe_load((SCHEMA_FILES["syzygy_matrix"].parent / "syzygy_matrix.yaml").read_text())
+
+EXTRA = {
+    "type": "object",
+    "definitions": {"node": {"type": "object", "properties": {"children": {"type": "array", "items": {"$ref": "#/definitions/node"}}},
+                             "additionalProperties": False}},
+    "properties": {
+        "tree": {"$ref": "#/definitions/node"},
+        "n": {"type": ["integer", "null"], "minimum": 0, "exclusiveMaximum": 10},
+        "tag": {"anyOf": [{"type": "string", "maxLength": 3}, {"const": 7}]},
+        "one": {"oneOf": [{"type": "integer"}, {"type": "number", "minimum": 5}]},
+        "not_empty": {"not": {"const": ""}},
+        "flag": {"enum": [True, 0, "x"]},
+        "items": {"type": "array", "uniqueItems": True, "minItems": 1},
+    },
+}
+
+
+def mutations(record, rng, n=300):
+    """Random single-point edits: drop a key, retype a value, or swap in a nearby bad value."""
+    values = [None, True, 0, 1, 1.0, 1.5, -3, "", "x", "lsn_ok", "stp_ok", "nope!", [], ["a"], [1], {}, {"a": 1}, 11, 7, "abcd"]
+    for _ in range(n):
+        mutated = copy.deepcopy(record)
+        node = mutated
+        for _ in range(rng.randint(0, 3)):
+            children = list(node.items()) if isinstance(node, dict) else list(enumerate(node)) if isinstance(node, list) else []
+            children = [(k, c) for k, c in children if isinstance(c, (dict, list)) and c]
+            if not children:
+                break
+            node = rng.choice(children)[1]
+        if isinstance(node, dict) and node:
+            key = rng.choice(list(node))
+            if rng.random() < 0.3:
+                del node[key]
+            else:
+                node[key] = rng.choice(values)
+        elif isinstance(node, list) and node:
+            node[rng.randrange(len(node))] = rng.choice(values)
+        yield mutated
+
+
+@pytest.mark.parametrize("schema, record", [
+    (json.loads(SCHEMA_FILES["lesson"].read_text()), LESSON),
+    (json.loads(SCHEMA_FILES["step"].read_text()), STEP),
+    (json.loads(SCHEMA_FILES["syzygy_matrix"].read_text()), SYZYGY),
+    (json.loads(SCHEMA_FILES["noosphere_manifest"].read_text()), {"anything": 1}),
+    (EXTRA, {"tree": {"children": [{"children": []}]}, "n": 3, "tag": "ab", "one": 2, "not_empty": "z",
+             "flag": 0, "items": [1, 2]}),
+])
+def test_compiled_validator_agrees_with_jsonschema(schema, record):
+    """Tests that compiled validators accept and reject exactly what jsonschema does."""
+    compiled = compile_schema(schema)
+    assert hasattr(compiled, "source")
+    reference = jsonschema.Draft7Validator(schema)
+
+    compiled(record)
+    rng = random.Random(1)
+    for mutated in mutations(record, rng):
+        expected = reference.is_valid(mutated)
+        try:
+            compiled(mutated)
+            ok = True
+        except ValidationError:
+            ok = False
+        assert ok == expected, mutated
+
+
+def test_errors_carry_paths_and_batches_report_indexes():
+    """Tests error paths and that batch validation returns every failing index in order."""
+    bad = copy.deepcopy(SYZYGY)
+    agent = next(iter(bad["agents"]))
+    bad["agents"][agent]["inputs"] = ["ok", 5]
+    with pytest.raises(ValidationError) as info:
+        validator("syzygy_matrix")(bad)
+    assert list(info.value.path) == ["agents", agent, "inputs", 1]
+
+    records = [LESSON, {**LESSON, "id": "bad id"}, LESSON, {**LESSON, "state": "gone"}]
+    errors = validate_records("lesson", records)
+    assert [i for i, _ in errors] == [1, 3]
+    assert "does not match" in str(errors[0][1])
+
+
+@pytest.mark.parametrize("step, value, ok", [
+    (0.01, 1e308, False), (0.5, 1e308, True), (0.5, 10**400, True), (0.3, 10**400, False), (3, 10**400 + 1, False),
+    (0.5, float("inf"), False), (2, float("inf"), False), (0.5, float("nan"), False), (0.1, 0.5, True),
+])
+def test_multiple_of_never_raises_past_float_range(step, value, ok):
+    """Tests that multipleOf on huge or infinite numbers is a verdict, not an OverflowError."""
+    validate = compile_schema({"type": "number", "multipleOf": step})
+    if ok:
+        validate(value)
+    else:
+        with pytest.raises(ValidationError):
+            validate(value)
+
+
+def test_unsupported_keywords_fall_back_to_jsonschema():
+    validate = compile_schema({"type": "object", "dependencies": {"a": ["b"]}})
+    assert not hasattr(validate, "source")
+    validate({"a": 1, "b": 2})
+    with pytest.raises(ValidationError):
+        validate({"a": 1})
+
+
+def test_write_manifest_still_raises_jsonschema_errors(tmp_path):
+    """Tests that compiled manifest validation keeps raising jsonschema.ValidationError for callers."""
+    from datasets.noosphere.ingest import write_manifest
+
+    schema_fp = tmp_path / "schema.json"
+    schema_fp.write_text(json.dumps({"type": "object", "properties": {"snapshot": {"type": "object", "required": ["id"]}}}))
+    with pytest.raises(jsonschema.ValidationError) as info:
+        write_manifest({"snapshot": {}}, tmp_path / "manifest.json", schema_fp)
+    assert list(info.value.path) == ["snapshot"]
+    assert not (tmp_path / "manifest.json").exists()
+
+    write_manifest({"snapshot": {"id": "s1"}}, tmp_path / "manifest.json", schema_fp)
+    assert json.loads((tmp_path / "manifest.json").read_text()) == {"snapshot": {"id": "s1"}}
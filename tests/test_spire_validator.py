@@ -0,0 +1,162 @@
+import json
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jwt.algorithms import RSAAlgorithm
+
+from services.auth import spire_validator
+from services.auth.spire_validator import SPIREValidator, get_validator
+from tests import mock_jwks_server
+
+AUD = "dreamaware-video-gen"
+BUNDLE_URL = "http://jwks/.well-known/jwks.json"
+
+
+def make_key(kid: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    public_jwk.update({"kid": kid, "alg": "RS256", "use": "sig"})
+    return private_key, public_jwk
+
+
+def sign(private_key, kid: str, **claims) -> str:
+    claims.setdefault("sub", "spiffe://test.org/service")
+    claims.setdefault("aud", AUD)
+    claims.setdefault("exp", int(time.time()) + 60)
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+class Bundle(httpx.ASGITransport):
+    """Mounts tests/mock_jwks_server.py in-process, counting JWKS fetches."""
+
+    def __init__(self):
+        super().__init__(app=mock_jwks_server.app)
+        self.fetches = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/.well-known/jwks.json":
+            self.fetches += 1
+        return await super().handle_async_request(request)
+
+
+async def served_key(bundle: Bundle):
+    """The mock server's signing key, fetched from its /private-key helper."""
+    async with httpx.AsyncClient(transport=bundle, base_url="http://jwks") as client:
+        r = await client.get("/private-key")
+    return RSAAlgorithm.from_jwk(r.text)
+
+
+@pytest.fixture
+def bundle(monkeypatch):
+    monkeypatch.setitem(mock_jwks_server.jwks, "keys", list(mock_jwks_server.jwks["keys"]))
+    return Bundle()
+
+
+@pytest.mark.asyncio
+async def test_repeat_tokens_hit_the_cache(bundle):
+    private_key = await served_key(bundle)
+    v = SPIREValidator(bundle_url=BUNDLE_URL, aud=AUD, transport=bundle)
+
+    token = sign(private_key, "test-key-1")
+    for _ in range(5):
+        payload = await v.verify_svid(token)
+        assert payload["sub"] == "spiffe://test.org/service"
+
+    other = sign(private_key, "test-key-1", sub="spiffe://test.org/other")
+    assert (await v.verify_svid(other))["sub"] == "spiffe://test.org/other"
+
+    assert bundle.fetches == 1
+    assert v.stats["token_hits"] == 4
+    assert v.stats["token_misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_rejects_unknown_kid_and_wrong_audience(bundle):
+    private_key = await served_key(bundle)
+    v = SPIREValidator(bundle_url=BUNDLE_URL, aud=AUD, transport=bundle)
+
+    with pytest.raises(HTTPException) as exc:
+        await v.verify_svid(sign(private_key, "missing-kid"))
+    assert exc.value.status_code == 401
+    assert "Unknown SVID key id" in exc.value.detail
+
+    with pytest.raises(HTTPException) as exc:
+        await v.verify_svid(sign(private_key, "test-key-1", aud="someone-else"))
+    assert exc.value.status_code == 401
+    assert "Invalid SVID" in exc.value.detail
+
+
+@pytest.mark.asyncio
+async def test_expired_cache_entries_are_reverified(bundle, monkeypatch):
+    private_key = await served_key(bundle)
+    v = SPIREValidator(bundle_url=BUNDLE_URL, aud=AUD, transport=bundle)
+    now = time.time()
+    token = sign(private_key, "test-key-1", exp=int(now) + 30)
+    await v.verify_svid(token)
+
+    await v.verify_svid(token)
+    assert v.stats["token_hits"] == 1
+
+    monkeypatch.setattr(spire_validator.time, "time", lambda: now + 31)
+    await v.verify_svid(token)
+    assert v.stats["token_hits"] == 1
+    assert v.stats["token_misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_token_cache_is_bounded(bundle):
+    private_key = await served_key(bundle)
+    v = SPIREValidator(bundle_url=BUNDLE_URL, aud=AUD, token_cache_size=2, transport=bundle)
+    tokens = [sign(private_key, "test-key-1", sub=f"spiffe://test.org/s{i}") for i in range(3)]
+    for t in tokens:
+        await v.verify_svid(t)
+    assert list(v._tokens) == tokens[1:]
+
+
+@pytest.mark.asyncio
+async def test_rotation_picks_up_new_kid_and_drops_retired_tokens(bundle):
+    private_key = await served_key(bundle)
+    new_private, new_jwk = make_key("test-key-2")
+    v = SPIREValidator(bundle_url=BUNDLE_URL, aud=AUD, unknown_kid_cooldown=0, transport=bundle)
+
+    old_token = sign(private_key, "test-key-1")
+    await v.verify_svid(old_token)
+
+    mock_jwks_server.jwks["keys"] = [new_jwk]
+    assert (await v.verify_svid(sign(new_private, "test-key-2")))["sub"]
+    assert bundle.fetches == 2
+    assert old_token not in v._tokens
+
+
+@pytest.mark.asyncio
+async def test_stale_bundle_refreshes_in_background(bundle):
+    private_key = await served_key(bundle)
+    v = SPIREValidator(bundle_url=BUNDLE_URL, aud=AUD, refresh_interval=1, transport=bundle)
+    await v.verify_svid(sign(private_key, "test-key-1", sub="a"))
+
+    v._ts -= 5
+    assert (await v.verify_svid(sign(private_key, "test-key-1", sub="b")))["sub"] == "b"
+    await v._inflight
+    assert bundle.fetches == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_payloads_are_copies(bundle):
+    private_key = await served_key(bundle)
+    v = SPIREValidator(bundle_url=BUNDLE_URL, aud=AUD, transport=bundle)
+    token = sign(private_key, "test-key-1")
+
+    (await v.verify_svid(token))["sub"] = "spiffe://test.org/attacker"
+    hit = await v.verify_svid(token)
+    assert hit["sub"] == "spiffe://test.org/service"
+    hit["sub"] = "spiffe://test.org/attacker"
+    assert (await v.verify_svid(token))["sub"] == "spiffe://test.org/service"
+
+
+def test_get_validator_is_a_singleton(monkeypatch):
+    monkeypatch.setattr(spire_validator, "_validator", None)
+    assert get_validator() is get_validator()